@@ -5,29 +5,39 @@ import schedule
 
 import const
 import weibo
+from util import metrics
 from util.notify import push_deer
 
 
-def main(schedule_interval):
+def run_once(metrics_file=None):
+    """执行一次爬取，指定了metrics_file时把累计的指标写入该文件"""
+    weibo.main()
+    if metrics_file:
+        metrics.REGISTRY.write(metrics_file)
+        weibo.logger.info('指标已写入%s', metrics_file)
+
+
+def main(schedule_interval, metrics_file=None):
     """
     主函数，用于设置定时任务和执行微博爬虫脚本。
 
     Parameters:
         schedule_interval (int): 循环间隔，以分钟为单位。
+        metrics_file (str): 每次爬取后写入Prometheus文本格式指标的文件，可以不填。
 
     Returns:
         None
     """
-    schedule.every(schedule_interval).minutes.do(weibo.main)  # 每隔指定的时间间隔执行一次main函数
+    job = schedule.every(schedule_interval).minutes.do(run_once, metrics_file)  # 每隔指定的时间间隔执行一次
     weibo.logger.info('循环间隔设置为%d分钟', schedule_interval)
 
-    weibo.main()  # 立即执行一次
+    run_once(metrics_file)  # 立即执行一次
     while True:
         try:
             schedule.run_pending()
             sleep(1)
         except KeyboardInterrupt:
-            schedule.cancel_job(weibo.main)
+            schedule.cancel_job(job)
             break
         except Exception as error:
             if const.NOTIFY["NOTIFY"]:
@@ -37,6 +47,7 @@ def main(schedule_interval):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('schedule_interval', type=int, help='循环间隔（分钟）')
+    parser.add_argument('--metrics-file', help='每次爬取后把指标写入该文件，可供node_exporter的textfile收集器读取')
     args = parser.parse_args()
 
-    main(args.schedule_interval)
+    main(args.schedule_interval, args.metrics_file)
@@ -0,0 +1,306 @@
+"""模拟m.weibo.cn的本地HTTP服务器，用于压力测试和长时间运行测试
+
+实现了weibo.py访问的接口：getIndex（用户信息、微博列表和搜索）、/detail/<id>、
+评论的hotflow和show、repostTimeline，以及图片和视频地址。用户和微博由
+benchmark.synthetic按id确定性地生成，任意用户id都存在。可以模拟限流（返回418）、
+验证码和较慢的图片视频下载。
+
+    python -m benchmark.fake_server --port 8000 --users 10000 --user-list users.txt
+    python -m benchmark.fake_server --throttle-rate 5 --captcha-rate 0.001 --media-bandwidth 1048576
+
+然后在config.json中设置"api_base": "http://127.0.0.1:8000"，
+"user_id_list": "users.txt"。访问/__stats查看按接口和状态码统计的请求数。
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmark import synthetic  # noqa: E402
+
+FIRST_USER_ID = 1000000000
+WEIBO_ID_BASE = 4900000000000000
+RETWEET_ID_OFFSET = 3000000000000000
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+MEDIA_CHUNK_SIZE = 16 * 1024
+
+
+class FakeWeibo:
+    """按请求生成响应数据，并模拟限流和验证码
+
+    posts为每个用户的微博数，为None时每个用户20~200条不等。
+    throttle_rate为接口每秒允许的请求数，超过时返回418，为0时不限流。
+    captcha_rate为接口请求返回验证码的概率。
+    """
+
+    def __init__(self, base_url, posts=None, comments=20, reposts=20, throttle_rate=0,
+                 captcha_rate=0, image_size=64 * 1024, video_size=1024 * 1024, seed=2024):
+        self.base_url = base_url.rstrip("/")
+        self.posts = posts
+        self.comments = comments
+        self.reposts = reposts
+        self.throttle_rate = throttle_rate
+        self.captcha_rate = captcha_rate
+        self.image_size = image_size
+        self.video_size = video_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = throttle_rate
+        self._updated_at = time.monotonic()
+        self._media = bytes(range(256)) * (max(image_size, video_size) // 256 + 1)
+        self.stats = Counter()
+
+    def record(self, endpoint, status):
+        with self._lock:
+            self.stats["%s %d" % (endpoint, status)] += 1
+
+    def is_throttled(self):
+        """全局令牌桶，每秒补充throttle_rate个令牌"""
+        if not self.throttle_rate:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.throttle_rate, self._tokens + (now - self._updated_at) * self.throttle_rate
+            )
+            self._updated_at = now
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+            return False
+
+    def is_captcha(self):
+        if not self.captcha_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.captcha_rate
+
+    def captcha(self):
+        return {"ok": 0, "url": self.base_url + "/__captcha"}
+
+    def user(self, user_id):
+        return synthetic.make_user(int(user_id), statuses_count=self.posts, media_base=self.base_url)
+
+    def card(self, user, index):
+        return synthetic.make_card(
+            user, index, random.Random(synthetic.weibo_id_of(user, index)),
+            self.base_url, self.base_url,
+        )
+
+    def cards(self, user_id, page, count):
+        user = self.user(user_id)
+        first = (page - 1) * count
+        return [self.card(user, i) for i in range(first, min(first + count, user["statuses_count"]))]
+
+    def find_mblog(self, weibo_id):
+        """由微博id反推用户和序号，重新生成该微博，转发的原微博也能找到"""
+        retweet = weibo_id < WEIBO_ID_BASE
+        offset = weibo_id + (RETWEET_ID_OFFSET if retweet else 0) - WEIBO_ID_BASE
+        if offset < 0:
+            return None
+        user = self.user(offset // 100000)
+        index = user["statuses_count"] - offset % 100000
+        if not 0 <= index < user["statuses_count"]:
+            return None
+        mblog = self.card(user, index)["mblog"]
+        if retweet:
+            return mblog.get("retweeted_status")
+        return mblog
+
+    def get_index(self, params):
+        containerid = params.get("containerid", "")
+        page = max(1, int(params.get("page", 1)))
+        count = max(1, int(params.get("count", 10)))
+        if containerid.startswith("100505"):
+            return synthetic.make_user_info(self.user(containerid[6:]))
+        if containerid.startswith("230283"):
+            return synthetic.make_user_detail(self.user(containerid[6:].split("_")[0]))
+        if containerid.startswith("230413"):
+            cards = self.cards(containerid[6:], page, count)
+            return {"ok": 1, "data": {"cardlistInfo": {"page": page + 1}, "cards": cards}}
+        if containerid.startswith("100103"):
+            user_id = params.get("container_ext", "").split("profile_uid:")[-1]
+            cards = self.cards(user_id or FIRST_USER_ID, page, count)
+            return {"ok": 1, "data": {"cards": [{"card_type": 11, "card_group": cards}]}}
+        return None
+
+
+class FakeWeiboHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeWeibo/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, endpoint, body, status=200, content_type="application/json; charset=utf-8",
+                  headers=None):
+        self.server.fake.record(endpoint, status)
+        if not isinstance(body, bytes):
+            if not isinstance(body, str):
+                body = json.dumps(body, ensure_ascii=False)
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path
+        try:
+            if path == "/__stats":
+                return self.send_body("stats", dict(self.server.fake.stats))
+            if path.endswith((".jpg", ".mp4", ".mov")):
+                return self.send_media(path)
+            return self.send_api(path, params)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except ValueError as e:
+            self.send_body("error", {"ok": 0, "msg": str(e)}, 400)
+
+    def send_api(self, path, params):
+        fake = self.server.fake
+        endpoint = path.rstrip("/").rsplit("/", 1)[-1] if not path.startswith("/detail/") else "detail"
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if fake.is_throttled():
+            return self.send_body(endpoint, {"ok": 0, "msg": "请求过于频繁"}, 418)
+        if endpoint == "getIndex":
+            if fake.is_captcha():
+                return self.send_body("captcha", fake.captcha())
+            data = fake.get_index(params)
+            if data is None:
+                return self.send_body(endpoint, {"ok": 0, "msg": "未知的containerid"}, 404)
+            return self.send_body(endpoint, data)
+        if endpoint == "detail":
+            mblog = fake.find_mblog(int(path[len("/detail/"):]))
+            if mblog is None:
+                return self.send_body(endpoint, "<html></html>", 404, "text/html; charset=utf-8")
+            return self.send_body(endpoint, synthetic.make_detail_html(mblog), content_type="text/html; charset=utf-8")
+        if endpoint == "hotflow":
+            return self.send_body(endpoint, synthetic.make_hotflow(int(params["mid"]), fake.comments))
+        if endpoint == "show":
+            data = synthetic.make_hotflow(int(params["id"]), fake.comments)
+            data["data"]["max"] = 1
+            return self.send_body(endpoint, data)
+        if endpoint == "repostTimeline":
+            return self.send_body(endpoint, synthetic.make_reposts(int(params["id"]), fake.reposts))
+        return self.send_body(endpoint, {"ok": 0, "msg": "未知的接口"}, 404)
+
+    def send_media(self, path):
+        """返回固定内容的图片或视频，支持Range请求，可限制带宽"""
+        fake = self.server.fake
+        endpoint = "video" if path.endswith((".mp4", ".mov")) else "image"
+        size = fake.video_size if endpoint == "video" else fake.image_size
+        content_type = {"video": "video/mp4", "image": "image/jpeg"}[endpoint]
+        if self.server.media_delay:
+            time.sleep(self.server.media_delay)
+        start, end = 0, size - 1
+        status = 200
+        match = RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                if match.group(2):
+                    end = min(int(match.group(2)), size - 1)
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start >= size or start > end:
+                return self.send_body(endpoint, b"", 416, content_type, {"Content-Range": "bytes */%d" % size})
+            status = 206
+        fake.record(endpoint, status)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, size))
+        self.end_headers()
+        bandwidth = self.server.media_bandwidth
+        position = start
+        while position <= end:
+            chunk = fake._media[position:min(position + MEDIA_CHUNK_SIZE, end + 1)]
+            self.wfile.write(chunk)
+            position += len(chunk)
+            if bandwidth:
+                time.sleep(len(chunk) / bandwidth)
+
+
+def make_server(host="127.0.0.1", port=8000, latency=0.0, media_delay=0.0, media_bandwidth=0,
+                verbose=False, **options):
+    """创建服务器，port为0时自动选择端口；options传给FakeWeibo"""
+    server = ThreadingHTTPServer((host, port), FakeWeiboHandler)
+    server.daemon_threads = True
+    server.fake = FakeWeibo("http://%s:%d" % (host, server.server_address[1]), **options)
+    server.latency = latency
+    server.media_delay = media_delay
+    server.media_bandwidth = media_bandwidth
+    server.verbose = verbose
+    return server
+
+
+def write_user_list(path, count, first=FIRST_USER_ID):
+    """写出count个用户id，可作为config.json中的user_id_list"""
+    with open(path, "w", encoding="utf-8") as f:
+        for user_id in range(first, first + count):
+            f.write("%d\n" % user_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="模拟m.weibo.cn接口的本地服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--posts", type=int, help="每个用户的微博数，默认每个用户20~200条不等")
+    parser.add_argument("--comments", type=int, default=20, help="每条微博返回的评论数")
+    parser.add_argument("--reposts", type=int, default=20, help="每条微博返回的转发数")
+    parser.add_argument("--latency", type=float, default=0.0, help="接口响应前等待的秒数")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="接口每秒允许的请求数，超过返回418，0为不限")
+    parser.add_argument("--captcha-rate", type=float, default=0, help="接口返回验证码的概率")
+    parser.add_argument("--image-size", type=int, default=64 * 1024, help="图片字节数")
+    parser.add_argument("--video-size", type=int, default=1024 * 1024, help="视频字节数")
+    parser.add_argument("--media-delay", type=float, default=0.0, help="图片视频响应前等待的秒数")
+    parser.add_argument("--media-bandwidth", type=int, default=0, help="每个图片视频请求的带宽（字节/秒），0为不限")
+    parser.add_argument("--users", type=int, default=0, help="生成的用户数，与--user-list一起使用")
+    parser.add_argument("--user-list", help="把--users个用户id写入该文件")
+    parser.add_argument("--verbose", action="store_true", help="输出每个请求的日志")
+    args = parser.parse_args(argv)
+
+    if args.user_list:
+        write_user_list(args.user_list, args.users or 1)
+        print("已将%d个用户id写入%s" % (args.users or 1, args.user_list))
+    server = make_server(
+        args.host, args.port, args.latency, args.media_delay, args.media_bandwidth, args.verbose,
+        posts=args.posts, comments=args.comments, reposts=args.reposts,
+        throttle_rate=args.throttle_rate, captcha_rate=args.captcha_rate,
+        image_size=args.image_size, video_size=args.video_size,
+    )
+    print("服务器已启动: %s，在config.json中设置\"api_base\": \"%s\"" % (
+        server.fake.base_url, server.fake.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(dict(server.fake.stats), ensure_ascii=False, indent=1, sort_keys=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
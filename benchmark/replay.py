@@ -0,0 +1,64 @@
+"""回放data/下的接口数据，代替Weibo.session"""
+import json
+import os
+from urllib.parse import parse_qs, urlsplit
+
+from benchmark.synthetic import DATA_DIR
+
+
+class ReplayResponse:
+    def __init__(self, text, status_code=200, content_type="application/json"):
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {"Content-Type": content_type}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        pass
+
+
+class ReplaySession:
+    """按url返回录制的响应，不发出任何网络请求
+
+    时间线、用户信息、长微博、评论和转发各用一份数据；所有请求都会返回同一份，
+    因此测得的是解析和写入的开销。
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.responses = {}
+        for name in os.listdir(data_dir):
+            with open(os.path.join(data_dir, name), encoding="utf-8") as f:
+                self.responses[name] = f.read()
+        self.request_count = 0
+
+    def route(self, url, params):
+        path = urlsplit(url).path
+        if path.endswith("/container/getIndex"):
+            containerid = params.get("containerid", "")
+            if containerid.startswith("100505"):
+                return "getIndex_user.json"
+            if containerid.startswith("230283"):
+                return "getIndex_user_detail.json"
+            return "getIndex_timeline.json"
+        if path.startswith("/detail/"):
+            return "detail.html"
+        if path.endswith("/comments/hotflow") or path.endswith("/comments/show"):
+            return "hotflow.json"
+        if path.endswith("/statuses/repostTimeline"):
+            return "repostTimeline.json"
+        raise KeyError("没有录制该请求的响应: " + url)
+
+    def get(self, url, params=None, **kwargs):
+        self.request_count += 1
+        query = {k: v[0] for k, v in parse_qs(urlsplit(url).query).items()}
+        query.update(params or {})
+        name = self.route(url, {k: str(v) for k, v in query.items()})
+        content_type = "text/html" if name.endswith(".html") else "application/json"
+        return ReplayResponse(self.responses[name], content_type=content_type)
+
+    def load_json(self, name):
+        return json.loads(self.responses[name])
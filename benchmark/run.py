@@ -0,0 +1,245 @@
+"""离线性能测试
+
+回放data/下录制的接口数据，测量解析和写入热点路径的吞吐量与峰值内存，
+并与保存的基线比较。不访问网络，也不需要修改Weibo。
+
+    python -m benchmark.run                     # 运行全部用例并与baseline.json比较
+    python -m benchmark.run parse_weibo         # 只运行指定用例
+    python -m benchmark.run --save-baseline     # 把本次结果保存为新的基线
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmark.replay import ReplaySession  # noqa: E402
+from util.record import WeiboBatch, split_rows  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+USER_ID = "1669879400"
+# 重复整页数据得到的一批待写入微博数，与get_pages每20页写入一次相当
+WRITE_BATCH_PAGES = 10
+# 峰值内存只有几KiB的用例，SQLite偶尔分配的缓存就会超过相对阈值，增加不超过该值的不算退化
+MEMORY_SLACK_KIB = 4.0
+
+
+class Case:
+    """一个测试用例：run为被测操作，reset在每次run之前执行且不计时
+
+    items为每次run处理的条目数，吞吐量按条目计算。
+    """
+
+    def __init__(self, name, unit, run, items=1, reset=None):
+        self.name = name
+        self.unit = unit
+        self.run = run
+        self.items = items
+        self.reset = reset or (lambda: None)
+
+
+def make_weibo(work_dir, write_mode):
+    """创建回放用的Weibo实例，结果文件写入work_dir"""
+    import const
+    import weibo
+
+    config = {
+        "user_id_list": [USER_ID],
+        "only_crawl_original": 0,
+        "since_date": "2000-01-01",
+        "start_page": 1,
+        "page_weibo_count": 20,
+        "write_mode": write_mode,
+        "original_pic_download": 0,
+        "retweet_pic_download": 0,
+        "original_video_download": 0,
+        "retweet_video_download": 0,
+        "original_live_photo_download": 0,
+        "retweet_live_photo_download": 0,
+        "download_comment": 1,
+        "comment_max_download_count": 20,
+        "download_repost": 1,
+        "repost_max_download_count": 20,
+        "remove_html_tag": 1,
+        "cookie": "",
+    }
+    const.MODE = "overwrite"
+    wb = weibo.Weibo(config)
+    wb.session = ReplaySession()
+    wb.initialize_info(wb.user_config_list[0])
+    wb.user_config["since_date"] = "2000-01-01T00:00:00"
+    wb.get_filepath = lambda type: os.path.join(work_dir, USER_ID + "." + type)
+    wb.get_sqlte_path = lambda: os.path.join(work_dir, "weibodata.db")
+    wb.user = wb.standardize_info(
+        {"id": USER_ID, "screen_name": "benchmark", "gender": "f", "statuses_count": 200}
+    )
+    return wb
+
+
+def build_cases(work_dir):
+    wb = make_weibo(work_dir, ["csv", "json", "sqlite"])
+    session = wb.session
+    timeline = session.load_json("getIndex_timeline.json")
+    mblogs = [card["mblog"] for card in timeline["data"]["cards"]]
+    dates = [mblog["created_at"] for mblog in mblogs] + ["刚刚", "5分钟前", "3小时前", "昨天 12:00"]
+
+    wb.get_one_page(1)
+    page_weibos = list(wb.weibo)
+    # WeiboRecord不可修改，同一条微博可以在批次中重复出现
+    batch = [w for _ in range(WRITE_BATCH_PAGES) for w in page_weibos]
+    counts = [m.get(k, 0) for m in mblogs for k in ("attitudes_count", "comments_count", "reposts_count")]
+    counts += ["1.5万", "100万+", "3.2亿", "4.35万", "12345"]
+    # parse_weibo标准化前的字典，不含retweet
+    infos = [{k: v for k, v in w.items() if k != "retweet"} for w in page_weibos]
+    comments = session.load_json("hotflow.json")["data"]["data"]
+    reposts = session.load_json("repostTimeline.json")["data"]["data"]
+
+    def reset_page():
+        wb.weibo = []
+        wb.weibo_id_set = set()
+        wb.got_count = 0
+
+    def remove(path):
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def remove_files():
+        remove(wb.get_filepath("csv"))
+        remove(wb.get_filepath("json"))
+
+    return [
+        Case("standardize_date", "date", lambda: [wb.standardize_date(d) for d in dates], len(dates)),
+        Case("string_to_int", "count", lambda: [wb.string_to_int(c) for c in counts], len(counts)),
+        Case("standardize_info", "weibo", lambda: [wb.standardize_info(i) for i in infos], len(infos)),
+        Case("parse_weibo", "weibo", lambda: [wb.parse_weibo(m) for m in mblogs], len(mblogs)),
+        Case("get_one_page", "weibo", lambda: wb.get_one_page(1), len(page_weibos), reset_page),
+        Case("get_write_info", "weibo", lambda: wb.get_write_info(batch), len(batch)),
+        Case("write_csv", "weibo", lambda: wb.write_csv(batch), len(batch),
+             lambda: remove(wb.get_filepath("csv"))),
+        Case("write_json", "weibo", lambda: wb.write_json(batch), len(batch),
+             lambda: remove(wb.get_filepath("json"))),
+        Case("weibo_to_sqlite", "weibo", lambda: wb.weibo_to_sqlite(batch), len(batch)),
+        Case("split_rows", "weibo", lambda: split_rows(batch), len(batch)),
+        # 一批微博依次写入csv、json和sqlite，与get_pages中的一次写入相同
+        Case("write_data", "weibo", lambda: wb.write_data(WeiboBatch(batch)), len(batch),
+             remove_files),
+        Case("sqlite_insert_comments", "comment",
+             lambda: (wb.sqlite_insert_comments(page_weibos[0], comments), wb.get_sqlite_writer().flush()),
+             len(comments)),
+        Case("sqlite_insert_reposts", "repost",
+             lambda: (wb.sqlite_insert_reposts(page_weibos[0], reposts), wb.get_sqlite_writer().flush()),
+             len(reposts)),
+    ], wb
+
+
+def measure(case, min_time, rounds):
+    """多轮计时取最快一轮的吞吐量，另用tracemalloc单独跑一次测峰值内存"""
+    best = 0.0
+    for _ in range(rounds):
+        elapsed = 0.0
+        count = 0
+        while elapsed < min_time:
+            case.reset()
+            start = time.perf_counter()
+            case.run()
+            elapsed += time.perf_counter() - start
+            count += 1
+        best = max(best, count * case.items / elapsed)
+    case.reset()
+    tracemalloc.start()
+    case.run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"ops_per_sec": round(best, 1), "unit": case.unit, "peak_kib": round(peak / 1024, 1)}
+
+
+def compare(results, baseline, tolerance):
+    """返回(用例, 说明)列表：吞吐量低于或峰值内存高于基线超过tolerance的用例
+
+    峰值内存还须比基线多出MEMORY_SLACK_KIB以上才算退化。
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - tolerance):
+            regressions.append((name, "吞吐量 %.1f -> %.1f %s/s" % (
+                base["ops_per_sec"], result["ops_per_sec"], result["unit"])))
+        memory_limit = max(base["peak_kib"] * (1 + tolerance), base["peak_kib"] + MEMORY_SLACK_KIB)
+        if result["peak_kib"] > memory_limit:
+            regressions.append((name, "峰值内存 %.1f -> %.1f KiB" % (base["peak_kib"], result["peak_kib"])))
+    return regressions
+
+
+def format_row(name, result, base):
+    change = ""
+    if base:
+        change = "%+.0f%%" % ((result["ops_per_sec"] / base["ops_per_sec"] - 1) * 100)
+    return "%-24s %14.1f %-8s %12.1f %10s" % (
+        name, result["ops_per_sec"], result["unit"] + "/s", result["peak_kib"], change)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="回放录制数据，测量解析和写入的性能")
+    parser.add_argument("cases", nargs="*", help="要运行的用例，默认全部")
+    parser.add_argument("--min-time", type=float, default=1.0, help="每轮最少计时秒数")
+    parser.add_argument("--rounds", type=int, default=3, help="计时轮数，取最快一轮")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的相对退化幅度")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果写入基线文件")
+    parser.add_argument("--output", help="把本次结果另存为JSON文件")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="weibo-benchmark-")
+    try:
+        import weibo
+        # 日志输出会掩盖被测代码本身的开销
+        weibo.logger.setLevel(logging.WARNING)
+        cases, wb = build_cases(work_dir)
+        if args.cases:
+            unknown = set(args.cases) - {case.name for case in cases}
+            if unknown:
+                parser.error("未知用例: " + ", ".join(sorted(unknown)))
+            cases = [case for case in cases if case.name in args.cases]
+
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        results = {}
+        print("%-24s %14s %-8s %12s %10s" % ("case", "ops/sec", "unit", "peak KiB", "vs base"))
+        for case in cases:
+            results[case.name] = measure(case, args.min_time, args.rounds)
+            print(format_row(case.name, results[case.name], baseline.get(case.name)))
+        wb.close_sqlite_writer()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print("基线已保存到 " + args.baseline)
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, message in regressions:
+        print("退化: %s %s" % (name, message))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""按m.weibo.cn接口的格式生成合成数据
+
+benchmark.run回放的data/下的文件由本模块生成（python -m benchmark.synthetic），
+benchmark.fake_server也用它按需生成任意多的用户和微博。同一个种子总是生成相同的数据。
+"""
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# 数据中的时间以此为基准往前推，保证每次生成的数据相同
+BASE_TIME = datetime(2024, 6, 1, 12, 0, 0)
+MEDIA_BASE = "https://wx1.sinaimg.cn"
+VIDEO_BASE = "https://f.video.weibocdn.com"
+
+WORDS = [
+    "今天", "天气", "不错", "出去", "走走", "公园", "散步", "看到", "很多", "花",
+    "开心", "工作", "加班", "好累", "周末", "电影", "推荐", "大家", "一起", "学习",
+    "新闻", "发布", "会议", "城市", "交通", "地铁", "早高峰", "咖啡", "读书", "分享",
+    "旅行", "照片", "美食", "晚饭", "朋友", "生日", "快乐", "感谢", "支持", "关注",
+]
+EMOTICONS = ["[哈哈]", "[心]", "[赞]", "[泪]", "[doge]", "[抱抱]"]
+TOPICS = ["日常", "周末去哪儿", "美食分享", "读书打卡", "城市生活"]
+LOCATIONS = ["北京·朝阳区", "上海·徐汇区", "杭州·西湖", "成都·锦江区"]
+SOURCES = ["iPhone客户端", "Android", "微博 weibo.com", "HUAWEI Mate 60"]
+COUNT_STRINGS = ["1万+", "2.3万", "100万+", "1.2亿"]
+
+
+def weibo_time(dt):
+    """微博接口的时间格式，如Sat Jun 01 12:00:00 +0800 2024"""
+    return dt.strftime("%a %b %d %H:%M:%S +0800 %Y")
+
+
+def make_user(user_id, rng=None, statuses_count=None, media_base=MEDIA_BASE):
+    rng = rng or random.Random(int(user_id))
+    return {
+        "id": int(user_id),
+        "screen_name": "用户%s" % user_id,
+        "gender": rng.choice(["f", "m"]),
+        "statuses_count": statuses_count if statuses_count is not None else rng.randint(20, 200),
+        "followers_count": rng.choice([rng.randint(0, 9999), rng.choice(COUNT_STRINGS)]),
+        "follow_count": rng.randint(0, 2000),
+        "description": "这是用户%s的简介" % user_id,
+        "profile_url": "https://m.weibo.cn/u/%s" % user_id,
+        "profile_image_url": "%s/orj480/%s.jpg" % (media_base, user_id),
+        "avatar_hd": "%s/orj1080/%s.jpg" % (media_base, user_id),
+        "urank": rng.randint(0, 48),
+        "mbrank": rng.randint(0, 7),
+        "verified": rng.random() < 0.2,
+        "verified_type": -1,
+        "verified_reason": "",
+    }
+
+
+def make_text(rng, length=None):
+    """带@、话题、表情和位置的正文HTML"""
+    length = length or rng.randint(5, 60)
+    parts = []
+    for _ in range(length):
+        r = rng.random()
+        if r < 0.03:
+            name = "用户%d" % rng.randint(1000, 9999)
+            parts.append("<a href='/n/%s'>@%s</a>" % (name, name))
+        elif r < 0.06:
+            topic = rng.choice(TOPICS)
+            parts.append(
+                '<a href="https://m.s.weibo.com/weibo?q=%%23%s%%23"><span class="surl-text">#%s#</span></a>'
+                % (topic, topic)
+            )
+        elif r < 0.1:
+            parts.append(
+                '<span class="url-icon"><img alt="%s" src="https://face.t.sinajs.cn/t4/face.png" /></span>'
+                % rng.choice(EMOTICONS)
+            )
+        elif r < 0.12:
+            parts.append("<br />")
+        else:
+            parts.append(rng.choice(WORDS))
+    if rng.random() < 0.2:
+        parts.append(
+            '<a href="http://weibo.com/p/100101"><span class="url-icon">'
+            '<img src="https://h5.sinaimg.cn/upload/2015/09/25/3/timeline_card_small_location_default.png" />'
+            '</span><span class="surl-text">%s</span></a>' % rng.choice(LOCATIONS)
+        )
+    return "".join(parts)
+
+
+def make_mblog(weibo_id, user, created_at, rng, retweet=None, long_text=False,
+               media_base=MEDIA_BASE, video_base=VIDEO_BASE):
+    pic_num = rng.choice([0, 0, 0, 1, 3, 9])
+    mblog = {
+        "id": str(weibo_id),
+        "mid": str(weibo_id),
+        "bid": "N%08X" % (weibo_id % 0xFFFFFFFF),
+        "created_at": weibo_time(created_at),
+        "text": make_text(rng, 120 if long_text else None),
+        "source": rng.choice(SOURCES),
+        "user": {"id": user["id"], "screen_name": user["screen_name"]},
+        "reposts_count": rng.choice([0, rng.randint(1, 500), rng.choice(COUNT_STRINGS)]),
+        "comments_count": rng.choice([0, rng.randint(1, 500)]),
+        "attitudes_count": rng.choice([rng.randint(0, 9999), rng.choice(COUNT_STRINGS)]),
+        "isLongText": long_text,
+        "pic_num": pic_num,
+        "pics": [
+            {"pid": "p%d_%d" % (weibo_id, i),
+             "large": {"url": "%s/large/%d_%d.jpg" % (media_base, weibo_id, i)}}
+            for i in range(pic_num)
+        ],
+    }
+    r = rng.random()
+    if r < 0.1:
+        mblog["page_info"] = {
+            "type": "video",
+            "urls": {"mp4_720p_mp4": "%s/o0/%d.mp4" % (video_base, weibo_id)},
+        }
+    elif r < 0.15:
+        mblog["live_photo"] = ["%s/o0/%d_live.mov" % (video_base, weibo_id)]
+    if retweet:
+        mblog["retweeted_status"] = retweet
+    return mblog
+
+
+def weibo_id_of(user, index):
+    """用户第index条（从0开始，越新越靠前）微博的id"""
+    return 4900000000000000 + user["id"] * 100000 + (user["statuses_count"] - index)
+
+
+def make_card(user, index, rng, media_base=MEDIA_BASE, video_base=VIDEO_BASE):
+    """用户第index条微博的卡片，约三成是转发，转发的原微博id为微博id减3000000000000000"""
+    weibo_id = weibo_id_of(user, index)
+    created_at = BASE_TIME - timedelta(hours=index * 7 + user["id"] % 24)
+    retweet = None
+    if rng.random() < 0.3:
+        origin = make_user(rng.randint(100000, 999999), rng, media_base=media_base)
+        retweet = make_mblog(
+            weibo_id - 3000000000000000, origin, created_at - timedelta(days=1), rng,
+            long_text=rng.random() < 0.1, media_base=media_base, video_base=video_base,
+        )
+    return {
+        "card_type": 9,
+        "mblog": make_mblog(
+            weibo_id, user, created_at, rng, retweet, long_text=rng.random() < 0.1,
+            media_base=media_base, video_base=video_base,
+        ),
+    }
+
+
+def make_timeline(user, page, page_count=10, rng=None, media_base=MEDIA_BASE, video_base=VIDEO_BASE):
+    """用户第page页的微博，微博id和发布时间随页码递减"""
+    rng = rng or random.Random(user["id"] * 1000 + page)
+    first = (page - 1) * page_count
+    cards = [
+        make_card(user, i, rng, media_base, video_base)
+        for i in range(first, min(first + page_count, user["statuses_count"]))
+    ]
+    return {"ok": 1, "data": {"cardlistInfo": {"page": page + 1}, "cards": cards}}
+
+
+def make_user_info(user):
+    return {"ok": 1, "data": {"userInfo": user}}
+
+
+def make_user_detail(user):
+    return {
+        "ok": 1,
+        "data": {
+            "cards": [
+                {"card_group": [
+                    {"item_name": "生日", "item_content": "1990-01-01"},
+                    {"item_name": "所在地", "item_content": "北京"},
+                    {"item_name": "大学", "item_content": "某大学"},
+                ]},
+                {"card_group": [
+                    {"item_name": "注册时间", "item_content": "2012-03-04"},
+                    {"item_name": "阳光信用", "item_content": "信用极好"},
+                ]},
+            ]
+        },
+    }
+
+
+def make_detail_html(mblog):
+    """/detail/<id>页面，正文JSON嵌在$render_data中"""
+    render_data = json.dumps(mblog, ensure_ascii=False)
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"></head><body><script>\n"
+        "var $render_data = [{\n\"status\": %s,\n\"call\": \"GET\",\n\"hotScheme\": \"\"}][0] || {};\n"
+        "</script></body></html>" % render_data
+    )
+
+
+def make_comments(weibo_id, count, rng=None):
+    rng = rng or random.Random(weibo_id)
+    comments = []
+    for i in range(count):
+        user = make_user(rng.randint(100000, 999999), rng)
+        comment = {
+            "id": str(5000000000000000 + weibo_id % 10000000 * 100 + i),
+            "bid": "C%07X" % i,
+            "rootid": "",
+            "created_at": weibo_time(BASE_TIME - timedelta(minutes=i)),
+            "text": make_text(rng, rng.randint(3, 20)),
+            "like_count": rng.randint(0, 100),
+            "user": {"id": user["id"], "screen_name": user["screen_name"], "avatar_hd": user["avatar_hd"]},
+        }
+        if rng.random() < 0.2:
+            comment["comments"] = [dict(comment, id=comment["id"] + "1", rootid=comment["id"])]
+        comments.append(comment)
+    return comments
+
+
+def make_hotflow(weibo_id, count, rng=None):
+    return {"ok": 1, "data": {"data": make_comments(weibo_id, count, rng), "max_id": 0, "total_number": count}}
+
+
+def make_reposts(weibo_id, count, rng=None):
+    rng = rng or random.Random(weibo_id + 1)
+    reposts = []
+    for i in range(count):
+        user = make_user(rng.randint(100000, 999999), rng)
+        reposts.append({
+            "id": str(6000000000000000 + weibo_id % 10000000 * 100 + i),
+            "bid": "R%07X" % i,
+            "created_at": weibo_time(BASE_TIME - timedelta(minutes=i)),
+            "raw_text": rng.choice(["转发微博", "", "说得好//@某人:转发微博"]) + rng.choice(WORDS),
+            "attitudes_count": rng.randint(0, 50),
+            "user": {"id": user["id"], "screen_name": user["screen_name"],
+                     "profile_image_url": user["profile_image_url"]},
+        })
+    return {"ok": 1, "data": {"data": reposts, "max": 1}}
+
+
+def write_fixtures(data_dir=DATA_DIR, seed=2024):
+    """生成benchmark.run回放的数据文件"""
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    user = make_user(1669879400, rng, statuses_count=200)
+    timeline = make_timeline(user, 1, 20, rng)
+    long_mblog = next(
+        card["mblog"] for card in timeline["data"]["cards"] if card["mblog"]["isLongText"]
+    )
+    fixtures = {
+        "getIndex_user.json": make_user_info(user),
+        "getIndex_user_detail.json": make_user_detail(user),
+        "getIndex_timeline.json": timeline,
+        "hotflow.json": make_hotflow(int(long_mblog["id"]), 20, rng),
+        "repostTimeline.json": make_reposts(int(long_mblog["id"]), 20, rng),
+    }
+    for name, data in fixtures.items():
+        with open(os.path.join(data_dir, name), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+    with open(os.path.join(data_dir, "detail.html"), "w", encoding="utf-8") as f:
+        f.write(make_detail_html(long_mblog))
+
+
+if __name__ == "__main__":
+    write_fixtures()
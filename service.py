@@ -3,18 +3,23 @@ import const
 import logging
 import logging.config
 import os
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 import sqlite3
 import json
+import base64
+import re
 from concurrent.futures import ThreadPoolExecutor
 import threading
 import uuid
 import time
 from datetime import datetime
+from util import metrics
+from util.blob_store import BlobStore
 
 # 1896820725 天津股侠 2024-12-09T16:47:04
 
 DATABASE_PATH = './weibo/weibodata.db'
+blob_store = BlobStore(os.path.join(os.path.dirname(DATABASE_PATH), 'blobs'))
 print(DATABASE_PATH)
 
 # 如果日志文件夹不存在，则创建
@@ -177,28 +182,120 @@ def get_task_status(task_id):
         
     return jsonify(response)
 
+WEIBOS_DEFAULT_LIMIT = 100
+WEIBOS_MAX_LIMIT = 1000
+# 分页排序用的发布时间：created_at为NULL的微博按空字符串排在最后，不会因为
+# 与NULL比较的结果为NULL而从分页中漏掉。须与weibo表索引中的表达式一致
+SORT_CREATED_AT = "COALESCE(created_at, '')"
+
+def encode_cursor(created_at, weibo_id):
+    raw = json.dumps([created_at, weibo_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """cursor无效时抛出ValueError"""
+    try:
+        created_at, weibo_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor parameter')
+    return created_at, weibo_id
+
+def parse_time_param(name, end_of_day=False):
+    """解析yyyy-mm-dd或yyyy-mm-dd HH:MM:SS格式的参数，与created_at的格式一致以便直接比较"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            ts = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if fmt == '%Y-%m-%d' and end_of_day:
+            ts = ts.replace(hour=23, minute=59, second=59)
+        return ts.strftime('%Y-%m-%d %H:%M:%S')
+    raise ValueError('Invalid %s parameter' % name)
+
+def build_weibos_query(conn):
+    """根据请求参数生成查询，返回(sql, params, fields, limit)，参数无效时抛出ValueError"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(weibo)")]
+    fields = request.args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in columns]
+        if unknown or not fields:
+            raise ValueError('Invalid fields parameter: ' + ','.join(unknown))
+    else:
+        fields = columns
+
+    try:
+        limit = int(request.args.get('limit', WEIBOS_DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('Invalid limit parameter')
+    if limit < 1 or limit > WEIBOS_MAX_LIMIT:
+        raise ValueError('limit must be between 1 and %d' % WEIBOS_MAX_LIMIT)
+
+    conditions = []
+    params = []
+    user_id = request.args.get('user_id')
+    if user_id:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    since = parse_time_param('since')
+    if since:
+        conditions.append(SORT_CREATED_AT + " >= ?")
+        params.append(since)
+    until = parse_time_param('until', end_of_day=True)
+    if until:
+        conditions.append("created_at <= ?")
+        params.append(until)
+    cursor = request.args.get('cursor')
+    if cursor:
+        # 键集分页：从上一页最后一条之后继续，走(created_at, id)索引，不随页数变慢
+        conditions.append("({created_at}, id) < (?, ?)".format(created_at=SORT_CREATED_AT))
+        params.extend(decode_cursor(cursor))
+
+    # 末尾额外查询排序用的created_at和id用于生成下一页的cursor
+    sql = "SELECT {fields}, {created_at}, id FROM weibo".format(
+        fields=", ".join('"%s"' % field for field in fields), created_at=SORT_CREATED_AT
+    )
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY {created_at} DESC, id DESC LIMIT ?".format(created_at=SORT_CREATED_AT)
+    params.append(limit)
+    return sql, params, fields, limit
+
 @app.route('/weibos', methods=['GET'])
 def get_weibos():
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        # 按created_at倒序查询所有微博
-        cursor.execute("SELECT * FROM weibo ORDER BY created_at DESC")
-        columns = [column[0] for column in cursor.description]
-        weibos = []
-        for row in cursor.fetchall():
-            weibo = dict(zip(columns, row))
-            weibos.append(weibo)
-        conn.close()
-        res1 = json.dumps(weibos, ensure_ascii=False)
-        print(res1)
-        res = jsonify(weibos)
-        print(res)
-        return res, 200
+        conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
+        try:
+            sql, params, fields, limit = build_weibos_query(conn)
+        except ValueError as e:
+            conn.close()
+            return {"error": str(e)}, 400
+        cursor = conn.execute(sql, params)
     except Exception as e:
         logger.exception(e)
         return {"error": str(e)}, 500
 
+    def generate():
+        # 逐行序列化并分块发送，不在内存中构造整个结果
+        try:
+            yield '{"weibos": ['
+            count = 0
+            last = None
+            for row in cursor:
+                weibo = dict(zip(fields, row))
+                yield (',' if count else '') + json.dumps(weibo, ensure_ascii=False)
+                count += 1
+                last = row[-2:]
+            next_cursor = encode_cursor(*last) if count == limit else None
+            yield '], "next_cursor": %s}' % json.dumps(next_cursor)
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/json;charset=utf-8')
+
 @app.route('/weibos/<weibo_id>', methods=['GET'])
 def get_weibo_detail(weibo_id):
     try:
@@ -218,6 +315,123 @@ def get_weibo_detail(weibo_id):
         logger.exception(e)
         return {"error": str(e)}, 500
 
+# 可搜索的类型：(表, FTS5表, 返回的字段)
+SEARCH_TABLES = {
+    'weibo': ('weibo', 'weibo_fts', ['id', 'user_id', 'screen_name', 'created_at']),
+    'comments': ('comments', 'comments_fts', ['id', 'weibo_id', 'user_id', 'user_screen_name', 'created_at']),
+    'reposts': ('reposts', 'reposts_fts', ['id', 'weibo_id', 'user_id', 'user_screen_name', 'created_at']),
+}
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# trigram分词只能匹配不少于3个字符的词，更短的词改用LIKE查询
+FTS_MIN_TERM_LENGTH = 3
+SNIPPET_WIDTH = 16
+
+def make_snippet(text, terms):
+    """LIKE查询时生成与FTS5 snippet格式相同的摘要"""
+    text = text or ''
+    lower_text = text.lower()
+    position = min((lower_text.find(term.lower()) for term in terms if term.lower() in lower_text), default=0)
+    start = max(0, position - SNIPPET_WIDTH // 2)
+    end = min(len(text), start + SNIPPET_WIDTH * 2)
+    snippet = text[start:end]
+    for term in terms:
+        snippet = re.sub(re.escape(term), lambda m: '<em>' + m.group(0) + '</em>', snippet, flags=re.IGNORECASE)
+    return ('…' if start > 0 else '') + snippet + ('…' if end < len(text) else '')
+
+def is_trigram_fts(conn, fts_table):
+    """FTS5表是否使用trigram分词；SQLite 3.34以前建立的全文索引使用unicode61分词，无法匹配中文片段"""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (fts_table,)).fetchone()
+    return bool(row) and "trigram" in row[0]
+
+@app.route('/search', methods=['GET'])
+def search():
+    terms = request.args.get('q', '').split()
+    if not terms:
+        return {"error": "Missing q parameter"}, 400
+    search_type = request.args.get('type', 'weibo')
+    if search_type not in SEARCH_TABLES:
+        return {"error": "Invalid type parameter"}, 400
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return {"error": "Invalid limit or offset parameter"}, 400
+    if limit < 1 or limit > SEARCH_MAX_LIMIT or offset < 0:
+        return {"error": "limit must be between 1 and %d" % SEARCH_MAX_LIMIT}, 400
+
+    table, fts_table, fields = SEARCH_TABLES[search_type]
+    columns = ", ".join("{table}.{field}".format(table=table, field=field) for field in fields)
+    use_fts = all(len(term) >= FTS_MIN_TERM_LENGTH for term in terms)
+    try:
+        conn = sqlite3.connect(DATABASE_PATH)
+        if use_fts and is_trigram_fts(conn, fts_table):
+            # 每个词作为短语匹配，多个词之间为AND，按bm25相关度排序
+            match = " ".join('"%s"' % term.replace('"', '""') for term in terms)
+            sql = """SELECT {columns}, snippet({fts}, 0, '<em>', '</em>', '…', {width}), bm25({fts})
+                FROM {fts} JOIN {table} ON {table}.id = CAST({fts}.rowid AS TEXT)
+                WHERE {fts} MATCH ? ORDER BY {fts}.rank LIMIT ? OFFSET ?""".format(
+                columns=columns, fts=fts_table, table=table, width=SNIPPET_WIDTH
+            )
+            rows = conn.execute(sql, (match, limit, offset)).fetchall()
+        else:
+            # 有词短于3个字符或全文索引不是trigram分词时无法使用全文索引，退化为LIKE查询，按时间倒序
+            conditions = " AND ".join(["text LIKE ? ESCAPE '\\'"] * len(terms))
+            params = [
+                "%" + re.sub(r'([\\%_])', r'\\\1', term) + "%" for term in terms
+            ]
+            sql = """SELECT {columns}, text, NULL FROM {table}
+                WHERE {conditions} ORDER BY created_at DESC LIMIT ? OFFSET ?""".format(
+                columns=columns, table=table, conditions=conditions
+            )
+            rows = [
+                row[:-2] + (make_snippet(row[-2], terms), None)
+                for row in conn.execute(sql, params + [limit, offset])
+            ]
+        conn.close()
+    except Exception as e:
+        logger.exception(e)
+        return {"error": str(e)}, 500
+
+    results = []
+    for row in rows:
+        result = dict(zip(fields, row))
+        result['snippet'] = row[-2]
+        # bm25越小越相关，取反后越大越相关
+        result['rank'] = -row[-1] if row[-1] is not None else None
+        results.append(result)
+    return jsonify({
+        'results': results,
+        'next_offset': offset + limit if len(results) == limit else None,
+    }), 200
+
+@app.route('/media/<sha256>', methods=['GET'])
+def get_media(sha256):
+    try:
+        conn = sqlite3.connect(DATABASE_PATH)
+        cursor = conn.cursor()
+        cursor.execute("SELECT ext FROM bins WHERE sha256=? LIMIT 1", (sha256,))
+        row = cursor.fetchone()
+        conn.close()
+
+        if not row or not blob_store.exists(sha256):
+            return {"error": "Media not found"}, 404
+        # 内容按sha256寻址，不会改变，可以长期缓存
+        response = send_file(
+            os.path.abspath(blob_store.path_for(sha256)),
+            download_name=sha256 + row[0],
+            max_age=365 * 24 * 3600,
+        )
+        return response
+    except Exception as e:
+        logger.exception(e)
+        return {"error": str(e)}, 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus文本格式的爬取指标，包含本进程内所有刷新任务的累计值"""
+    return Response(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def schedule_refresh():
     """定时刷新任务"""
     while True:
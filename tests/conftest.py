@@ -0,0 +1,38 @@
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmark.fake_server import make_server  # noqa: E402
+
+
+@pytest.fixture
+def start_fake_server():
+    """启动benchmark.fake_server，参数传给make_server，测试结束时关闭"""
+    servers = []
+
+    def start(**options):
+        server = make_server(port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def replay_weibo(tmp_path):
+    """回放benchmark/data下录制数据的Weibo实例，结果写入临时目录"""
+    from benchmark.run import make_weibo
+
+    wb = make_weibo(str(tmp_path), ["csv", "json", "sqlite"])
+    yield wb
+    wb.close_sqlite_writer()
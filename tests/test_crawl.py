@@ -0,0 +1,155 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import const
+import weibo
+from benchmark.fake_server import FIRST_USER_ID
+from util.seen_ids import SeenIdStore
+
+
+def test_replay_get_one_page(replay_weibo):
+    assert not replay_weibo.get_one_page(1)
+
+    assert replay_weibo.weibo
+    assert replay_weibo.got_count == len(replay_weibo.weibo)
+    assert all(isinstance(w, weibo.WeiboRecord) for w in replay_weibo.weibo)
+    assert all(w["full_created_at"] for w in replay_weibo.weibo)
+
+
+def test_replay_write_data(replay_weibo):
+    replay_weibo.get_one_page(1)
+    batch = replay_weibo.take_batch()
+    assert not replay_weibo.weibo
+
+    replay_weibo.write_data(batch)
+
+    with open(replay_weibo.get_filepath("csv"), encoding="utf-8-sig") as f:
+        assert len(list(csv.reader(f))) == len(batch) + 1
+    with open(replay_weibo.get_filepath("json"), encoding="utf-8") as f:
+        assert [w["id"] for w in json.load(f)["weibo"]] == [w["id"] for w in batch]
+    ids = replay_weibo.get_sqlite_writer().query_all("SELECT id FROM weibo")
+    retweet_ids = {str(w["retweet"]["id"]) for w in batch if "retweet" in w}
+    assert {row[0] for row in ids} == {str(w["id"]) for w in batch} | retweet_ids
+
+
+def test_long_weibo_committed_from_other_thread(tmp_path):
+    store = SeenIdStore(str(tmp_path / "seen_ids.db"))
+    thread = threading.Thread(target=store.put_long_weibo, args=("1", 7, {"id": "1", "text": "长微博"}))
+    thread.start()
+    thread.join()
+
+    assert store.get_long_weibo("1", 7) == {"id": "1", "text": "长微博"}
+    store.close()
+
+
+def test_write_lock_not_held_while_fetching_comments(replay_weibo):
+    replay_weibo.get_one_page(1)
+    batch = replay_weibo.take_batch()
+    replay_weibo.write_mode = ["csv", "sqlite"]
+    replay_weibo.download_comment = 1
+    replay_weibo.comment_max_download_count = 5
+    locked = []
+    replay_weibo.get_weibo_comments = lambda weibo, max_count, on_downloaded: locked.append(
+        replay_weibo.write_lock.locked()
+    )
+
+    replay_weibo.write_data(batch)
+
+    assert locked and not any(locked)
+
+
+@pytest.fixture
+def crawl(start_fake_server, tmp_path, monkeypatch):
+    """用fake_server爬取一个用户，返回(服务器, 结果目录, 运行一次爬取的函数)"""
+    server = start_fake_server(posts=45, comments=5, image_size=2048)
+    monkeypatch.setattr(const, "MODE", "overwrite")
+    out_dir = tmp_path / "out"
+
+    def get_filepath(self, type):
+        if type in ("img", "video", "live_photo"):
+            path = out_dir / type
+            path.mkdir(parents=True, exist_ok=True)
+            return str(path)
+        out_dir.mkdir(parents=True, exist_ok=True)
+        return str(out_dir / ("%s.%s" % (self.user_config["user_id"], type)))
+
+    monkeypatch.setattr(weibo.Weibo, "get_filepath", get_filepath)
+    monkeypatch.setattr(weibo.Weibo, "get_sqlte_path", lambda self: str(out_dir / "weibodata.db"))
+    # users.csv固定写在weibo.py旁的weibo文件夹中
+    monkeypatch.setattr(weibo.Weibo, "user_to_csv", lambda self: None)
+
+    def run(**options):
+        config = {
+            "user_id_list": [str(FIRST_USER_ID)],
+            "only_crawl_original": 0,
+            "since_date": "2000-01-01",
+            "start_page": 1,
+            "page_weibo_count": 20,
+            "write_mode": ["csv", "json", "sqlite"],
+            "original_pic_download": 1,
+            "retweet_pic_download": 0,
+            "original_video_download": 0,
+            "retweet_video_download": 0,
+            "original_live_photo_download": 0,
+            "retweet_live_photo_download": 0,
+            "download_comment": 1,
+            "comment_max_download_count": 5,
+            "download_repost": 0,
+            "repost_max_download_count": 0,
+            "remove_html_tag": 1,
+            "cookie": "",
+            "api_base": server.fake.base_url,
+            "rate_limit_config": {"initial_rate": 1000, "max_rate": 1000, "burst": 100},
+        }
+        config.update(options)
+        weibo.Weibo(config).start()
+
+    return server, out_dir, run
+
+
+def test_fake_server_crawl(crawl):
+    server, out_dir, run = crawl
+
+    run()
+
+    with open(out_dir / ("%d.csv" % FIRST_USER_ID), encoding="utf-8-sig") as f:
+        assert len(list(csv.reader(f))) == 45 + 1
+    connection = sqlite3.connect(str(out_dir / "weibodata.db"))
+    user_id = str(FIRST_USER_ID)
+    assert connection.execute("SELECT COUNT(*) FROM weibo WHERE user_id=?", (user_id,)).fetchone()[0] == 45
+    assert connection.execute("SELECT COUNT(*) FROM comments").fetchone()[0] > 0
+    connection.close()
+    assert os.listdir(str(out_dir / "img"))
+    assert server.fake.stats["image 200"] > 0
+
+
+def test_fake_server_crawl_skips_seen(crawl, monkeypatch):
+    server, out_dir, run = crawl
+    options = {
+        "download_comment": 0,
+        "original_pic_download": 0,
+        "seen_ids_config": {"enabled": True, "path": str(out_dir / "seen_ids.db"), "skip_seen": True},
+    }
+
+    run(**options)
+    detail_count = server.fake.stats["detail 200"]
+    os.remove(str(out_dir / ("%d.csv" % FIRST_USER_ID)))
+    parsed = []
+    get_one_weibo = weibo.Weibo.get_one_weibo
+    monkeypatch.setattr(
+        weibo.Weibo, "get_one_weibo", lambda self, info: parsed.append(info) or get_one_weibo(self, info)
+    )
+    run(**options)
+
+    connection = sqlite3.connect(str(out_dir / "seen_ids.db"))
+    assert connection.execute("SELECT COUNT(*) FROM seen_weibo").fetchone()[0] == 45
+    connection.close()
+    # 第二次运行时所有微博都已写入过，不再解析、不再请求长微博，也不再写入csv
+    assert not parsed
+    assert server.fake.stats["detail 200"] == detail_count
+    assert not os.path.exists(str(out_dir / ("%d.csv" % FIRST_USER_ID)))
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from util.downloader import IncompleteDownload, MediaDownloader
+
+VIDEO_SIZE = 300000
+
+
+def make_downloader(range_connections=1, host_max_concurrency=4):
+    return MediaDownloader({"download_config": {
+        "range_connections": range_connections,
+        "range_min_size": 1024,
+        "host_max_concurrency": host_max_concurrency,
+    }})
+
+
+def test_fetch_ranged(start_fake_server, tmp_path):
+    server = start_fake_server(video_size=VIDEO_SIZE)
+    file_path = str(tmp_path / "video.mp4")
+
+    saved_path = make_downloader(4).fetch(server.fake.base_url + "/v/1.mp4", file_path, {}, ranged=True)
+
+    assert saved_path == file_path
+    with open(saved_path, "rb") as f:
+        assert f.read() == server.fake._media[:VIDEO_SIZE]
+    # 1次探测大小 + 4个分段
+    assert server.fake.stats["video 206"] == 5
+    assert "video 200" not in server.fake.stats
+    assert not os.path.exists(file_path + ".ranges")
+
+
+@pytest.mark.parametrize("host_max_concurrency, requests", [
+    (2, {"video 206": 3}),
+    (1, {"video 206": 1, "video 200": 1}),
+])
+def test_ranges_count_against_host_slots(start_fake_server, tmp_path, host_max_concurrency, requests):
+    server = start_fake_server(video_size=VIDEO_SIZE)
+    downloader = make_downloader(4, host_max_concurrency)
+    tasks = [(server.fake.base_url + "/v/1.mp4", str(tmp_path / "video.mp4"))]
+
+    result = downloader.run(tasks, lambda url, path: downloader.fetch(url, path, {}, ranged=True))
+
+    assert result == (1, 0)
+    # 1次探测大小 + 剩余名额数的分段；没有剩余名额时改为顺序下载
+    assert dict(server.fake.stats) == requests
+
+
+def test_fetch_ranged_checks_received_bytes(start_fake_server, tmp_path, monkeypatch):
+    server = start_fake_server(video_size=VIDEO_SIZE)
+    file_path = str(tmp_path / "video.mp4")
+    downloader = make_downloader(4)
+    fetch_range = downloader._fetch_range
+
+    def short_range(url, path, headers, start, end):
+        content_type, size = fetch_range(url, path, headers, start, end)
+        return content_type, size - 1
+
+    monkeypatch.setattr(downloader, "_fetch_range", short_range)
+
+    # 预分配的文件大小总是正确的，只有按收到的字节数才能发现分段不完整
+    assert downloader.fetch_ranged(server.fake.base_url + "/v/1.mp4", file_path, {}) is None
+    assert not os.path.exists(file_path + ".ranges")
+
+
+def test_fetch_ranged_skips_small_files(start_fake_server, tmp_path):
+    server = start_fake_server(image_size=512)
+
+    assert make_downloader(4).fetch_ranged(server.fake.base_url + "/i/1.jpg", str(tmp_path / "a.jpg"), {}) is None
+
+
+def test_fetch_resumes_part_file(start_fake_server, tmp_path):
+    server = start_fake_server(image_size=100000)
+    file_path = str(tmp_path / "image.jpg")
+    with open(file_path + ".part", "wb") as f:
+        f.write(server.fake._media[:40000])
+
+    saved_path = make_downloader().fetch(server.fake.base_url + "/i/1.jpg", file_path, {})
+
+    assert saved_path == file_path
+    with open(saved_path, "rb") as f:
+        assert f.read() == server.fake._media[:100000]
+    assert dict(server.fake.stats) == {"image 206": 1}
+    assert not os.path.exists(file_path + ".part")
+
+
+def test_fetch_complete_part_file(start_fake_server, tmp_path):
+    server = start_fake_server(image_size=100000)
+    file_path = str(tmp_path / "image.jpg")
+    with open(file_path + ".part", "wb") as f:
+        f.write(server.fake._media[:100000])
+
+    assert make_downloader().fetch(server.fake.base_url + "/i/1.jpg", file_path, {}) == file_path
+    assert os.path.getsize(file_path) == 100000
+
+
+def test_detect_extension_rejects_truncated_jpeg(tmp_path):
+    part_path = str(tmp_path / "a.jpg.part")
+    with open(part_path, "wb") as f:
+        f.write(b"\xff\xd8\xff\xe0" + b"\x00" * 100)
+
+    with pytest.raises(IncompleteDownload):
+        make_downloader().detect_extension(part_path, "https://example.com/a.jpg", "image/jpeg")
@@ -0,0 +1,89 @@
+import os
+
+from util.llm_analyzer import LLMAnalyzer
+from util.local_classifier import LocalClassifier
+
+VALID = '{"sentiment": "积极", "summary": "摘要", "anomaly": "正常"}'
+FAILED = {"sentiment": "unknown", "summary": "", "anomaly": "unknown"}
+
+
+def make_analyzer(responses, **options):
+    """_call_llm_api依次返回responses中的值，请求的提示词记录在analyzer.prompts中"""
+    config = {"cache_enabled": False, "local_classifier": False}
+    config.update(options)
+    analyzer = LLMAnalyzer({"llm_config": config})
+    analyzer.prompts = []
+
+    def call(prompt, max_tokens=None):
+        analyzer.prompts.append(prompt)
+        return responses.pop(0) if responses else None
+
+    analyzer._call_llm_api = call
+    return analyzer
+
+
+def test_combined_api_failure_does_not_fall_back():
+    analyzer = make_analyzer([None])
+
+    assert analyzer.analyze_text("微博正文") == FAILED
+    assert len(analyzer.prompts) == 1
+
+
+def test_combined_parse_failure_falls_back():
+    analyzer = make_analyzer(["无法解析", "积极", "摘要", "正常"])
+
+    assert analyzer.analyze_text("微博正文") == {"sentiment": "积极", "summary": "摘要", "anomaly": "正常"}
+    assert len(analyzer.prompts) == 4
+
+
+def test_batch_api_failure_fails_once():
+    analyzer = make_analyzer([], batch_size=8)
+    items = [(str(i), "微博正文%d" % i) for i in range(8)]
+
+    results = analyzer.analyze_batch(items)
+
+    assert results == {weibo_id: FAILED for weibo_id, _ in items}
+    assert len(analyzer.prompts) == 1
+
+
+def test_batch_parse_failure_splits():
+    analyzer = make_analyzer(["无法解析", VALID, VALID], batch_size=2)
+
+    results = analyzer.analyze_batch([("1", "微博正文1"), ("2", "微博正文2")])
+
+    assert set(results) == {"1", "2"}
+    assert len(analyzer.prompts) == 3
+
+
+def test_cache_opened_lazily(tmp_path):
+    cache_path = str(tmp_path / "llm_cache.db")
+    analyzer = make_analyzer([VALID], cache_enabled=True, cache_path=cache_path)
+    assert not os.path.exists(cache_path)
+
+    first = analyzer.analyze_items([("1", "微博正文")])
+    second = analyzer.analyze_items([("2", "微博正文")])
+    analyzer.close()
+
+    assert os.path.exists(cache_path)
+    assert first["1"]["source"] == "llm"
+    assert second["2"]["source"] == "cache"
+    assert analyzer.cache is None
+    assert len(analyzer.prompts) == 1
+
+
+def test_model_of():
+    analyzer = make_analyzer([], model="test-model")
+
+    assert analyzer.model_of({"source": "llm"}) == "test-model"
+    assert analyzer.model_of({"source": "local"}) == "local_classifier"
+    assert analyzer.model_of({"source": "cache"}) == "test-model"
+    assert analyzer.model_of({}) is None
+
+
+def test_local_classifier_flips_negated_words():
+    classifier = LocalClassifier()
+
+    assert classifier.classify("不开心")["sentiment"] == "消极"
+    assert classifier.classify("今天一点也不难过")["sentiment"] == "积极"
+    # 积极词和被否定的积极词同时出现，情感不明确，交给LLM
+    assert classifier.classify("开心但不满意") is None
@@ -0,0 +1,147 @@
+import json
+import os
+import random
+
+import pytest
+from lxml import etree
+
+from benchmark import synthetic
+from benchmark.synthetic import DATA_DIR
+from util.html_extractor import extract
+
+LOCATION_ICON = "timeline_card_small_location_default.png"
+FRAGMENTS = [
+    '<span class="surl-text">#话题#</span>', '<a href="/n/张三">@张三</a>', '<a href="/n/李四">@王五</a>',
+    '<span class="url-icon"><img src="https://h5.sinaimg.cn/upload/2015/09/25/3/' + LOCATION_ICON + '"></span>',
+    '<span class="surl-text">北京·朝阳</span>', '<span><img src=""></span>', '<span><span>嵌套</span></span>',
+    '发布了头条文章', '<a data-url="http://t.cn/abc" href="https://m.weibo.cn/x">文章</a>', '<br />',
+    '&amp;', '&lt;', '&nbsp;', ' ', '\t', '\n', '\r\n', '　', '​', '\x00', '\x0b', '﻿',
+    '\x85', '@', '#', '#话题#', '@某人', '文字', 'abc', '>', '<p>段落</p>', '😀', '</span>',
+]
+
+
+def reference_extract(text_body, remove_html_tag):
+    """优化前用多个XPath分别提取各字段的实现"""
+    selector = etree.HTML(f"{text_body}<hr>" if text_body.isspace() else text_body)
+    if remove_html_tag:
+        text_list = selector.xpath("//text()")
+        merged = []
+        for i in range(len(text_list)):
+            if i > 0 and (text_list[i - 1].startswith(("@", "#")) or text_list[i].startswith(("@", "#"))):
+                merged[-1] += text_list[i]
+            else:
+                merged.append(text_list[i])
+        text = "\n".join(merged)
+    else:
+        text = text_body
+    article_url = ""
+    if selector.xpath("string(.)").startswith("发布了头条文章"):
+        url = selector.xpath("//a/@data-url")
+        if url and url[0].startswith("http://t.cn"):
+            article_url = url[0]
+    location = ""
+    span_list = selector.xpath("//span")
+    for i, span in enumerate(span_list):
+        if span.xpath("img/@src") and LOCATION_ICON in span.xpath("img/@src")[0]:
+            location = span_list[i + 1].xpath("string(.)")
+            break
+    topics = []
+    for span in selector.xpath("//span[@class='surl-text']"):
+        topic = span.xpath("string(.)")
+        if len(topic) > 2 and topic[0] == "#" and topic[-1] == "#":
+            topics.append(topic[1:-1])
+    at_users = []
+    for a in selector.xpath("//a"):
+        if "@" + a.xpath("@href")[0][3:] == a.xpath("string(.)"):
+            at_users.append(a.xpath("string(.)")[1:])
+    return text, article_url, location, ",".join(topics), ",".join(at_users)
+
+
+def recorded_texts():
+    texts = []
+
+    def walk(value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key in ("text", "longTextContent") and isinstance(item, str):
+                    texts.append(item)
+                else:
+                    walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    for name in sorted(os.listdir(DATA_DIR)):
+        if name.endswith(".json"):
+            with open(os.path.join(DATA_DIR, name), encoding="utf-8") as f:
+                walk(json.load(f))
+    return texts
+
+
+def generated_texts(count=3000, seed=1):
+    rng = random.Random(seed)
+    texts = []
+    user = synthetic.make_user(7)
+    for i in range(100):
+        mblog = synthetic.make_card(user, i, random.Random(i))["mblog"]
+        texts.append(mblog["text"])
+    for _ in range(count):
+        texts.append("".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 8))))
+    return texts
+
+
+@pytest.mark.parametrize("remove_html_tag", [True, False])
+def test_extract_matches_reference(remove_html_tag):
+    for text in recorded_texts() + generated_texts():
+        try:
+            expected = reference_extract(text, remove_html_tag)
+        except (AttributeError, IndexError, ValueError):
+            # 优化前的实现在正文为空、位置图标是最后一个span等情况下会出错
+            continue
+        assert extract(text, remove_html_tag) == expected, repr(text)
+
+
+def test_extract_plain_text_skips_parser():
+    assert extract("  普通微博@某人 #话题#") == ("普通微博@某人 #话题#", "", "", "", "")
+    assert extract("  普通微博", remove_html_tag=False) == ("  普通微博", "", "", "", "")
+
+
+def test_extract_fields():
+    text = (
+        '<a href="/n/张三">@张三</a> 你好<span class="surl-text">#话题#</span>'
+        '<span class="url-icon"><img src="https://h5.sinaimg.cn/' + LOCATION_ICON + '"></span>'
+        '<span class="surl-text">北京·朝阳</span>'
+    )
+
+    assert extract(text) == ("@张三 你好#话题#北京·朝阳", "", "北京·朝阳", "话题", "张三")
+
+
+@pytest.mark.parametrize("string, expected", [
+    (123, 123),
+    ("0", 0),
+    ("12345", 12345),
+    ("1万", 10000),
+    ("1.5万", 15000),
+    ("4.35万", 43500),
+    ("100万+", 1000000),
+    ("2亿", 200000000),
+    ("3.2亿", 320000000),
+    ("1.23456789亿", 123456789),
+    (".5万", 5000),
+])
+def test_string_to_int(replay_weibo, string, expected):
+    assert replay_weibo.string_to_int(string) == expected
+
+
+def test_string_to_int_matches_float_parsing_when_exact(replay_weibo):
+    """浮点计算没有误差时与优化前的float实现结果相同"""
+    for whole in range(0, 1000, 7):
+        for fraction in ("", ".5", ".25", ".125"):
+            for unit, multiple in (("万", 10000), ("亿", 100000000)):
+                string = "%d%s%s" % (whole, fraction, unit)
+                assert replay_weibo.string_to_int(string) == int(float(string[:-1]) * multiple)
+
+
+def test_string_to_int_rejects_invalid(replay_weibo):
+    with pytest.raises(ValueError):
+        replay_weibo.string_to_int("abc")
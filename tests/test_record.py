@@ -0,0 +1,99 @@
+import copy
+import json
+import pickle
+
+import pytest
+
+from util.record import FIELDS, ROW_FIELDS, WeiboBatch, WeiboRecord, WeiboRow, json_default, split_rows
+
+
+def make_record(weibo_id, retweet=None, **fields):
+    values = {name: "" for name in FIELDS if name not in ("retweet", "full_created_at")}
+    values.update(id=weibo_id, user_id="u1", text="正文" + weibo_id, created_at="2024-01-02",
+                  full_created_at="2024-01-02 10:00:00", attitudes_count=1, retweet=retweet)
+    values.update(fields)
+    return WeiboRecord(**values)
+
+
+def test_record_is_a_read_only_mapping():
+    record = make_record("1")
+
+    assert record["id"] == "1"
+    assert record.get("missing", "default") == "default"
+    assert "retweet" not in record
+    assert "full_created_at" in record
+    assert list(record) == [name for name in FIELDS if name != "retweet"]
+    assert len(record) == len(FIELDS) - 1
+    with pytest.raises(KeyError):
+        record["retweet"]
+    with pytest.raises(AttributeError):
+        record.text = "修改"
+    with pytest.raises(TypeError):
+        WeiboRecord(unknown=1)
+
+
+def test_record_items_and_values_follow_field_order():
+    record = make_record("1", full_created_at=None)
+
+    assert [key for key, _ in record.items()] == [name for name in FIELDS if name not in ("retweet", "full_created_at")]
+    assert record.values() == [value for _, value in record.items()]
+
+
+def test_record_to_dict_round_trip():
+    record = make_record("2", retweet=make_record("1"))
+    data = record.to_dict()
+
+    assert isinstance(data["retweet"], dict)
+    data["text"] = "修改"
+    assert record.text == "正文2"
+    assert WeiboRecord.from_dict(record.to_dict()).to_dict() == record.to_dict()
+
+
+def test_json_default_matches_to_dict():
+    record = make_record("2", retweet=make_record("1"))
+
+    text = json.dumps([record], ensure_ascii=False, default=json_default)
+
+    assert text == json.dumps([record.to_dict()], ensure_ascii=False)
+    with pytest.raises(TypeError):
+        json.dumps(object(), default=json_default)
+
+
+def test_record_replace_copy_and_pickle():
+    record = make_record("1")
+
+    changed = record.replace(text="新正文")
+    assert changed.text == "新正文" and record.text == "正文1"
+    assert copy.copy(record) is record
+    assert copy.deepcopy(record) is record
+    assert pickle.loads(pickle.dumps(record)).to_dict() == record.to_dict()
+
+
+def test_row_projection():
+    row = WeiboRow(make_record("2"), "1")
+
+    assert list(row.keys()) == list(ROW_FIELDS)
+    assert row["created_at"] == "2024-01-02 10:00:00"
+    assert row["retweet_id"] == "1"
+    assert dict(row) == dict(zip(row.keys(), row.values()))
+    assert "retweet" not in row
+    with pytest.raises(KeyError):
+        row["full_created_at"]
+
+
+def test_split_rows():
+    original = make_record("1")
+    weibos = [make_record("2", retweet=original), make_record("3")]
+
+    weibo_rows, retweet_rows = split_rows(weibos)
+
+    assert [(row["id"], row["retweet_id"]) for row in weibo_rows] == [("2", "1"), ("3", "")]
+    assert [(row["id"], row["retweet_id"]) for row in retweet_rows] == [("1", "")]
+    assert split_rows(weibos) is not split_rows(weibos)
+
+
+def test_split_rows_cached_on_batch():
+    batch = WeiboBatch([make_record("1")])
+
+    assert split_rows(batch) is split_rows(batch)
+    assert batch.fingerprints == {}
@@ -0,0 +1,96 @@
+import pytest
+
+pytest.importorskip("flask")
+
+import service  # noqa: E402
+
+
+@pytest.fixture
+def client(replay_weibo, monkeypatch):
+    """weibo表中有25条微博，其中id为100、104……的7条没有created_at"""
+    writer = replay_weibo.get_sqlite_writer()
+    for i in range(25):
+        writer.insert("weibo", {
+            "id": str(100 + i),
+            "bid": "bid%d" % i,
+            "user_id": "u1" if i % 2 else "u2",
+            "screen_name": "test",
+            "created_at": None if i % 4 == 0 else "2024-01-%02d 10:00:00" % (i % 5 + 1),
+        })
+    writer.flush()
+    monkeypatch.setattr(service, "DATABASE_PATH", replay_weibo.get_sqlte_path())
+    return service.app.test_client()
+
+
+def fetch_all(client, query):
+    ids = []
+    cursor = None
+    while True:
+        url = "/weibos?fields=id,created_at&" + query + ("&cursor=" + cursor if cursor else "")
+        data = client.get(url).get_json()
+        ids += [weibo["id"] for weibo in data["weibos"]]
+        cursor = data["next_cursor"]
+        if not cursor:
+            return ids
+
+
+def test_cursor_pages_through_all_rows(client):
+    ids = fetch_all(client, "limit=4")
+
+    assert sorted(ids) == [str(100 + i) for i in range(25)]
+    # 没有created_at的微博排在最后
+    assert ids[-7:] == sorted((str(100 + i) for i in range(0, 25, 4)), reverse=True)
+
+
+def test_cursor_with_user_id(client):
+    ids = fetch_all(client, "limit=3&user_id=u1")
+
+    assert sorted(ids) == [str(100 + i) for i in range(1, 25, 2)]
+
+
+def test_since_excludes_rows_without_created_at(client):
+    ids = fetch_all(client, "limit=5&since=2024-01-04")
+
+    assert sorted(ids) == sorted(str(100 + i) for i in range(25) if i % 4 and i % 5 + 1 >= 4)
+
+
+def test_first_page_has_no_cursor_when_complete(client):
+    data = client.get("/weibos?limit=100").get_json()
+
+    assert len(data["weibos"]) == 25
+    assert data["next_cursor"] is None
+
+
+def test_invalid_cursor(client):
+    response = client.get("/weibos?cursor=not-a-cursor")
+
+    assert response.status_code == 400
+
+
+def test_keyset_query_uses_index(replay_weibo):
+    connection = replay_weibo.get_sqlite_writer().connection
+    cursor = service.encode_cursor("2024-01-02 10:00:00", "110")
+    with service.app.test_request_context("/weibos?limit=10&cursor=" + cursor):
+        sql, params, _, _ = service.build_weibos_query(connection)
+
+    plan = " ".join(row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+    assert "idx_weibo_created_at_id" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.parametrize("tokenizer", ["trigram", "unicode61"])
+def test_search_with_tokenizer(replay_weibo, monkeypatch, tokenizer):
+    import weibo
+
+    # SQLite 3.34以前没有trigram分词，全文索引改用unicode61分词
+    monkeypatch.setattr(weibo.Weibo, "get_fts_tokenizer", lambda self, connection: tokenizer)
+    with replay_weibo.get_sqlite_writer().batch():
+        replay_weibo.sqlite_insert({"id": "1", "bid": "b1", "text": "今天去公园散步了"}, "weibo")
+        replay_weibo.sqlite_insert({"id": "2", "bid": "b2", "text": "在家看书"}, "weibo")
+    monkeypatch.setattr(service, "DATABASE_PATH", replay_weibo.get_sqlte_path())
+
+    data = service.app.test_client().get("/search?q=公园散步").get_json()
+
+    assert [result["id"] for result in data["results"]] == ["1"]
+    assert "<em>公园散步</em>" in data["results"][0]["snippet"]
@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+
+import pytest
+
+from util.sqlite_writer import SqliteWriter, migrate
+
+CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS item (
+    id integer PRIMARY KEY
+    ,name text NOT NULL
+);
+"""
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = SqliteWriter(str(tmp_path / "test.db"), CREATE_SQL)
+    yield writer
+    writer.close()
+
+
+def count(writer):
+    return writer.query_one("SELECT COUNT(*) FROM item")[0]
+
+
+def test_flush_writes_buffered_rows(writer):
+    writer.insert("item", {"id": 1, "name": "a"})
+    writer.insert("item", {"id": 2, "name": "b"})
+    assert count(writer) == 0
+
+    writer.flush()
+
+    assert count(writer) == 2
+
+
+def test_flush_failure_raises_and_rolls_back(writer):
+    writer.insert("item", {"id": 1, "name": "a"})
+    writer.insert("item", {"id": 2, "name": None})
+
+    with pytest.raises(sqlite3.IntegrityError):
+        writer.flush()
+
+    # 同一事务中写入成功的行也被回滚，不会只写入一半
+    assert count(writer) == 0
+    writer.insert("item", {"id": 3, "name": "c"})
+    writer.flush()
+    assert count(writer) == 1
+
+
+def test_flush_only_commits_current_thread(writer):
+    inserted = threading.Event()
+    flushed = threading.Event()
+
+    def other_thread():
+        writer.insert("item", {"id": 2, "name": "other"})
+        inserted.set()
+        flushed.wait()
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    inserted.wait()
+    writer.insert("item", {"id": 1, "name": "mine"})
+    writer.flush()
+    flushed.set()
+    thread.join()
+
+    assert writer.query_all("SELECT id FROM item") == [(1,)]
+
+
+def test_finished_thread_rows_are_not_committed(tmp_path):
+    path = str(tmp_path / "test.db")
+    writer = SqliteWriter(path, CREATE_SQL)
+    thread = threading.Thread(target=writer.insert, args=("item", {"id": 2, "name": "other"}))
+    thread.start()
+    thread.join()
+    writer.insert("item", {"id": 1, "name": "mine"})
+
+    writer.close()
+
+    connection = sqlite3.connect(path)
+    assert connection.execute("SELECT id FROM item").fetchall() == [(1,)]
+    connection.close()
+
+
+def test_batch_discards_rows_on_error(writer):
+    with pytest.raises(ValueError):
+        with writer.batch():
+            writer.insert("item", {"id": 1, "name": "a"})
+            raise ValueError
+
+    with writer.batch():
+        writer.insert("item", {"id": 2, "name": "b"})
+
+    assert writer.query_all("SELECT id FROM item") == [(2,)]
+
+
+def test_migrate_rolls_back_failed_version(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / "test.db"))
+    connection.executescript(CREATE_SQL)
+    migrations = [
+        "CREATE INDEX idx_item_name ON item(name);",
+        "ALTER TABLE item ADD COLUMN size integer; INSERT INTO missing VALUES(1);",
+    ]
+
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(connection, migrations)
+
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == 1
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(item)")]
+    assert "size" not in columns
+    connection.close()
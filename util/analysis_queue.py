@@ -0,0 +1,53 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("weibo")
+
+
+class AnalysisQueue:
+    """在后台线程中用LLM分析微博
+
+    爬取线程只提交(id, 正文)并立即返回，爬取速度不受LLM接口延迟影响。
+    同时进行的分析请求不超过max_workers个；积压的批次超过max_pending时
+    submit会阻塞，避免内存无限增长。每批的结果交给save保存。
+    """
+
+    def __init__(self, analyzer, save, max_workers=2, max_pending=64):
+        self.analyzer = analyzer
+        self.save = save
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="llm"
+        )
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self.analyzed_count = 0
+        self.failed_count = 0
+
+    def submit(self, items):
+        """提交(id, 正文)列表，按analyzer.batch_size分批后在后台分析"""
+        batch_size = self.analyzer.batch_size
+        for i in range(0, len(items), batch_size):
+            self._slots.acquire()
+            self._executor.submit(self._run, items[i : i + batch_size])
+
+    def _run(self, items):
+        try:
+            results = self.analyzer.analyze_items(items)
+            self.save(results)
+            with self._lock:
+                self.analyzed_count += len(results)
+                self.failed_count += len(items) - len(results)
+        except Exception as e:
+            with self._lock:
+                self.failed_count += len(items)
+            logger.exception(e)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """等待已提交的分析全部完成"""
+        self._executor.shutdown(wait=True)
+        logger.info(
+            "LLM分析完成%d条微博，失败%d条", self.analyzed_count, self.failed_count
+        )
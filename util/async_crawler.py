@@ -0,0 +1,94 @@
+import asyncio
+import copy
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from util import tracing
+
+logger = logging.getLogger("weibo")
+
+
+class AsyncCrawler:
+    """在一个事件循环中并发爬取多个用户
+
+    每个用户使用一个独立的Weibo副本保存爬取状态，副本之间共享session，
+    因此同一host的并发数和请求间隔由session上挂载的HostThrottle统一控制。
+    Weibo中阻塞的requests调用放到线程池中执行。
+    """
+
+    def __init__(self, wb, max_concurrent_users=8):
+        self.wb = wb
+        self.max_concurrent_users = max(1, int(max_concurrent_users))
+        self._config_file_lock = None  # 多个用户共用一个user_id_list.txt，需要串行更新
+
+    def run(self):
+        asyncio.run(self._run())
+
+    def get_jobs(self):
+        """将user_config_list展开为(user_config, query)任务列表"""
+        jobs = []
+        for user_config in self.wb.user_config_list:
+            if len(user_config["query_list"]):
+                for query in user_config["query_list"]:
+                    jobs.append((user_config, query))
+            else:
+                jobs.append((user_config, ""))
+        return jobs
+
+    def fork(self, user_config, query):
+        """为一个用户生成独立的Weibo副本"""
+        worker = copy.copy(self.wb)
+        worker.query = query
+        worker.initialize_info(user_config)
+        return worker
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrent_users)
+        loop.set_default_executor(executor)
+        self._config_file_lock = asyncio.Lock()
+        semaphore = asyncio.Semaphore(self.max_concurrent_users)
+        jobs = self.get_jobs()
+        logger.info("并发爬取%d个任务，最多同时爬取%d个用户", len(jobs), self.max_concurrent_users)
+        coroutines = [
+            self._crawl_user(semaphore, user_config, query)
+            for user_config, query in jobs
+        ]
+        try:
+            for future in tqdm(asyncio.as_completed(coroutines), total=len(coroutines), desc="Users"):
+                await future
+        finally:
+            executor.shutdown(wait=True)
+
+    async def _crawl_user(self, semaphore, user_config, query):
+        async with semaphore:
+            worker = self.fork(user_config, query)
+            # 每个任务有独立的context，其中to_thread调用的span都计入该用户
+            tracing.set_user(user_config["user_id"])
+            try:
+                await self.get_pages(worker)
+            except Exception as e:
+                logger.exception(e)
+                return
+            logger.info("信息抓取完毕")
+            logger.info("*" * 100)
+            if worker.user_config_file_path and worker.user:
+                async with self._config_file_lock:
+                    await asyncio.to_thread(
+                        worker.update_user_config_file, worker.user_config_file_path
+                    )
+
+    async def get_pages(self, worker):
+        """与Weibo.get_pages相同，从iter_batches逐批取出微博并写入"""
+        pages = await asyncio.to_thread(worker.prepare_pages)
+        if pages is None:
+            return
+        batches = worker.iter_batches(pages)
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            await asyncio.to_thread(worker.write_data, batch)
+        logger.info("%s 微博爬取完成，共爬取%d条微博", worker.user["screen_name"], worker.got_count)
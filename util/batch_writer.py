@@ -0,0 +1,38 @@
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("weibo")
+
+
+class BatchWriter:
+    """在后台线程中按顺序写入一批批微博
+
+    爬取线程把一批微博交给submit后即可继续爬取下一页，写入（包括下载图片、视频和评论）
+    与爬取同时进行。尚未写完的批次超过max_pending时submit会阻塞，因此内存中最多
+    只有max_pending + 1批微博；一批写完后不再被引用，随即释放。
+    """
+
+    def __init__(self, write, max_pending=2):
+        self.write = write
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+
+    def submit(self, batch):
+        self._slots.acquire()
+        # 复制当前context，写入时的耗时统计仍计入当前用户
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._run, batch)
+
+    def _run(self, batch):
+        try:
+            self.write(batch)
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """等待已提交的批次全部写完"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,58 @@
+import hashlib
+import os
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class BlobStore:
+    """按内容sha256寻址的文件存储
+
+    文件保存在root/<sha256前两位>/<sha256>，内容相同的文件只保存一份。
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def exists(self, sha256):
+        return os.path.isfile(self.path_for(sha256))
+
+    def _commit(self, temp_path, sha256):
+        """把已写好的临时文件放到sha256对应的位置，已存在时丢弃临时文件"""
+        target = self.path_for(sha256)
+        if os.path.isfile(target):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(temp_path, target)
+        return sha256
+
+    def _temp_file(self):
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        return os.fdopen(fd, "wb"), temp_path
+
+    def put_file(self, file_path):
+        """存入一个已有文件，返回(sha256, 字节数)"""
+        digest = hashlib.sha256()
+        size = 0
+        f_out, temp_path = self._temp_file()
+        with f_out, open(file_path, "rb") as f_in:
+            for chunk in iter(lambda: f_in.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f_out.write(chunk)
+                size += len(chunk)
+        return self._commit(temp_path, digest.hexdigest()), size
+
+    def put_bytes(self, data):
+        """存入一段二进制数据，返回(sha256, 字节数)"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if self.exists(sha256):
+            return sha256, len(data)
+        f_out, temp_path = self._temp_file()
+        with f_out:
+            f_out.write(data)
+        return self._commit(temp_path, sha256), len(data)
@@ -0,0 +1,317 @@
+import logging
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from tqdm import tqdm
+
+from util import metrics
+
+logger = logging.getLogger("weibo")
+
+CHUNK_SIZE = 64 * 1024
+JPEG_HEADER = b'\xFF\xD8\xFF'
+JPEG_TRAILER = b'\xff\xd9'
+PNG_HEADER = b'\x89PNG\r\n\x1A\n'
+PNG_TRAILER = b'IEND\xaeB`\x82'
+# 无法从文件内容判断类型时，根据Content-Type确定扩展名
+CONTENT_TYPE_EXTENSIONS = [
+    ('image/jpeg', '.jpg'),
+    ('image/png', '.png'),
+    ('video/mp4', '.mp4'),
+    ('video/quicktime', '.mov'),
+    ('video/webm', '.webm'),
+    ('image/gif', '.gif'),
+]
+
+
+class IncompleteDownload(Exception):
+    """文件下载完成但内容不完整"""
+
+
+class MediaDownloader:
+    """图片、视频下载线程池
+
+    所有下载共用一个带连接池的session，同一个CDN host同时使用的连接数（包括分段下载的各分段）
+    不超过host_max_concurrency。CDN不受微博接口的频率限制，因此不经过限速器。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config.get("download_config") or {}
+        self.max_workers = max(1, int(self.config.get("max_workers", 8)))
+        self.host_max_concurrency = max(1, int(self.config.get("host_max_concurrency", 4)))
+        # 大视频分段并发下载：每个文件使用的连接数，1表示不分段
+        self.range_connections = max(1, int(self.config.get("range_connections", 1)))
+        # 大于该字节数的视频才分段下载
+        self.range_min_size = int(self.config.get("range_min_size", 16 * 1024 * 1024))
+        self.session = requests.Session()
+        pool_size = self.max_workers * self.range_connections
+        adapter = HTTPAdapter(
+            max_retries=5, pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).hostname or ""
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.host_max_concurrency)
+                self._host_semaphores[host] = semaphore
+        return semaphore
+
+    @contextmanager
+    def host_slot(self, url):
+        """占用url所在host的一个下载名额"""
+        with self._host_semaphore(url):
+            yield
+
+    @contextmanager
+    def extra_host_slots(self, url, count):
+        """在已占用一个名额的基础上，不等待地再占用url所在host最多count个名额，返回实际占用的数量
+
+        不等待是为了避免多个分段下载各自占着一个名额、互相等待其余名额而死锁。
+        """
+        semaphore = self._host_semaphore(url)
+        acquired = 0
+        while acquired < count and semaphore.acquire(blocking=False):
+            acquired += 1
+        try:
+            yield acquired
+        finally:
+            for _ in range(acquired):
+                semaphore.release()
+
+    def detect_extension(self, part_path, url, content_type):
+        """根据文件头尾的Magic Number判断文件类型，返回扩展名
+
+        文件头为JPEG/PNG但文件尾不完整时抛出IncompleteDownload。
+        """
+        with open(part_path, "rb") as f:
+            head = f.read(len(PNG_HEADER))
+            if head.startswith(JPEG_HEADER):
+                f.seek(-len(JPEG_TRAILER), os.SEEK_END)
+                if f.read() != JPEG_TRAILER:
+                    raise IncompleteDownload("JPEG 文件不完整")
+                return '.jpg'
+            if head.startswith(PNG_HEADER):
+                f.seek(-len(PNG_TRAILER), os.SEEK_END)
+                if f.read() != PNG_TRAILER:
+                    raise IncompleteDownload("PNG 文件不完整")
+                return '.png'
+        # 其他类型，使用原有逻辑处理
+        url_path = url.split('?')[0]  # 去除URL中的参数
+        inferred_extension = os.path.splitext(url_path)[1].lower().strip('.')
+        if inferred_extension in ['mp4', 'mov', 'webm', 'gif', 'bmp', 'tiff']:
+            return '.' + inferred_extension
+        content_type = content_type.lower()
+        for type_name, extension in CONTENT_TYPE_EXTENSIONS:
+            if type_name in content_type:
+                return extension
+        # 使用原有的扩展名，如果无法确定
+        return '.' + inferred_extension if inferred_extension else ''
+
+    def _stream_to_file(self, url, part_path, headers):
+        """把url的内容追加写入part_path，已有部分用Range请求跳过，返回Content-Type"""
+        offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+        request_headers = dict(headers)
+        if offset:
+            request_headers["Range"] = "bytes=%d-" % offset
+        with self.session.get(
+            url, headers=request_headers, timeout=(5, 10), verify=False, stream=True
+        ) as response:
+            if offset and response.status_code == 416:
+                # 临时文件已经完整
+                return response.headers.get('Content-Type', '')
+            response.raise_for_status()
+            if offset and response.status_code != 206:
+                # 服务器不支持断点续传，从头下载
+                offset = 0
+            expected = response.headers.get('Content-Length')
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    metrics.DOWNLOADED_BYTES.inc(len(chunk))
+            # Content-Length是传输的字节数，与raw.tell()比较以兼容压缩传输
+            received = response.raw.tell()
+            if expected is not None and received < int(expected):
+                raise IncompleteDownload(
+                    "下载中断，已下载%d/%s字节" % (received, expected)
+                )
+            return response.headers.get('Content-Type', '')
+
+    def probe_size(self, url, headers):
+        """请求第一个字节，服务器支持Range时返回文件总大小，否则返回None"""
+        request_headers = dict(headers)
+        request_headers["Range"] = "bytes=0-0"
+        try:
+            with self.session.get(
+                url, headers=request_headers, timeout=(5, 10), verify=False, stream=True
+            ) as response:
+                content_range = response.headers.get('Content-Range', '')
+                if response.status_code != 206 or '/' not in content_range:
+                    return None
+                if response.headers.get('Accept-Ranges', 'bytes') != 'bytes':
+                    return None
+                total = content_range.rsplit('/', 1)[1]
+                return int(total) if total.isdigit() else None
+        except RequestException:
+            return None
+
+    def _fetch_range(self, url, path, headers, start, end):
+        """下载[start, end]字节并写入path的对应位置，返回(Content-Type, 下载的字节数)"""
+        request_headers = dict(headers)
+        request_headers["Range"] = "bytes=%d-%d" % (start, end)
+        with self.session.get(
+            url, headers=request_headers, timeout=(5, 10), verify=False, stream=True
+        ) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise IncompleteDownload("服务器未返回分段内容")
+            position = start
+            with open(path, "r+b") as f:
+                f.seek(start)
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    position += len(chunk)
+                    metrics.DOWNLOADED_BYTES.inc(len(chunk))
+            if position != end + 1:
+                raise IncompleteDownload(
+                    "分段%d-%d不完整，已下载%d字节" % (start, end, position - start)
+                )
+            return response.headers.get('Content-Type', ''), position - start
+
+    def _fetch_ranges(self, url, path, headers, total, connections):
+        """预分配文件后用connections个连接并发下载各分段，返回Content-Type"""
+        with open(path, "wb") as f:
+            f.truncate(total)
+        part_size = int(math.ceil(total / connections))
+        ranges = [
+            (start, min(start + part_size, total) - 1)
+            for start in range(0, total, part_size)
+        ]
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [
+                executor.submit(self._fetch_range, url, path, headers, start, end)
+                for start, end in ranges
+            ]
+            results = [future.result() for future in futures]
+        # 文件已预分配为total字节，只能按各分段实际收到的字节数判断是否完整
+        received = sum(size for _, size in results)
+        if received != total:
+            raise IncompleteDownload("共下载%d字节，与Content-Length %d不一致" % (received, total))
+        return results[0][0]
+
+    def _finish(self, part_path, file_path, url, content_type):
+        """检查临时文件并重命名为最终文件，返回最终路径"""
+        try:
+            extension = self.detect_extension(part_path, url, content_type)
+        except IncompleteDownload:
+            # 内容本身损坏，续传无法修复，删除后重新下载
+            os.remove(part_path)
+            raise
+        if extension:
+            file_path = re.sub(r'\.\w+$', extension, file_path)
+        if os.path.isfile(file_path):
+            os.remove(part_path)
+        else:
+            os.replace(part_path, file_path)
+            logger.debug("[DEBUG] save " + file_path)
+        return file_path
+
+    def fetch_ranged(self, url, file_path, headers):
+        """大文件分段并发下载，不支持或失败时返回None，由调用方改为顺序下载
+
+        调用方（run中的下载任务）已占用一个host名额，其余分段各占用一个名额；
+        同一host没有空闲名额时不分段，使总连接数不超过host_max_concurrency。
+        """
+        if self.range_connections <= 1 or os.path.isfile(file_path + ".part"):
+            return None
+        total = self.probe_size(url, headers)
+        if not total or total < self.range_min_size:
+            return None
+        # 分段下载的临时文件是预分配的，不能用于顺序下载的续传，因此使用单独的文件名
+        ranges_path = file_path + ".ranges"
+        with self.extra_host_slots(url, self.range_connections - 1) as extra:
+            if not extra:
+                return None
+            try:
+                content_type = self._fetch_ranges(url, ranges_path, headers, total, extra + 1)
+                file_path = self._finish(ranges_path, file_path, url, content_type)
+                logger.debug(f"[DEBUG] success {url} in {extra + 1} ranges")
+                return file_path
+            except (RequestException, IncompleteDownload) as e:
+                logger.debug(f"[DEBUG] 分段下载失败，改为顺序下载: {url} {e}")
+                if os.path.isfile(ranges_path):
+                    os.remove(ranges_path)
+                return None
+
+    def fetch(self, url, file_path, headers, max_try_count=3, ranged=False):
+        """流式下载url，返回实际保存路径，失败返回None
+
+        内容先写入file_path + ".part"，内存占用与文件大小无关；连接中断时
+        保留临时文件，下次重试（包括下次运行）用Range请求续传。下载完成后
+        根据文件内容调整扩展名，再原子地重命名为最终文件。
+        ranged为True时，支持Range的大文件先尝试分段并发下载。
+        """
+        if ranged:
+            saved_path = self.fetch_ranged(url, file_path, headers)
+            if saved_path:
+                return saved_path
+        part_path = file_path + ".part"
+        for try_count in range(1, max_try_count + 1):
+            if try_count > 1:
+                metrics.RETRIES.inc(operation="download")
+            try:
+                content_type = self._stream_to_file(url, part_path, headers)
+                file_path = self._finish(part_path, file_path, url, content_type)
+                logger.debug("[DEBUG] success " + url + "  " + str(try_count))
+                return file_path
+            except IncompleteDownload as e:
+                logger.debug(f"[DEBUG] {e}: {url} ({try_count}/{max_try_count})")
+            except RequestException as e:
+                logger.error(f"[ERROR] 请求失败，错误信息：{e}。尝试次数：{try_count}/{max_try_count}")
+                metrics.SLEEP_SECONDS.inc(2 ** try_count, reason="retry")
+                time.sleep(2 ** try_count)  # 指数退避
+        return None
+
+    def _download(self, download_one, task):
+        url = task[0]
+        with self.host_slot(url):
+            return download_one(*task)
+
+    def run(self, tasks, download_one, desc="Download progress"):
+        """并发执行下载任务
+
+        tasks中每一项为传给download_one的参数元组，第一个参数为url；
+        download_one返回是否下载成功。返回成功和失败的数量。
+        """
+        success_count = 0
+        failed_count = 0
+        if not tasks:
+            return success_count, failed_count
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._download, download_one, task) for task in tasks]
+            for future in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                try:
+                    success = future.result()
+                except Exception as e:
+                    logger.exception(e)
+                    success = False
+                if success:
+                    success_count += 1
+                else:
+                    failed_count += 1
+        return success_count, failed_count
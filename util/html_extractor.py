@@ -0,0 +1,76 @@
+import re
+
+from lxml import etree
+
+LOCATION_ICON = "timeline_card_small_location_default.png"
+
+# 预编译的XPath，避免每条微博重新解析XPath表达式
+_TEXT = etree.XPath("//text()", smart_strings=False)
+_STRING = etree.XPath("string()", smart_strings=False)
+
+# 含有这些字符时正文可能包含标签或实体，或者会被lxml删除、替换，只能交给lxml解析
+_NEEDS_PARSER = re.compile("[<&\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufdd0-\ufdef\ufeff\ufffe\uffff]")
+# lxml会去掉文档开头的这些空白
+_LEADING_SPACE = " \t\n\r"
+
+
+def merge_text(text_list):
+    """合并正文中的文本节点，以@或#开头的节点与前一个节点合并，否则会带来没有必要的换行"""
+    text_list_modified = []
+    for ele in range(len(text_list)):
+        if ele > 0 and (text_list[ele - 1].startswith(("@", "#")) or text_list[ele].startswith(("@", "#"))):
+            text_list_modified[-1] += text_list[ele]
+        else:
+            text_list_modified.append(text_list[ele])
+    return "\n".join(text_list_modified)
+
+
+def extract(text_body, remove_html_tag=True):
+    """从微博正文中提取信息，返回(正文, 头条文章url, 位置, 话题, @用户)
+
+    不含HTML的正文（大部分微博如此）不经过lxml，直接得到与lxml相同的结果；
+    其余正文只解析一次，一次遍历其中的span和a标签得到位置、话题、@用户和文章url。
+    """
+    if not _NEEDS_PARSER.search(text_body) and text_body and not text_body.isspace():
+        text = text_body.lstrip(_LEADING_SPACE) if remove_html_tag else text_body
+        return text, "", "", "", ""
+
+    selector = etree.HTML(f"{text_body}<hr>" if text_body.isspace() else text_body)
+    text_list = _TEXT(selector)
+    text = merge_text(text_list) if remove_html_tag else text_body
+
+    location = ""
+    location_next = False  # 上一个span是位置图标，位置为其后的span
+    location_found = False
+    topic_list = []
+    at_list = []
+    data_url = None
+    for element in selector.iter("span", "a"):
+        if element.tag == "span":
+            if location_next:
+                location = _STRING(element)
+                location_next = False
+                location_found = True
+            elif not location_found:
+                for img in element.iterchildren("img"):
+                    src = img.get("src")
+                    if src is not None:
+                        location_next = LOCATION_ICON in src
+                        break
+            if element.get("class") == "surl-text":
+                topic = _STRING(element)
+                if len(topic) > 2 and topic[0] == "#" and topic[-1] == "#":
+                    topic_list.append(topic[1:-1])
+        else:
+            if data_url is None:
+                data_url = element.get("data-url")
+            href = element.get("href")
+            if href is not None:
+                name = _STRING(element)
+                if "@" + href[3:] == name:
+                    at_list.append(name[1:])
+
+    article_url = ""
+    if data_url and data_url.startswith("http://t.cn") and "".join(text_list).startswith("发布了头条文章"):
+        article_url = data_url
+    return text, article_url, location, ",".join(topic_list), ",".join(at_list)
@@ -1,10 +1,120 @@
+import hashlib
 import json
 import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+
+from util import metrics
+from util.local_classifier import LocalClassifier
 
 logger = logging.getLogger(__name__)
 
+SENTIMENT_LABELS = ("积极", "中性", "消极")
+ANOMALY_LABELS = ("正常", "异常")
+# 批量分析时每条微博除正文外的提示词开销，以及每条结果预留的输出token数
+BATCH_ITEM_OVERHEAD_TOKENS = 20
+BATCH_OUTPUT_TOKENS_PER_ITEM = 150
+# 修改提示词或结果格式时需要增加版本号，使旧的缓存失效
+PROMPT_VERSION = 1
+# 每写入这么多条缓存检查一次是否需要淘汰
+CACHE_EVICT_INTERVAL = 1000
+
+
+def normalize_text(text: str) -> str:
+    """统一全半角和空白，内容相同但格式略有差异的微博共用缓存"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class LLMCache:
+    """LLM分析结果的SQLite缓存
+
+    键为(规范化正文的sha256, 模型, 提示词版本)。超过ttl_days天的结果视为过期；
+    条数超过max_entries时按最近访问时间淘汰最久未用的结果。可被多个线程共享。
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl_days: float = 30):
+        file_dir = os.path.dirname(path)
+        if file_dir and not os.path.isdir(file_dir):
+            os.makedirs(file_dir)
+        self.max_entries = max_entries
+        self.ttl = ttl_days * 24 * 3600
+        self.hit_count = 0
+        self.miss_count = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                text_hash char(64) NOT NULL
+                ,model varchar(64) NOT NULL
+                ,prompt_version varchar(64) NOT NULL
+                ,result text NOT NULL
+                ,created_at REAL NOT NULL
+                ,accessed_at REAL NOT NULL
+                ,PRIMARY KEY (text_hash, model, prompt_version)
+            );
+            CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed_at ON llm_cache(accessed_at);
+            """
+        )
+
+    def get_many(self, keys: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+        """查询多个键，返回命中且未过期的结果，并更新其访问时间"""
+        now = time.time()
+        results = {}
+        with self._lock, self.connection:
+            for key in keys:
+                row = self.connection.execute(
+                    "SELECT result, created_at FROM llm_cache WHERE text_hash=? AND model=? AND prompt_version=?",
+                    key,
+                ).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    results[key] = json.loads(row[0])
+                    self.connection.execute(
+                        "UPDATE llm_cache SET accessed_at=? WHERE text_hash=? AND model=? AND prompt_version=?",
+                        (now,) + key,
+                    )
+            self.hit_count += len(results)
+            self.miss_count += len(keys) - len(results)
+        return results
+
+    def put_many(self, results: Dict[Tuple[str, str, str], Dict[str, Any]]) -> None:
+        now = time.time()
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO llm_cache VALUES(?, ?, ?, ?, ?, ?)",
+                [key + (json.dumps(result, ensure_ascii=False), now, now) for key, result in results.items()],
+            )
+            self._puts_since_evict += len(results)
+            if self._puts_since_evict >= CACHE_EVICT_INTERVAL:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """删除过期的结果，再按访问时间删除超出条数上限的结果"""
+        self._puts_since_evict = 0
+        self.connection.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+        self.connection.execute(
+            """DELETE FROM llm_cache WHERE rowid IN (
+                SELECT rowid FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+            (self.max_entries,),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            with self.connection:
+                self._evict(time.time())
+            self.connection.close()
+        logger.info(f"LLM缓存命中{self.hit_count}条，未命中{self.miss_count}条")
+
+
 class LLMAnalyzer:
     def __init__(self, config: Dict[str, Any]):
         self.config = config.get('llm_config', {})
@@ -14,15 +124,31 @@ class LLMAnalyzer:
         self.enable_sentiment = self.config.get('enable_sentiment_analysis', True)
         self.enable_summary = self.config.get('enable_summary', True)
         self.enable_anomaly = self.config.get('enable_anomaly_detection', True)
+        # 合并模式：一次请求返回所有已启用的分析结果，解析失败时再逐项请求
+        self.combined_mode = self.config.get('combined_mode', True)
+        # 批量模式：一次请求分析多条微博，每批不超过batch_size条，正文估计不超过batch_token_budget个token
+        self.batch_size = max(1, int(self.config.get('batch_size', 10)))
+        self.batch_token_budget = int(self.config.get('batch_token_budget', 2000))
+        # 后台同时进行的分析请求数，以及单次请求的超时秒数
+        self.max_workers = max(1, int(self.config.get('max_workers', 2)))
+        self.timeout = self.config.get('timeout', 60)
+        # 本地分析：表情、转发、广告等简单的微博不请求LLM
+        self.local_classifier = LocalClassifier() if self.config.get('local_classifier', True) else None
+        # 分析结果缓存，相同内容的微博不再重复请求。第一次查询时才打开缓存数据库
+        self.cache_enabled = self.config.get('cache_enabled', True)
+        self.cache = None
+        self._cache_lock = threading.Lock()
         
         # 添加初始化日志
         logger.info("LLM分析器初始化完成")
         logger.info(f"API基础URL: {self.api_base}")
         logger.info(f"模型: {self.model}")
-        logger.info(f"功能状态 - 情感分析: {self.enable_sentiment}, 摘要生成: {self.enable_summary}, 异常检测: {self.enable_anomaly}")
+        logger.info(f"功能状态 - 情感分析: {self.enable_sentiment}, 摘要生成: {self.enable_summary}, 异常检测: {self.enable_anomaly}, 合并请求: {self.combined_mode}")
         
-    def _call_llm_api(self, prompt: str) -> Optional[str]:
+    def _call_llm_api(self, prompt: str, max_tokens: Optional[int] = None) -> Optional[str]:
         """调用 LLM API"""
+        start = time.perf_counter()
+        status = "error"
         try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -32,18 +158,21 @@ class LLMAnalyzer:
             data = {
                 "model": self.model,
                 "messages": [{"role": "user", "content": prompt}],
-                "max_tokens": self.config.get('max_tokens', 1000),
+                "max_tokens": max_tokens or self.config.get('max_tokens', 1000),
                 "temperature": self.config.get('temperature', 0.7)
             }
             
             response = requests.post(
                 f"{self.api_base}/chat/completions",
                 headers=headers,
-                json=data
+                json=data,
+                timeout=self.timeout
             )
             
             if response.status_code == 200:
-                return response.json()['choices'][0]['message']['content']
+                content = response.json()['choices'][0]['message']['content']
+                status = "ok"
+                return content
             else:
                 logger.error(f"LLM API 调用失败: {response.status_code} - {response.text}")
                 return None
@@ -51,6 +180,8 @@ class LLMAnalyzer:
         except Exception as e:
             logger.error(f"调用 LLM API 时发生错误: {str(e)}")
             return None
+        finally:
+            metrics.LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, status=status)
 
     def analyze_sentiment(self, text: str) -> Dict[str, Any]:
         """情感分析"""
@@ -86,12 +217,100 @@ class LLMAnalyzer:
         result = self._call_llm_api(prompt)
         return {"anomaly": result.strip() if result else "unknown"}
 
-    def analyze_weibo(self, weibo_data: Dict[str, Any]) -> Dict[str, Any]:
-        """综合分析微博内容"""
-        text = weibo_data.get('text', '')
-        if not text:
-            return weibo_data
-            
+    def _enabled_fields(self) -> Dict[str, str]:
+        """已启用的分析项及其在合并请求中的说明"""
+        fields = {}
+        if self.enable_sentiment:
+            fields["sentiment"] = "情感倾向，只能是“积极”“中性”“消极”之一"
+        if self.enable_summary:
+            fields["summary"] = "不超过50字的简短摘要"
+        if self.enable_anomaly:
+            fields["anomaly"] = "是否存在异常（如谣言、广告或敏感信息），正常时为“正常”，异常时为“异常：原因”"
+        return fields
+
+    def _disabled_results(self) -> Dict[str, Any]:
+        results = {}
+        if not self.enable_sentiment:
+            results["sentiment"] = "disabled"
+        if not self.enable_summary:
+            results["summary"] = "disabled"
+        if not self.enable_anomaly:
+            results["anomaly"] = "disabled"
+        return results
+
+    def _failed_results(self) -> Dict[str, Any]:
+        """接口请求失败时的结果，与逐项请求失败时相同"""
+        results = {}
+        if self.enable_sentiment:
+            results["sentiment"] = "unknown"
+        if self.enable_summary:
+            results["summary"] = ""
+        if self.enable_anomaly:
+            results["anomaly"] = "unknown"
+        results.update(self._disabled_results())
+        return results
+
+    @staticmethod
+    def _parse_json(result: str) -> Optional[Any]:
+        """从模型输出中取出JSON，兼容```json代码块和前后多余的文字"""
+        match = re.search(r"[\[{].*[\]}]", result, re.S)
+        if not match:
+            return None
+        try:
+            return json.loads(match.group(0))
+        except ValueError:
+            return None
+
+    def _validate_analysis(self, data: Any) -> Optional[Dict[str, Any]]:
+        """按已启用的分析项校验合并请求的结果，不符合时返回None"""
+        if not isinstance(data, dict):
+            return None
+        fields = self._enabled_fields()
+        results = {}
+        for field in fields:
+            value = data.get(field)
+            if not isinstance(value, str):
+                return None
+            value = value.strip()
+            if field == "sentiment" and value not in SENTIMENT_LABELS:
+                return None
+            if field == "anomaly" and not value.startswith(ANOMALY_LABELS):
+                return None
+            results[field] = value
+        return results
+
+    def analyze_combined(self, text: str) -> Optional[Dict[str, Any]]:
+        """一次请求完成所有已启用的分析
+
+        结果无法解析或校验失败时返回None；接口请求失败时返回unknown结果，
+        此时逐项请求多半同样失败，不再重试。
+        """
+        fields = self._enabled_fields()
+        if not fields:
+            return self._disabled_results()
+        field_lines = "\n".join(f'- "{name}": {desc}' for name, desc in fields.items())
+        prompt = f"""请分析以下微博内容，只返回一个JSON对象，不要输出其他内容。JSON对象包含以下字段：
+{field_lines}
+微博内容：
+        {text}"""
+
+        result = self._call_llm_api(prompt)
+        if not result:
+            return self._failed_results()
+        results = self._validate_analysis(self._parse_json(result))
+        if results is None:
+            logger.warning(f"合并分析结果无法解析，改为逐项分析: {result[:200]}")
+            return None
+        results.update(self._disabled_results())
+        return results
+
+    def analyze_text(self, text: str) -> Dict[str, Any]:
+        """分析一条微博正文，合并请求的结果无法解析时逐项请求"""
+        if self.combined_mode:
+            analysis_results = self.analyze_combined(text)
+            if analysis_results is not None:
+                return analysis_results
+
         analysis_results = {}
         
         # 情感分析
@@ -105,7 +324,208 @@ class LLMAnalyzer:
         # 异常检测
         anomaly_result = self.detect_anomaly(text)
         analysis_results.update(anomaly_result)
-        
+        return analysis_results
+
+    def analyze_weibo(self, weibo_data: Dict[str, Any]) -> Dict[str, Any]:
+        """综合分析微博内容"""
+        text = weibo_data.get('text', '')
+        if not text:
+            return weibo_data
+
         # 将分析结果添加到原始数据中
-        weibo_data['llm_analysis'] = analysis_results
-        return weibo_data 
\ No newline at end of file
+        weibo_id = str(weibo_data.get('id'))
+        weibo_data['llm_analysis'] = self.analyze_items([(weibo_id, text)])[weibo_id]
+        return weibo_data
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """粗略估计token数：中文约每字1个token，英文约每4个字符1个token"""
+        return len(text.encode('utf-8')) // 3 + 1
+
+    def _make_batches(self, items: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        """按条数和token预算把(id, 正文)分批，超出预算的单条微博单独成批"""
+        batches = []
+        batch = []
+        tokens = 0
+        for weibo_id, text in items:
+            cost = self.estimate_tokens(text) + BATCH_ITEM_OVERHEAD_TOKENS
+            if batch and (len(batch) >= self.batch_size or tokens + cost > self.batch_token_budget):
+                batches.append(batch)
+                batch = []
+                tokens = 0
+            batch.append((weibo_id, text))
+            tokens += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _analyze_batch_once(self, batch: List[Tuple[str, str]]) -> Optional[Dict[str, Dict[str, Any]]]:
+        """一次请求分析一批微博，只返回格式正确的结果，接口请求失败时返回None"""
+        fields = self._enabled_fields()
+        field_lines = "\n".join(f'- "{name}": {desc}' for name, desc in fields.items())
+        weibos = json.dumps(
+            [{"id": weibo_id, "text": text} for weibo_id, text in batch], ensure_ascii=False
+        )
+        prompt = f"""请逐条分析以下JSON数组中的微博内容，只返回一个JSON对象，不要输出其他内容。
+JSON对象的键为微博的id，值为该微博的分析结果，包含以下字段：
+{field_lines}
+微博列表：
+{weibos}"""
+
+        max_tokens = max(self.config.get('max_tokens', 1000), BATCH_OUTPUT_TOKENS_PER_ITEM * len(batch))
+        result = self._call_llm_api(prompt, max_tokens=max_tokens)
+        if not result:
+            return None
+        data = self._parse_json(result)
+        if isinstance(data, list):
+            # 兼容返回带id字段的数组
+            data = {str(item.get("id")): item for item in data if isinstance(item, dict)}
+        if not isinstance(data, dict):
+            return {}
+        results = {}
+        for weibo_id, _ in batch:
+            analysis = self._validate_analysis(data.get(weibo_id))
+            if analysis is not None:
+                analysis.update(self._disabled_results())
+                results[weibo_id] = analysis
+        return results
+
+    def analyze_batch(self, items: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """批量分析(id, 正文)列表，返回以id为键的分析结果
+
+        某批结果缺失或格式不正确时，只把这些微博重新分批重试；整批都失败时
+        对半拆分，直到单条微博时改用analyze_text。接口请求失败时不拆分重试，
+        该批微博的结果均为unknown。
+        """
+        if not self._enabled_fields():
+            return {weibo_id: self._disabled_results() for weibo_id, _ in items}
+        results = {}
+        # 倒序存放，pop时按原顺序处理，重试的批次紧接着处理
+        pending = self._make_batches(items)[::-1]
+        while pending:
+            batch = pending.pop()
+            if len(batch) == 1:
+                weibo_id, text = batch[0]
+                results[weibo_id] = self.analyze_text(text)
+                continue
+            batch_results = self._analyze_batch_once(batch)
+            if batch_results is None:
+                # 超时、服务不可用等情况下拆分重试只会发出更多失败的请求
+                logger.warning(f"批量分析请求失败，{len(batch)}条微博不再重试")
+                for weibo_id, _ in batch:
+                    results[weibo_id] = self._failed_results()
+                continue
+            results.update(batch_results)
+            failed = [item for item in batch if item[0] not in batch_results]
+            if not failed:
+                continue
+            logger.warning(f"批量分析中{len(failed)}/{len(batch)}条微博的结果格式不正确，拆分后重试")
+            if len(failed) < len(batch):
+                pending.append(failed)
+            else:
+                middle = len(batch) // 2
+                pending.append(batch[middle:])
+                pending.append(batch[:middle])
+        return results
+
+    def _request_items(self, items: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        if self.batch_size <= 1:
+            return {weibo_id: self.analyze_text(text) for weibo_id, text in items}
+        return self.analyze_batch(items)
+
+    def cache_key(self, text: str) -> Tuple[str, str, str]:
+        """缓存键：规范化正文的sha256、模型和提示词版本（含已启用的分析项）"""
+        text_hash = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+        prompt_version = f"{PROMPT_VERSION}:{','.join(self._enabled_fields())}"
+        return text_hash, str(self.model), prompt_version
+
+    @staticmethod
+    def _is_complete(analysis: Dict[str, Any]) -> bool:
+        """请求失败时结果中有unknown或空摘要，这样的结果不缓存"""
+        return all(value not in ("unknown", "") for value in analysis.values())
+
+    def classify_locally(self, text: str) -> Optional[Dict[str, Any]]:
+        """本地分析有把握时返回结果，否则返回None"""
+        analysis = self.local_classifier.classify(text)
+        if analysis is None:
+            return None
+        results = {field: analysis[field] for field in self._enabled_fields()}
+        results.update(self._disabled_results())
+        return results
+
+    def model_of(self, analysis: Dict[str, Any]) -> Optional[str]:
+        """得出分析结果的模型：大模型和缓存结果为模型名（缓存键包含模型），本地分析为本地分类器"""
+        source = analysis.get("source")
+        if source in ("llm", "cache"):
+            return self.model
+        if source == "local":
+            return LocalClassifier.NAME
+        return None
+
+    def get_cache(self) -> Optional[LLMCache]:
+        """返回分析结果缓存，未启用时返回None"""
+        if not self.cache_enabled:
+            return None
+        with self._cache_lock:
+            if self.cache is None:
+                self.cache = LLMCache(
+                    self.config.get('cache_path', './weibo/llm_cache.db'),
+                    int(self.config.get('cache_max_entries', 100000)),
+                    float(self.config.get('cache_ttl_days', 30)),
+                )
+            return self.cache
+
+    def analyze_items(self, items: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """分析(id, 正文)列表，返回以id为键的分析结果
+
+        依次经过本地分析、缓存和LLM请求，前一步有结果的微博不再进入下一步；
+        batch_size大于1时批量请求。结果的source字段记录结果来自local、cache还是llm。
+        """
+        results = {}
+        if self.local_classifier:
+            for weibo_id, text in items:
+                analysis = self.classify_locally(text)
+                if analysis is not None:
+                    results[weibo_id] = dict(analysis, source="local")
+            items = [(weibo_id, text) for weibo_id, text in items if weibo_id not in results]
+        if not items:
+            return results
+        cache = self.get_cache()
+        if not cache:
+            for weibo_id, analysis in self._request_items(items).items():
+                results[weibo_id] = dict(analysis, source="llm")
+            return results
+        keys = {weibo_id: self.cache_key(text) for weibo_id, text in items}
+        cached = cache.get_many(list(set(keys.values())))
+        for weibo_id, key in keys.items():
+            if key in cached:
+                results[weibo_id] = dict(cached[key], source="cache")
+        missing = [(weibo_id, text) for weibo_id, text in items if weibo_id not in results]
+        if missing:
+            requested = self._request_items(missing)
+            cache.put_many(
+                {keys[weibo_id]: analysis for weibo_id, analysis in requested.items() if self._is_complete(analysis)}
+            )
+            for weibo_id, analysis in requested.items():
+                results[weibo_id] = dict(analysis, source="llm")
+        return results
+
+    def close(self) -> None:
+        with self._cache_lock:
+            if self.cache:
+                self.cache.close()
+                self.cache = None
+
+    def analyze_weibos(self, weibos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量分析多条微博，结果写入各自的llm_analysis字段"""
+        items = {}
+        for weibo_data in weibos:
+            text = weibo_data.get('text', '')
+            if text:
+                items.setdefault(str(weibo_data.get('id')), text)
+        results = self.analyze_items(list(items.items()))
+        for weibo_data in weibos:
+            analysis = results.get(str(weibo_data.get('id')))
+            if analysis is not None and weibo_data.get('text'):
+                weibo_data['llm_analysis'] = analysis
+        return weibos 
\ No newline at end of file
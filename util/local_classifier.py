@@ -0,0 +1,134 @@
+import re
+from typing import Any, Dict, Optional
+
+# 微博表情在正文中显示为[哈哈]这样的文字
+POSITIVE_WORDS = (
+    "[哈哈]", "[笑哈哈]", "[嘻嘻]", "[爱你]", "[心]", "[赞]", "[good]", "[耶]", "[鼓掌]",
+    "[太开心]", "[给力]", "[威武]", "[好喜欢]", "[亲亲]", "[偷乐]", "[送花花]", "[抱抱]",
+    "开心", "高兴", "快乐", "喜欢", "好棒", "太棒", "厉害", "感谢", "谢谢", "支持", "加油",
+    "幸福", "满意", "优秀", "推荐", "好看", "好吃", "可爱", "漂亮", "期待", "恭喜", "祝福",
+)
+NEGATIVE_WORDS = (
+    "[怒]", "[泪]", "[悲伤]", "[伤心]", "[抓狂]", "[衰]", "[鄙视]", "[哼]", "[委屈]",
+    "[吐]", "[生病]", "[失望]", "[怒骂]", "[裂开]", "[跪了]", "[心碎]",
+    "难过", "伤心", "生气", "愤怒", "失望", "讨厌", "垃圾", "恶心", "无语", "崩溃",
+    "后悔", "糟糕", "可恶", "痛苦", "郁闷", "烦死", "差评", "坑人", "骗子", "气死",
+)
+NEGATIONS = ("不", "没", "别", "无", "非")
+# 广告、垃圾微博的关键词
+SPAM_WORDS = (
+    "加微信", "加v", "加vx", "加微", "私信领取", "私我", "扫码", "代购", "优惠券", "领券",
+    "点击链接", "兼职", "日赚", "日结", "刷单", "免费领", "限时抢购", "返利", "招代理",
+    "稳赚", "贷款", "无抵押", "包邮", "秒杀", "低价出",
+)
+SPAM_PATTERNS = (
+    re.compile(r"1[3-9]\d{9}"),  # 手机号
+    re.compile(r"(?:微信|vx|v信|wx)[:：\s]*[a-zA-Z][-_a-zA-Z0-9]{5,19}", re.I),
+    re.compile(r"(?:qq|扣扣)[:：\s]*\d{5,11}", re.I),
+)
+URL_PATTERN = re.compile(r"https?://\S+")
+MENTION_PATTERN = re.compile(r"@[^\s:：@]+")
+EMOTICON_PATTERN = re.compile(r"\[[^\[\]]{1,8}\]")
+# 没有实际内容的字符：标点、空白和emoji
+NOISE_PATTERN = re.compile(
+    r"[\s\W_☀-➿\U0001f000-\U0001faff]+", re.UNICODE
+)
+REPOST_PHRASES = ("转发微博", "轉發微博", "Repost")
+
+
+class LocalClassifier:
+    """不联网的本地分析：情感词典打分和广告规则
+
+    只对有把握的微博给出结果，其他微博返回None交给LLM：
+    - 去掉表情、链接、@和“转发微博”后几乎没有内容的微博；
+    - 命中多个广告特征的微博；
+    - 较短且情感词明确只偏向一边的微博。
+    """
+
+    # 分析结果中代替模型名的标识
+    NAME = "local_classifier"
+
+    def __init__(self, trivial_length=4, short_length=30, summary_length=50, spam_threshold=2):
+        self.trivial_length = trivial_length
+        self.short_length = short_length
+        self.summary_length = summary_length
+        self.spam_threshold = spam_threshold
+
+    @staticmethod
+    def content_of(text: str) -> str:
+        """去掉表情、链接、@、“转发微博”和标点后的实际内容"""
+        for phrase in REPOST_PHRASES:
+            text = text.replace(phrase, "")
+        text = URL_PATTERN.sub("", text)
+        text = MENTION_PATTERN.sub("", text)
+        text = EMOTICON_PATTERN.sub("", text)
+        return NOISE_PATTERN.sub("", text)
+
+    @staticmethod
+    def _count(text: str, words):
+        """返回(出现次数, 紧跟在否定词后的次数)"""
+        count = negated = 0
+        for word in words:
+            start = text.find(word)
+            while start != -1:
+                if start > 0 and text[start - 1] in NEGATIONS:
+                    negated += 1
+                else:
+                    count += 1
+                start = text.find(word, start + len(word))
+        return count, negated
+
+    def sentiment_score(self, text: str):
+        """返回(积极词数, 消极词数)，紧跟在否定词后的情感词计入相反的一边，如“不开心”为消极"""
+        lower_text = text.lower()
+        positive, negated_positive = self._count(lower_text, POSITIVE_WORDS)
+        negative, negated_negative = self._count(lower_text, NEGATIVE_WORDS)
+        return positive + negated_negative, negative + negated_positive
+
+    def spam_score(self, text: str) -> int:
+        lower_text = text.lower()
+        score = sum(1 for word in SPAM_WORDS if word in lower_text)
+        score += sum(1 for pattern in SPAM_PATTERNS if pattern.search(text))
+        if len(URL_PATTERN.findall(text)) >= 2:
+            score += 1
+        return score
+
+    def _summary(self, text: str) -> str:
+        text = text.strip()
+        if len(text) <= self.summary_length:
+            return text
+        return text[: self.summary_length - 1] + "…"
+
+    def classify(self, text: str) -> Optional[Dict[str, Any]]:
+        """有把握时返回包含sentiment、summary和anomaly的结果，否则返回None"""
+        content = self.content_of(text)
+        positive, negative = self.sentiment_score(text)
+        if positive and not negative:
+            sentiment = "积极"
+        elif negative and not positive:
+            sentiment = "消极"
+        elif not positive and not negative:
+            sentiment = "中性"
+        else:
+            sentiment = None
+
+        if self.spam_score(text) >= self.spam_threshold:
+            return {
+                "sentiment": sentiment or "中性",
+                "summary": self._summary(text),
+                "anomaly": "异常：疑似广告",
+            }
+        if len(content) <= self.trivial_length:
+            return {
+                "sentiment": sentiment or "中性",
+                "summary": self._summary(text),
+                "anomaly": "正常",
+            }
+        # 较短的微博只在情感词明确时本地判断，没有情感词的交给LLM
+        if len(content) <= self.short_length and (positive or negative) and sentiment:
+            return {
+                "sentiment": sentiment,
+                "summary": self._summary(text),
+                "anomaly": "正常",
+            }
+        return None
@@ -0,0 +1,222 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Tuple
+from urllib.parse import urlsplit
+
+# 与Prometheus客户端默认值相同的直方图分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, _escape(value)) for name, value in pairs) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("%s的标签应为%s" % (self.name, ", ".join(self.labelnames)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self) -> Iterable[Tuple[str, str]]:
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation.replace("\n", " ")),
+            "# TYPE %s %s" % (self.name, self.type_name),
+        ]
+        lines.extend("%s %s" % sample for sample in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def total(self):
+        """所有标签取值的合计"""
+        with self._lock:
+            return sum(self._values.values())
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name + _format_labels(self.labelnames, key), _format_value(value)
+
+
+class Histogram(_Metric):
+    """按分桶统计观测值的分布，主要用于耗时"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # 各分桶的计数（非累计），最后两项为总和与总数
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录with块的执行时间"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def summary(self, **labels):
+        """返回(总和, 总数)"""
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return (counts[-2], counts[-1]) if counts else (0.0, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                yield self.name + "_bucket" + labels, _format_value(cumulative)
+            labels = _format_labels(self.labelnames, key)
+            yield self.name + "_sum" + labels, _format_value(counts[-2])
+            yield self.name + "_count" + labels, _format_value(counts[-1])
+
+
+class Registry:
+    """进程内的指标集合，可输出为Prometheus的文本格式"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("指标%s已存在" % metric.name)
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def write(self, path):
+        """写入文件，先写临时文件再替换，读取方不会读到写了一半的文件"""
+        file_dir = os.path.dirname(path)
+        if file_dir and not os.path.isdir(file_dir):
+            os.makedirs(file_dir)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+def endpoint_of(url):
+    """微博接口的名称，如getIndex、detail、hotflow，用作endpoint标签"""
+    path = urlsplit(url).path.rstrip("/")
+    if path.startswith("/detail/"):
+        return "detail"
+    return path.rsplit("/", 1)[-1] or "/"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    "weibo_requests_total", "微博接口的请求数，status为HTTP状态码，请求失败时为error",
+    ["endpoint", "status"],
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "weibo_request_seconds", "微博接口请求的耗时，不含限速等待", ["endpoint"]
+)
+RETRIES = REGISTRY.counter("weibo_retries_total", "请求失败后的重试次数", ["operation"])
+CAPTCHAS = REGISTRY.counter("weibo_captcha_total", "遇到验证码的次数", ["endpoint"])
+SLEEP_SECONDS = REGISTRY.counter(
+    "weibo_sleep_seconds_total",
+    "主动等待的秒数，reason为throttle（限速）或retry（重试退避），并发爬取时为各线程之和",
+    ["reason"],
+)
+RUN_SECONDS = REGISTRY.counter("weibo_run_seconds_total", "爬取运行的总秒数")
+PAGES = REGISTRY.counter("weibo_pages_total", "爬取的微博列表页数")
+WEIBOS = REGISTRY.counter("weibo_weibos_total", "爬取的微博数")
+COMMENTS = REGISTRY.counter("weibo_comments_total", "爬取的评论数")
+REPOSTS = REGISTRY.counter("weibo_reposts_total", "爬取的转发数")
+LONG_WEIBO_CACHE_HITS = REGISTRY.counter(
+    "weibo_long_weibo_cache_hits_total", "使用以前保存的结果、未请求detail页面的长微博数"
+)
+DOWNLOADED_BYTES = REGISTRY.counter("weibo_downloaded_bytes_total", "下载的图片、视频字节数")
+SINK_WRITE_SECONDS = REGISTRY.histogram(
+    "weibo_sink_write_seconds", "每批微博写入各write_mode的耗时", ["sink"]
+)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "weibo_llm_request_seconds", "LLM接口请求的耗时，status为ok或error", ["status"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
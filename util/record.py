@@ -0,0 +1,235 @@
+from collections.abc import Mapping
+from operator import attrgetter
+
+# 字段顺序即写入json、csv时的顺序
+FIELDS = (
+    "user_id",
+    "screen_name",
+    "id",
+    "bid",
+    "text",
+    "article_url",
+    "pics",
+    "video_url",
+    "live_photo_url",
+    "location",
+    "created_at",
+    "source",
+    "attitudes_count",
+    "comments_count",
+    "reposts_count",
+    "topics",
+    "at_users",
+    "retweet",
+    "full_created_at",
+)
+_FIELD_SET = frozenset(FIELDS)
+# 值为None时视为不存在的字段：原创微博没有retweet，刚解析、尚未标准化日期的微博没有full_created_at
+_OPTIONAL = frozenset(("retweet", "full_created_at"))
+
+
+def _make_layouts():
+    """(是否有retweet, 是否有full_created_at) -> (键, 一次取出所有值的attrgetter)"""
+    layouts = {}
+    for has_retweet in (False, True):
+        for has_full in (False, True):
+            keys = tuple(
+                name for name in FIELDS
+                if (name != "retweet" or has_retweet) and (name != "full_created_at" or has_full)
+            )
+            layouts[has_retweet, has_full] = (keys, attrgetter(*keys))
+    return layouts
+
+
+_LAYOUTS = _make_layouts()
+
+
+class WeiboRecord(Mapping):
+    """一条解析后的微博，创建后不可修改
+
+    每个字段占一个slot，比20多个键的OrderedDict小得多。WeiboRecord实现了Mapping，
+    各写入方式可以像字典一样直接读取，不需要复制；写入json时用json_default序列化，
+    需要修改时用to_dict得到新的字典，需要改变某些字段时用replace得到新的记录。
+    转发微博的retweet也是WeiboRecord。
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for name in FIELDS:
+            object.__setattr__(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError("未知的微博字段：%s" % ", ".join(fields))
+
+    @classmethod
+    def from_dict(cls, data):
+        """由字典（如从json读取的微博）创建，retweet同样转换"""
+        fields = dict(data)
+        if isinstance(fields.get("retweet"), Mapping):
+            fields["retweet"] = cls.from_dict(fields["retweet"])
+        return cls(**fields)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("WeiboRecord不可修改，请使用replace")
+
+    def __delattr__(self, name):
+        raise AttributeError("WeiboRecord不可修改，请使用replace")
+
+    def __getitem__(self, key):
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if value is None and key in _OPTIONAL:
+            raise KeyError(key)
+        return value
+
+    # get和in是最常用的操作，直接判断，避免Mapping默认实现中抛出再捕获KeyError
+    def get(self, key, default=None):
+        if key not in _FIELD_SET:
+            return default
+        value = getattr(self, key)
+        if value is None and key in _OPTIONAL:
+            return default
+        return value
+
+    def __contains__(self, key):
+        return key in _FIELD_SET and (key not in _OPTIONAL or getattr(self, key) is not None)
+
+    def _layout(self):
+        return _LAYOUTS[self.retweet is not None, self.full_created_at is not None]
+
+    def __iter__(self):
+        return iter(self._layout()[0])
+
+    def __len__(self):
+        return len(self._layout()[0])
+
+    def items(self):
+        """返回(键, 值)列表，比Mapping默认的逐个查找快"""
+        keys, getter = self._layout()
+        return list(zip(keys, getter(self)))
+
+    def values(self):
+        return list(self._layout()[1](self))
+
+    def __repr__(self):
+        return "WeiboRecord(id=%r, created_at=%r)" % (self.id, self.created_at)
+
+    # 所有字段都不可修改，复制时直接返回自身
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return _restore, (tuple(getattr(self, name) for name in FIELDS),)
+
+    def replace(self, **changes):
+        """返回修改了指定字段的新记录"""
+        fields = {name: getattr(self, name) for name in FIELDS}
+        fields.update(changes)
+        return WeiboRecord(**fields)
+
+    def to_dict(self):
+        """转换为新的字典，retweet同样转换，修改返回值不影响记录本身"""
+        keys, getter = self._layout()
+        data = dict(zip(keys, getter(self)))
+        if self.retweet is not None:
+            data["retweet"] = self.retweet.to_dict()
+        return data
+
+
+def _restore(values):
+    return WeiboRecord(**dict(zip(FIELDS, values)))
+
+
+def json_default(obj):
+    """json.dump的default参数：把WeiboRecord按字段顺序序列化，retweet在编码时再逐层转换，不复制整条记录"""
+    if isinstance(obj, WeiboRecord):
+        keys, getter = obj._layout()
+        return dict(zip(keys, getter(obj)))
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+
+
+# 数据库weibo表一行的字段：retweet换成retweet_id，created_at为完整时间
+ROW_FIELDS = tuple(name for name in FIELDS if name not in _OPTIONAL) + ("retweet_id",)
+_ROW_FIELD_SET = frozenset(ROW_FIELDS)
+_ROW_RECORD_FIELDS = attrgetter(*ROW_FIELDS[:-1])
+
+
+class WeiboRow(Mapping):
+    """WeiboRecord在数据库weibo表中一行的只读投影，不复制记录的任何字段"""
+
+    __slots__ = ("record", "retweet_id")
+
+    def __init__(self, record, retweet_id=""):
+        self.record = record
+        self.retweet_id = retweet_id
+
+    def __getitem__(self, key):
+        if key == "created_at":
+            return self.record.full_created_at
+        if key == "retweet_id":
+            return self.retweet_id
+        if key not in _ROW_FIELD_SET:
+            raise KeyError(key)
+        return getattr(self.record, key)
+
+    def __iter__(self):
+        return iter(ROW_FIELDS)
+
+    def __len__(self):
+        return len(ROW_FIELDS)
+
+    def __contains__(self, key):
+        return key in _ROW_FIELD_SET
+
+    def keys(self):
+        return ROW_FIELDS
+
+    def values(self):
+        values = list(_ROW_RECORD_FIELDS(self.record))
+        values[ROW_FIELDS.index("created_at")] = self.record.full_created_at
+        values.append(self.retweet_id)
+        return values
+
+    def __repr__(self):
+        return "WeiboRow(id=%r, retweet_id=%r)" % (self.record.id, self.retweet_id)
+
+
+class WeiboBatch(list):
+    """一批待写入的微博，split_rows的结果保存在其中，写入多个数据库时只计算一次
+
+    fingerprints为本批微博的{微博id: 内容指纹}，随批次一起交给写入线程，
+    爬取线程之后只修改新的批次，两个线程不会同时访问同一个字典。
+    """
+
+    rows = None
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.fingerprints = {}
+
+
+def split_rows(weibos):
+    """把一批微博投影为数据库weibo表的行，返回(各微博的行, 被转发的原微博的行)
+
+    转发微博的行中retweet_id为原微博id，其余行为空字符串。
+    """
+    rows = getattr(weibos, "rows", None)
+    if rows is not None:
+        return rows
+    weibo_rows = []
+    retweet_rows = []
+    for w in weibos:
+        retweet = w.retweet
+        if retweet is None:
+            weibo_rows.append(WeiboRow(w))
+        else:
+            retweet_rows.append(WeiboRow(retweet))
+            weibo_rows.append(WeiboRow(w, retweet.id))
+    rows = (weibo_rows, retweet_rows)
+    if isinstance(weibos, WeiboBatch):
+        weibos.rows = rows
+    return rows
@@ -0,0 +1,76 @@
+import json
+import zlib
+
+from util.record import json_default
+from util.sqlite_writer import SqliteWriter
+
+CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS seen_weibo (
+        user_id INTEGER NOT NULL
+        ,weibo_id INTEGER NOT NULL
+        ,fingerprint INTEGER NOT NULL
+        ,PRIMARY KEY (user_id, weibo_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS long_weibo (
+        weibo_id INTEGER NOT NULL PRIMARY KEY
+        ,fingerprint INTEGER NOT NULL
+        ,weibo TEXT NOT NULL
+    );
+"""
+
+
+def fingerprint(weibo_info):
+    """微博内容的指纹，由接口返回的正文、图片数和编辑次数计算，不含点赞数等会变化的计数"""
+    content = "%s\x00%s\x00%s" % (
+        weibo_info.get("edit_count", 0), weibo_info.get("pic_num", 0), weibo_info.get("text", "")
+    )
+    return zlib.crc32(content.encode("utf-8"))
+
+
+class SeenIdStore:
+    """跨运行记录每个用户已写入的微博id，以及长微博的完整内容
+
+    数据保存在单独的SQLite文件中，seen_weibo表以(user_id, weibo_id)为主键且不带rowid，
+    相当于按用户排好序的id文件。爬取某个用户前用load一次读入内存，之后只做字典查找。
+    长微博按id缓存解析后的结果，内容指纹不变时不再请求/detail页面。
+    """
+
+    def __init__(self, path):
+        self.writer = SqliteWriter(path, CREATE_SQL)
+
+    def load(self, user_id):
+        """返回{weibo_id: 指纹}"""
+        rows = self.writer.query_all(
+            "SELECT weibo_id, fingerprint FROM seen_weibo WHERE user_id = ?", (int(user_id),)
+        )
+        return dict(rows)
+
+    def add(self, user_id, weibo_id, value):
+        self.writer.insert("seen_weibo", {
+            "user_id": int(user_id), "weibo_id": int(weibo_id), "fingerprint": value,
+        })
+
+    def get_long_weibo(self, weibo_id, value):
+        """返回缓存的长微博，没有缓存或内容指纹已变化时返回None"""
+        row = self.writer.query_one(
+            "SELECT weibo FROM long_weibo WHERE weibo_id = ? AND fingerprint = ?",
+            (int(weibo_id), value),
+        )
+        return json.loads(row[0]) if row else None
+
+    def put_long_weibo(self, weibo_id, value, weibo):
+        """缓存长微博并立即提交
+
+        长微博在爬取线程中写入，而flush由写入线程调用，只提交写入线程自己的缓冲区，所以这里直接提交。
+        """
+        with self.writer.batch():
+            self.writer.insert("long_weibo", {
+                "weibo_id": int(weibo_id), "fingerprint": value,
+                "weibo": json.dumps(weibo, ensure_ascii=False, default=json_default),
+            })
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,130 @@
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger("weibo")
+
+
+def migrate(connection, migrations):
+    """按PRAGMA user_version记录的版本号依次执行尚未执行的升级脚本
+
+    migrations[i]将数据库从版本i升级到版本i+1，可以是SQL脚本，也可以是
+    接收connection的函数。每个升级与版本号的更新在同一个事务中执行，
+    中途失败不会留下只升级了一半的数据库。
+    """
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    for target in range(version + 1, len(migrations) + 1):
+        logger.info("正在将SQLite数据库升级到版本%d，数据量大时可能需要较长时间", target)
+        migration = migrations[target - 1]
+        try:
+            if callable(migration):
+                connection.execute("BEGIN")
+                migration(connection)
+                connection.execute("PRAGMA user_version = %d" % target)
+                connection.execute("COMMIT")
+            else:
+                connection.executescript(
+                    "BEGIN;\n{script}\nPRAGMA user_version = {target};\nCOMMIT;".format(
+                        script=migration, target=target
+                    )
+                )
+        except sqlite3.Error:
+            if connection.in_transaction:
+                connection.rollback()
+            raise
+
+
+class SqliteWriter:
+    """一次爬取共用的SQLite写入器
+
+    整个爬取过程只打开一个连接，并开启WAL模式，爬取时service.py等读取方不会被锁住。
+    insert只把数据放入缓冲区，flush时按表和列分组用executemany批量写入，
+    每次flush只提交一次事务。相同的INSERT语句会被sqlite3模块缓存为预编译语句。
+    可被多个线程共享：每个线程有自己的缓冲区（threading.local），insert无需加锁；
+    flush只提交当前线程插入的数据，不会把其他线程写了一半的数据一起提交。
+    各线程须在自己的线程中flush，线程结束后其未flush的数据随之丢弃。
+    """
+
+    def __init__(self, path, create_sql, migrations=()):
+        self.path = path
+        file_dir = os.path.dirname(path)
+        if file_dir and not os.path.isdir(file_dir):
+            os.makedirs(file_dir)
+        self._lock = threading.RLock()
+        self._local = threading.local()  # buffer: {(table, keys): 待写入的行}
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # WAL模式下NORMAL已能保证数据库不损坏，且提交时无需fsync
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(create_sql)
+        self.connection.commit()
+        migrate(self.connection, migrations)
+
+    def insert(self, table, data):
+        """插入或替换一行数据，flush后才真正写入"""
+        if not data:
+            return
+        try:
+            buffer = self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = {}
+        key = (table, tuple(data))
+        rows = buffer.get(key)
+        if rows is None:
+            rows = buffer[key] = []
+        rows.append(tuple(data.values()))
+
+    def flush(self):
+        """将当前线程缓冲区中的数据在一个事务中写入数据库
+
+        写入失败时整个事务回滚并抛出sqlite3.Error，由调用方决定如何处理，
+        不会在记录日志后当作写入成功。无论成功与否，缓冲区都会被清空。
+        """
+        pending = getattr(self._local, "buffer", None)
+        self._local.buffer = {}
+        if pending:
+            with self._lock:
+                self._write(pending)
+
+    def discard(self):
+        """丢弃当前线程尚未flush的数据"""
+        self._local.buffer = {}
+
+    @contextmanager
+    def batch(self):
+        """在with块中insert，块结束时一次提交
+
+        块中抛出异常时丢弃当前线程尚未提交的数据，不会留在缓冲区里被之后的flush提交。
+        """
+        try:
+            yield self
+        except BaseException:
+            self.discard()
+            raise
+        self.flush()
+
+    def _write(self, pending):
+        with self.connection:
+            for (table, keys), rows in pending.items():
+                sql = "INSERT OR REPLACE INTO {table}({keys}) VALUES({values})".format(
+                    table=table, keys=",".join(keys), values=",".join(["?"] * len(keys))
+                )
+                self.connection.executemany(sql, rows)
+
+    def query_one(self, sql, params=()):
+        with self._lock:
+            return self.connection.execute(sql, params).fetchone()
+
+    def query_all(self, sql, params=()):
+        with self._lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def close(self):
+        """写入当前线程尚未提交的数据并关闭连接"""
+        with self._lock:
+            try:
+                self.flush()
+            finally:
+                self.connection.close()
@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from typing import Any, Dict
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from util import metrics, tracing
+
+logger = logging.getLogger("weibo")
+
+# 这些状态码说明请求过快，已被微博限制
+THROTTLED_STATUS_CODES = (403, 418, 429)
+
+
+class _HostState:
+    __slots__ = ("semaphore", "rate", "tokens", "updated_at")
+
+    def __init__(self, max_concurrency, rate, burst):
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.rate = rate
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+
+class HostThrottle:
+    """按host限速，可被多个线程共享
+
+    每个host一个令牌桶，每个请求消耗一个令牌，令牌按rate（次/秒）补充。
+    rate采用AIMD调整：请求正常时加性增加，遇到403/418、返回数据为空
+    或者验证码时乘性减少，从而在不被限制时尽量快，被限制时迅速退让。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config.get("rate_limit_config") or {}
+        # 只对这些host限速，默认为微博接口所在的host，图片、视频所在的CDN不受微博接口的频率限制
+        api_host = urlsplit(config.get("api_base", "https://m.weibo.cn")).hostname
+        self.hosts = set(self.config.get("hosts", [api_host]))
+        self.max_concurrency = max(1, int(self.config.get("max_concurrency", 2)))
+        self.initial_rate = float(self.config.get("initial_rate", 0.5))
+        self.min_rate = float(self.config.get("min_rate", 0.05))
+        self.max_rate = float(self.config.get("max_rate", 2.0))
+        self.increase = float(self.config.get("increase", 0.02))
+        self.decrease = float(self.config.get("decrease", 0.5))
+        self.burst = max(1.0, float(self.config.get("burst", 3)))
+        self.sleep_time = 0.0  # 因限速累计等待的秒数
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def is_limited(self, host):
+        return host in self.hosts
+
+    def _get_state(self, host):
+        state = self._states.get(host)
+        if state is None:
+            state = _HostState(self.max_concurrency, self.initial_rate, self.burst)
+            self._states[host] = state
+        return state
+
+    def _refill(self, state, now):
+        elapsed = now - state.updated_at
+        state.tokens = min(self.burst, state.tokens + elapsed * state.rate)
+        state.updated_at = now
+
+    def acquire(self, host):
+        """占用host的一个并发名额，并等待到有令牌可用"""
+        if not self.is_limited(host):
+            return
+        with self._lock:
+            state = self._get_state(host)
+        state.semaphore.acquire()
+        with self._lock:
+            self._refill(state, time.monotonic())
+            # 先预扣令牌，令牌为负时需要等待补足，这样并发的请求会自动排队
+            state.tokens -= 1
+            wait = -state.tokens / state.rate if state.tokens < 0 else 0
+            self.sleep_time += wait
+        if wait > 0:
+            metrics.SLEEP_SECONDS.inc(wait, reason="throttle")
+            tracing.TRACER.add("throttle_sleep", wait)
+            time.sleep(wait)
+
+    def release(self, host):
+        if not self.is_limited(host):
+            return
+        with self._lock:
+            state = self._get_state(host)
+        state.semaphore.release()
+
+    def success(self, host):
+        """请求正常，加性增加速率"""
+        if not self.is_limited(host):
+            return
+        with self._lock:
+            state = self._get_state(host)
+            state.rate = min(self.max_rate, state.rate + self.increase)
+
+    def penalize(self, host):
+        """请求被限制，乘性降低速率并清空令牌"""
+        if not self.is_limited(host):
+            return
+        with self._lock:
+            state = self._get_state(host)
+            state.rate = max(self.min_rate, state.rate * self.decrease)
+            state.tokens = min(state.tokens, 0)
+            rate = state.rate
+        logger.warning("请求%s被限制，降低请求速率至每秒%.2f次", host, rate)
+
+    def penalize_url(self, url):
+        self.penalize(urlsplit(url).hostname or "")
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """所有经过该adapter的请求都会先经过HostThrottle，并根据响应状态码反馈"""
+
+    def __init__(self, throttle, *args, **kwargs):
+        self.throttle = throttle
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        host = urlsplit(request.url).hostname or ""
+        endpoint = metrics.endpoint_of(request.url) if self.throttle.is_limited(host) else "other"
+        # 限速等待记为request的子阶段，request的自身耗时即为网络耗时
+        with tracing.span("request"):
+            self.throttle.acquire(host)
+            start = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+            except Exception:
+                metrics.REQUESTS.inc(endpoint=endpoint, status="error")
+                raise
+            finally:
+                self.throttle.release(host)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+        metrics.REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+        if response.status_code in THROTTLED_STATUS_CODES:
+            self.throttle.penalize(host)
+        elif response.ok:
+            self.throttle.success(host)
+        return response
@@ -0,0 +1,215 @@
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger("weibo")
+
+# 当前所在的span和用户。asyncio.to_thread会复制context，并发爬取时各用户互不影响
+_stack = ContextVar("trace_stack", default=())
+_user = ContextVar("trace_user", default="")
+
+
+class _Span:
+    __slots__ = ("child",)
+
+    def __init__(self):
+        self.child = 0.0  # 子span占用的秒数
+
+
+class Tracer:
+    """按(用户, 阶段)汇总各阶段的次数、总耗时和自身耗时
+
+    span可以嵌套，自身耗时为总耗时减去子span的耗时，例如get_one_page的自身耗时
+    不含其中get_one_weibo和请求接口的时间。各阶段自身耗时之和即为被跟踪的总时间。
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._stats = {}  # (user, stage) -> [次数, 总耗时, 自身耗时]
+
+    def record(self, stage, elapsed, child=0.0):
+        key = (_user.get(), stage)
+        with self._lock:
+            stat = self._stats.get(key)
+            if stat is None:
+                stat = self._stats[key] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] += elapsed - child
+
+    def add(self, stage, elapsed):
+        """记录一段不用with包裹的耗时（如限速等待），计入当前span的子耗时"""
+        if not self.enabled:
+            return
+        parents = _stack.get()
+        if parents:
+            parents[-1].child += elapsed
+        self.record(stage, elapsed)
+
+    def clear(self):
+        with self._lock:
+            self._stats = {}
+
+    def stages(self):
+        """返回{阶段: [次数, 总耗时, 自身耗时]}"""
+        result = {}
+        with self._lock:
+            items = list(self._stats.items())
+        for (_, stage), (count, total, own) in items:
+            stat = result.setdefault(stage, [0, 0.0, 0.0])
+            stat[0] += count
+            stat[1] += total
+            stat[2] += own
+        return result
+
+    def users(self):
+        """返回{用户: {阶段: 自身耗时}}"""
+        result = {}
+        with self._lock:
+            items = list(self._stats.items())
+        for (user, stage), (_, _, own) in items:
+            result.setdefault(user, {})[stage] = own
+        return result
+
+    def report(self, top_users=20):
+        """各阶段耗时表，以及自身耗时之和最多的top_users个用户的主要阶段"""
+        stages = self.stages()
+        if not stages:
+            return ""
+        traced = sum(stat[2] for stat in stages.values()) or 1e-9
+        lines = ["%-24s %10s %12s %12s %8s" % ("阶段", "次数", "总耗时(秒)", "自身耗时(秒)", "占比")]
+        for stage, (count, total, own) in sorted(stages.items(), key=lambda item: -item[1][2]):
+            lines.append("%-24s %10d %12.2f %12.2f %7.1f%%" % (stage, count, total, own, own / traced * 100))
+        users = sorted(self.users().items(), key=lambda item: -sum(item[1].values()))
+        if top_users and users:
+            lines.append("")
+            lines.append("耗时最多的%d个用户：" % min(top_users, len(users)))
+            for user, user_stages in users[:top_users]:
+                top = sorted(user_stages.items(), key=lambda item: -item[1])[:4]
+                lines.append("%-16s %10.2f秒  %s" % (
+                    user or "-", sum(user_stages.values()),
+                    "  ".join("%s %.2f" % (stage, own) for stage, own in top),
+                ))
+        return "\n".join(lines)
+
+
+TRACER = Tracer()
+
+
+@contextmanager
+def span(stage):
+    """跟踪with块或被装饰函数的耗时，也可用作装饰器：@span("get_one_page")"""
+    if not TRACER.enabled:
+        yield
+        return
+    node = _Span()
+    token = _stack.set(_stack.get() + (node,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _stack.reset(token)
+        parents = _stack.get()
+        if parents:
+            parents[-1].child += elapsed
+        TRACER.record(stage, elapsed, node.child)
+
+
+def set_user(user_id):
+    """之后当前context中的span都计入user_id"""
+    _user.set(str(user_id))
+
+
+@contextmanager
+def user_scope(user_id):
+    """with块中的span都计入user_id"""
+    token = _user.set(str(user_id))
+    try:
+        yield
+    finally:
+        _user.reset(token)
+
+
+class SamplingProfiler:
+    """定时采样所有线程的调用栈，开销与调用次数无关，适合长时间运行
+
+    结果为collapsed stack格式（每行“函数;函数;函数 次数”），可用flamegraph.pl
+    或speedscope生成火焰图。
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append("%s (%s:%d)" % (
+                        code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                self.samples[";".join(reversed(names))] += 1
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write("%s %d\n" % (stack, count))
+
+
+@contextmanager
+def profile(kind, profile_dir, interval=0.01):
+    """用cProfile或采样分析器包裹一次运行，结果保存到profile_dir
+
+    cprofile保存为.prof（可用snakeviz查看）和按累计耗时排序的.txt，只统计调用
+    该函数的线程；sampling采样所有线程，保存为collapsed stack格式的.txt。
+    """
+    if kind not in ("cprofile", "sampling"):
+        yield
+        return
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, "%s_%s" % (kind, time.strftime("%Y%m%d_%H%M%S")))
+    if kind == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path + ".prof")
+            with open(path + ".txt", "w", encoding="utf-8") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(100)
+            logger.info("性能分析结果已保存到%s.prof", path)
+    else:
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            profiler.save(path + ".txt")
+            logger.info("性能分析结果已保存到%s.txt", path)
@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 
 import codecs
-import copy
 import csv
 import json
 import logging
@@ -13,24 +12,32 @@ import random
 import re
 import sqlite3
 import sys
+import threading
+import time
 import warnings
 import webbrowser
 from collections import OrderedDict
 from datetime import date, datetime, timedelta
 from pathlib import Path
-from time import sleep
 
 import requests
 from requests.exceptions import RequestException
-from lxml import etree
-from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 
 import const
-from util import csvutil
+from util import csvutil, html_extractor, metrics, tracing
+from util.analysis_queue import AnalysisQueue
+from util.async_crawler import AsyncCrawler
+from util.batch_writer import BatchWriter
+from util.blob_store import BlobStore
 from util.dateutil import convert_to_days_ago
+from util.downloader import MediaDownloader
 from util.notify import push_deer
+from util.record import WeiboBatch, WeiboRecord, json_default, split_rows
+from util.seen_ids import SeenIdStore, fingerprint
 from util.llm_analyzer import LLMAnalyzer  # 导入 LLM 分析器
+from util.sqlite_writer import SqliteWriter
+from util.throttle import HostThrottle, ThrottledAdapter
 
 warnings.filterwarnings("ignore")
 
@@ -43,6 +50,21 @@ logger = logging.getLogger("weibo")
 
 # 日期时间格式
 DTFORMAT = "%Y-%m-%dT%H:%M:%S"
+# SQLite中需要全文检索的表及对应的FTS5表，FTS5表的rowid为数字形式的id
+SQLITE_FTS_TABLES = {
+    "weibo": "weibo_fts",
+    "comments": "comments_fts",
+    "reposts": "reposts_fts",
+}
+
+# 点赞数等计数中的单位，如“1.5万”、“100万+”、“2亿”
+COUNT_UNITS = {"万+": 10000, "万": 10000, "亿": 100000000}
+# 零宽空格，以及无法编码为UTF-8、写入文件或数据库时会出错的孤立代理字符
+INVISIBLE_CHARS = re.compile("[\u200b\ud800-\udfff]")
+# standardize_info按值的类型选择处理方法，不在表中的类型（数字、布尔值、列表等）保持不变
+STANDARDIZERS = {
+    str: lambda value: INVISIBLE_CHARS.sub("", value),
+}
 
 class Weibo(object):
     def __init__(self, config):
@@ -118,11 +140,16 @@ class Weibo(object):
             'upgrade-insecure-requests': '1',
             'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/136.0.0.0 Safari/537.36 Edg/136.0.0.0',
         }
+        # 微博接口地址，可以不填，测试时可指向本地的benchmark/fake_server.py
+        self.api_base = config.get("api_base", "https://m.weibo.cn").rstrip("/")
         self.mysql_config = config.get("mysql_config")  # MySQL数据库连接配置，可以不填
         self.mongodb_URI = config.get("mongodb_URI")  # MongoDB数据库连接字符串，可以不填
         self.post_config = config.get("post_config")  # post_config，可以不填
         self.page_weibo_count = config.get("page_weibo_count")  # page_weibo_count，爬取一页的微博数，默认10页
         
+        # 各阶段耗时统计与性能分析配置，可以不填
+        self.trace_config = config.get("trace_config") or {}
+        tracing.TRACER.enabled = bool(self.trace_config.get("enabled", True))
         # 初始化 LLM 分析器
         self.llm_analyzer = LLMAnalyzer(config) if config.get("llm_config") else None
         
@@ -131,9 +158,19 @@ class Weibo(object):
         requests_session.cookies.update(cookies)
 
         self.session = requests_session
-        adapter = HTTPAdapter(max_retries=5)
+        # 并发爬取配置，可以不填，不填则逐个用户爬取
+        self.async_config = config.get("async_config")
+        pool_size = 10
+        if self.async_config:
+            pool_size = max(pool_size, self.async_config.get("max_concurrent_users", 8))
+        # 所有请求都经过限速器，由它代替固定的随机sleep控制爬取速度
+        self.throttle = HostThrottle(config)
+        adapter = ThrottledAdapter(
+            self.throttle, max_retries=5, pool_connections=pool_size, pool_maxsize=pool_size
+        )
         self.session.mount('http://', adapter)
         self.session.mount('https://', adapter)
+        self.downloader = MediaDownloader(config)  # 图片、视频下载线程池
         # 避免卡住
         if isinstance(user_id_list, list):
             random.shuffle(user_id_list)
@@ -166,10 +203,17 @@ class Weibo(object):
         self.query = ""
         self.user = {}  # 存储目标微博用户信息
         self.got_count = 0  # 存储爬取到的微博数
-        self.weibo = []  # 存储爬取到的所有微博信息
-        self.weibo_id_list = []  # 存储爬取到的所有微博id
-        self.long_sleep_count_before_each_user = 0 #每个用户前的长时间sleep避免被ban
+        self.weibo = WeiboBatch()  # 存储已爬取、尚未交给写入的微博信息
+        self.weibo_id_set = set()  # 存储本次爬取到的所有微博id
+        # 跨运行记录已爬取的微博id和长微博内容，可以不填
+        self.seen_ids_config = config.get("seen_ids_config") or {}
+        self.seen_ids = None  # SeenIdStore，start时创建
+        self.seen_weibos = {}  # 当前用户以前写入过的{微博id: 内容指纹}
         self.store_binary_in_sqlite = config.get("store_binary_in_sqlite", 0)
+        self.sqlite_writer = None  # 本次爬取共用的SQLite写入器，首次写入时创建
+        self.guess_pin = False  # 因为微博取消了“置顶”字样的显示，因此默认猜测所有人第一条都是置顶
+        self.analysis_queue = None  # 后台LLM分析队列，start时创建
+        self.write_lock = threading.Lock()  # 并发爬取时各用户共享文件和数据库，写入时需加锁
     def validate_config(self, config):
         """验证配置是否正确"""
 
@@ -264,7 +308,7 @@ class Weibo(object):
             return False
 
     def get_json(self, params):
-        url = "https://m.weibo.cn/api/container/getIndex?"
+        url = self.api_base + "/api/container/getIndex?"
         try:
             r = self.session.get(url, params=params, headers=self.headers, verify=False, timeout=10)
             r.raise_for_status()
@@ -315,9 +359,10 @@ class Weibo(object):
                 logger.error("读取用户输入时发生 EOFError，程序退出。")
                 sys.exit("输入流已关闭，程序中止。")
     
+    @tracing.span("get_weibo_json")
     def get_weibo_json(self, page):
         """获取网页中微博json数据"""
-        url = "https://m.weibo.cn/api/container/getIndex?"
+        url = self.api_base + "/api/container/getIndex?"
         params = (
             {
                 "container_ext": "profile_uid:" + str(self.user_config["user_id"]),
@@ -343,6 +388,8 @@ class Weibo(object):
                     return js
                 else:
                     logger.warning("未能获取到数据，可能需要验证码验证。")
+                    metrics.CAPTCHAS.inc(endpoint="getIndex")
+                    self.throttle.penalize_url(url)
                     if self.handle_captcha(js):
                         logger.info("用户已完成验证码验证，继续请求数据。")
                         retries = 0  # 重置重试计数器
@@ -354,12 +401,18 @@ class Weibo(object):
                 retries += 1
                 sleep_time = backoff_factor * (2 ** retries)
                 logger.error(f"请求失败，错误信息：{e}。等待 {sleep_time} 秒后重试...")
-                sleep(sleep_time)
+                metrics.RETRIES.inc(operation="get_weibo_json")
+                metrics.SLEEP_SECONDS.inc(sleep_time, reason="retry")
+                tracing.TRACER.add("retry_sleep", sleep_time)
+                time.sleep(sleep_time)
             except ValueError as ve:
                 retries += 1
                 sleep_time = backoff_factor * (2 ** retries)
                 logger.error(f"JSON 解码失败，错误信息：{ve}。等待 {sleep_time} 秒后重试...")
-                sleep(sleep_time)
+                metrics.RETRIES.inc(operation="get_weibo_json")
+                metrics.SLEEP_SECONDS.inc(sleep_time, reason="retry")
+                tracing.TRACER.add("retry_sleep", sleep_time)
+                time.sleep(sleep_time)
         logger.error("超过最大重试次数，跳过当前页面。")
         return {}
     
@@ -462,28 +515,20 @@ class Weibo(object):
 
     def user_to_database(self):
         """将用户信息写入文件/数据库"""
-        self.user_to_csv()
-        if "mysql" in self.write_mode:
-            self.user_to_mysql()
-        if "mongo" in self.write_mode:
-            self.user_to_mongodb()
-        if "sqlite" in self.write_mode:
-            self.user_to_sqlite()
+        with self.write_lock:
+            self.user_to_csv()
+            if "mysql" in self.write_mode:
+                self.user_to_mysql()
+            if "mongo" in self.write_mode:
+                self.user_to_mongodb()
+            if "sqlite" in self.write_mode:
+                self.user_to_sqlite()
 
+    @tracing.span("get_user_info")
     def get_user_info(self):
         """获取用户信息"""
         params = {"containerid": "100505" + str(self.user_config["user_id"])}
-        url = "https://m.weibo.cn/api/container/getIndex"
-        
-        # 这里在读取下一个用户的时候很容易被ban，需要优化休眠时长
-        # 加一个count，不需要一上来啥都没干就sleep
-        if self.long_sleep_count_before_each_user > 0:
-            sleep_time = random.randint(30, 60)
-            # 添加log，否则一般用户不知道以为程序卡了
-            logger.info(f"""短暂sleep {sleep_time}秒，避免被ban""")        
-            sleep(sleep_time)
-            logger.info("sleep结束")  
-        self.long_sleep_count_before_each_user = self.long_sleep_count_before_each_user + 1      
+        url = self.api_base + "/api/container/getIndex"
 
         max_retries = 5  # 设置最大重试次数，避免无限循环
         retries = 0
@@ -549,6 +594,8 @@ class Weibo(object):
                     return 0
                 else:
                     logger.warning("未能获取到用户信息，可能需要验证码验证。")
+                    metrics.CAPTCHAS.inc(endpoint="getIndex")
+                    self.throttle.penalize_url(url)
                     if self.handle_captcha(js):
                         logger.info("用户已完成验证码验证，继续请求用户信息。")
                         retries = 0  # 重置重试计数器
@@ -560,21 +607,27 @@ class Weibo(object):
                 retries += 1
                 sleep_time = backoff_factor * (2 ** retries)
                 logger.error(f"请求失败，错误信息：{e}。等待 {sleep_time} 秒后重试...")
-                sleep(sleep_time)
+                metrics.RETRIES.inc(operation="get_user_info")
+                metrics.SLEEP_SECONDS.inc(sleep_time, reason="retry")
+                tracing.TRACER.add("retry_sleep", sleep_time)
+                time.sleep(sleep_time)
             except ValueError as ve:
                 retries += 1
                 sleep_time = backoff_factor * (2 ** retries)
                 logger.error(f"JSON 解码失败，错误信息：{ve}。等待 {sleep_time} 秒后重试...")
-                sleep(sleep_time)
+                metrics.RETRIES.inc(operation="get_user_info")
+                metrics.SLEEP_SECONDS.inc(sleep_time, reason="retry")
+                tracing.TRACER.add("retry_sleep", sleep_time)
+                time.sleep(sleep_time)
         logger.error("超过最大重试次数，程序将退出。")
         sys.exit("超过最大重试次数，程序已退出。")
 
+    @tracing.span("get_long_weibo")
     def get_long_weibo(self, id):
         """获取长微博"""
-        url = "https://m.weibo.cn/detail/%s" % id
+        url = self.api_base + "/detail/%s" % id
         logger.info(f"""URL: {url} """)
         for i in range(5):
-            sleep(random.uniform(1.0, 2.5))
             html = self.session.get(url, headers=self.headers, verify=False).text
             html = html[html.find('"status":') :]
             html = html[: html.rfind('"call"')]
@@ -585,6 +638,23 @@ class Weibo(object):
             if weibo_info:
                 weibo = self.parse_weibo(weibo_info)
                 return weibo
+            metrics.RETRIES.inc(operation="get_long_weibo")
+            self.throttle.penalize_url(url)
+
+    def get_long_weibo_cached(self, weibo_info):
+        """获取长微博，以前获取过且内容未变化的长微博直接使用保存的结果"""
+        weibo_id = weibo_info["id"]
+        if not self.seen_ids:
+            return self.get_long_weibo(weibo_id)
+        value = fingerprint(weibo_info)
+        weibo = self.seen_ids.get_long_weibo(weibo_id, value)
+        if weibo is not None:
+            metrics.LONG_WEIBO_CACHE_HITS.inc()
+            return WeiboRecord.from_dict(weibo)
+        weibo = self.get_long_weibo(weibo_id)
+        if weibo:
+            self.seen_ids.put_long_weibo(weibo_id, value, weibo)
+        return weibo
 
     def get_pics(self, weibo_info):
         """获取微博原始图片url"""
@@ -618,7 +688,7 @@ class Weibo(object):
         return video_url
 
     def download_one_file(self, url, file_path, type, weibo_id):
-        """下载单个文件(图片/视频)"""
+        """下载单个文件(图片/视频)，返回是否成功，会在下载线程池中并发调用"""
         try:
 
             file_exist = os.path.isfile(file_path)
@@ -628,123 +698,47 @@ class Weibo(object):
                 sqlite_exist = self.sqlite_exist_file(file_path)
 
             if not need_download:
-                return 
-
-            s = requests.Session()
-            s.mount('http://', HTTPAdapter(max_retries=5))
-            s.mount('https://', HTTPAdapter(max_retries=5))
-            try_count = 0
-            success = False
-            MAX_TRY_COUNT = 3
-            detected_extension = None
-            while try_count < MAX_TRY_COUNT:
-                try:
-                    response = s.get(
-                        url, headers=self.headers, timeout=(5, 10), verify=False
-                    )
-                    response.raise_for_status()
-                    downloaded = response.content
-                    try_count += 1
-
-                    # 获取文件后缀
-                    url_path = url.split('?')[0]  # 去除URL中的参数
-                    inferred_extension = os.path.splitext(url_path)[1].lower().strip('.')
-
-                    # 通过 Magic Number 检测文件类型
-                    if downloaded.startswith(b'\xFF\xD8\xFF'):
-                        # JPEG 文件
-                        if not downloaded.endswith(b'\xff\xd9'):
-                            logger.debug(f"[DEBUG] JPEG 文件不完整: {url} ({try_count}/{MAX_TRY_COUNT})")
-                            continue  # 文件不完整，继续重试
-                        detected_extension = '.jpg'
-                    elif downloaded.startswith(b'\x89PNG\r\n\x1A\n'):
-                        # PNG 文件
-                        if not downloaded.endswith(b'IEND\xaeB`\x82'):
-                            logger.debug(f"[DEBUG] PNG 文件不完整: {url} ({try_count}/{MAX_TRY_COUNT})")
-                            continue  # 文件不完整，继续重试
-                        detected_extension = '.png'
-                    else:
-                        # 其他类型，使用原有逻辑处理
-                        if inferred_extension in ['mp4', 'mov', 'webm', 'gif', 'bmp', 'tiff']:
-                            detected_extension = '.' + inferred_extension
-                        else:
-                            # 尝试从 Content-Type 获取扩展名
-                            content_type = response.headers.get('Content-Type', '').lower()
-                            if 'image/jpeg' in content_type:
-                                detected_extension = '.jpg'
-                            elif 'image/png' in content_type:
-                                detected_extension = '.png'
-                            elif 'video/mp4' in content_type:
-                                detected_extension = '.mp4'
-                            elif 'video/quicktime' in content_type:
-                                detected_extension = '.mov'
-                            elif 'video/webm' in content_type:
-                                detected_extension = '.webm'
-                            elif 'image/gif' in content_type:
-                                detected_extension = '.gif'
-                            else:
-                                # 使用原有的扩展名，如果无法确定
-                                detected_extension = '.' + inferred_extension if inferred_extension else ''
-
-                    # 动态调整文件路径的扩展名
-                    if detected_extension:
-                        file_path = re.sub(r'\.\w+$', detected_extension, file_path)
-
-                    # 保存文件
-                    if not os.path.isfile(file_path):
-                        with open(file_path, "wb") as f:
-                            f.write(downloaded)
-                            logger.debug("[DEBUG] save " + file_path)
-
-                    success = True
-                    logger.debug("[DEBUG] success " + url + "  " + str(try_count))
-                    break  # 下载成功，退出重试循环
-
-                except RequestException as e:
-                    try_count += 1
-                    logger.error(f"[ERROR] 请求失败，错误信息：{e}。尝试次数：{try_count}/{MAX_TRY_COUNT}")
-                    sleep_time = 2 ** try_count  # 指数退避
-                    sleep(sleep_time)
-                except Exception as e:
-                    logger.exception(f"[ERROR] 下载过程中发生错误: {e}")
-                    break  # 对于其他异常，退出重试
+                return True
+
+            # 边下载边写入临时文件，中断后再次下载时从断点续传
+            saved_path = self.downloader.fetch(
+                url, file_path, self.headers, ranged=type in ("video", "live_photo")
+            )
+            success = saved_path is not None
 
             if success:
                 if "sqlite" in self.write_mode and not sqlite_exist:
-                    self.insert_file_sqlite(
-                        file_path, weibo_id, url, downloaded
-                    )
+                    self.insert_file_sqlite(saved_path, weibo_id, url)
             else:
                 logger.debug("[DEBUG] failed " + url + " TOTALLY")
-                error_file = self.get_filepath(type) + os.sep + "not_downloaded.txt"
-                with open(error_file, "ab") as f:
-                    error_entry = f"{weibo_id}:{file_path}:{url}\n"
-                    f.write(error_entry.encode(sys.stdout.encoding))
+                self.record_not_downloaded(type, f"{weibo_id}:{file_path}:{url}\n")
+            return success
         except Exception as e:
             # 生成原始微博URL
             original_url = f"https://m.weibo.cn/detail/{weibo_id}"  # 新增
-            error_file = self.get_filepath(type) + os.sep + "not_downloaded.txt"
+            # 修改错误条目格式，添加原始URL
+            self.record_not_downloaded(type, f"{weibo_id}:{file_path}:{url}:{original_url}\n")  # 修改
+            logger.exception(e)
+            return False
+
+    def record_not_downloaded(self, type, error_entry):
+        """把下载失败的文件追加到not_downloaded.txt，下载线程池中的线程共用该文件，需要加锁"""
+        error_file = self.get_filepath(type) + os.sep + "not_downloaded.txt"
+        with self.write_lock:
             with open(error_file, "ab") as f:
-                # 修改错误条目格式，添加原始URL
-                error_entry = f"{weibo_id}:{file_path}:{url}:{original_url}\n"  # 修改
                 f.write(error_entry.encode(sys.stdout.encoding))
-            logger.exception(e)
 
     def sqlite_exist_file(self, url):
         if not os.path.exists(self.get_sqlte_path()):
             return True
-        con = self.get_sqlite_connection()
-        cur = con.cursor()
-
         query_sql = """SELECT url FROM bins WHERE path=? """
-        count = cur.execute(query_sql, (url,)).fetchone()
-        con.close()
+        count = self.get_sqlite_writer().query_one(query_sql, (url,))
         if count is None:
             return False
 
         return True
 
-    def insert_file_sqlite(self, file_path, weibo_id, url, binary):
+    def insert_file_sqlite(self, file_path, weibo_id, url):
         if not weibo_id:
             return
         if self.store_binary_in_sqlite != 1:  # 新增配置判断
@@ -752,22 +746,26 @@ class Weibo(object):
         extension = Path(file_path).suffix
         if not extension:
             return
-        if len(binary) <= 0:
+        if os.path.getsize(file_path) <= 0:
             return
+        # 文件内容存入按sha256寻址的文件存储，相同内容只存一份，bins表只记录元数据
+        sha256, size = self.get_blob_store().put_file(file_path)
 
         file_data = OrderedDict()
         file_data["weibo_id"] = weibo_id
         file_data["ext"] = extension
-        file_data["data"] = binary  # 仅当启用时存储二进制
+        file_data["sha256"] = sha256
+        file_data["size"] = size
         file_data["path"] = file_path
         file_data["url"] = url
 
-        con = self.get_sqlite_connection()
-        self.sqlite_insert(con, file_data, "bins")
-        con.close()
+        # 下载在线程池中进行，每个线程只提交自己插入的行
+        with self.get_sqlite_writer().batch():
+            self.sqlite_insert(file_data, "bins")
 
     def handle_download(self, file_type, file_dir, urls, w):
-        """处理下载相关操作"""
+        """生成一条微博的下载任务，每个任务为download_one_file的参数元组"""
+        tasks = []
         file_prefix = w["created_at"][:11].replace("-", "") + "_" + str(w["id"])
         if file_type == "img":
             if "," in urls:
@@ -780,7 +778,7 @@ class Weibo(object):
                         file_suffix = url[index:]
                     file_name = file_prefix + "_" + str(i + 1) + file_suffix
                     file_path = file_dir + os.sep + file_name
-                    self.download_one_file(url, file_path, file_type, w["id"])
+                    tasks.append((url, file_path, file_type, w["id"]))
             else:
                 index = urls.rfind(".")
                 if len(urls) - index > 5:
@@ -789,7 +787,7 @@ class Weibo(object):
                     file_suffix = urls[index:]
                 file_name = file_prefix + file_suffix
                 file_path = file_dir + os.sep + file_name
-                self.download_one_file(urls, file_path, file_type, w["id"])
+                tasks.append((urls, file_path, file_type, w["id"]))
         elif file_type == "video" or file_type == "live_photo":
             file_suffix = ".mp4"
             if ";" in urls:
@@ -799,15 +797,18 @@ class Weibo(object):
                         file_suffix = ".mov"
                     file_name = file_prefix + "_" + str(i + 1) + file_suffix
                     file_path = file_dir + os.sep + file_name
-                    self.download_one_file(url, file_path, file_type, w["id"])
+                    tasks.append((url, file_path, file_type, w["id"]))
             else:
                 if urls.endswith(".mov"):
                     file_suffix = ".mov"
                 file_name = file_prefix + file_suffix
                 file_path = file_dir + os.sep + file_name
-                self.download_one_file(urls, file_path, file_type, w["id"])
+                tasks.append((urls, file_path, file_type, w["id"]))
+        return tasks
 
-    def download_files(self, file_type, weibo_type, wrote_count):
+    def get_download_tasks(self, file_type, weibo_type, weibos):
+        """获取某类文件的全部下载任务"""
+        tasks = []
         try:
             describe = ""
             if file_type == "img":
@@ -820,107 +821,73 @@ class Weibo(object):
                 describe = "Live Photo视频"
                 key = "live_photo_url"
             else:
-                return
-            
+                return tasks
+
             if weibo_type == "original":
                 describe = "原创微博" + describe
             else:
                 describe = "转发微博" + describe
-            
-            logger.info("即将进行%s下载", describe)
+
             file_dir = self.get_filepath(file_type)
             file_dir = file_dir + os.sep + describe
-            
-            # 检查是否有文件需要下载
-            has_files = False
-            for w in self.weibo[wrote_count:]:
+
+            for w in weibos:
                 if weibo_type == "retweet":
                     if w.get("retweet"):
                         w = w["retweet"]
                     else:
                         continue
                 if w.get(key):
-                    has_files = True
-                    break
-            
-            if has_files:
+                    tasks += self.handle_download(file_type, file_dir, w.get(key), w)
+
+            if tasks:
                 if not os.path.isdir(file_dir):
                     os.makedirs(file_dir)
-                
-                for w in tqdm(self.weibo[wrote_count:], desc="Download progress"):
-                    if weibo_type == "retweet":
-                        if w.get("retweet"):
-                            w = w["retweet"]
-                        else:
-                            continue
-                    if w.get(key):
-                        self.handle_download(file_type, file_dir, w.get(key), w)
-                
-                logger.info("%s下载完毕,保存路径:", describe)
+                logger.info("即将进行%s下载，共%d个文件，保存路径:", describe, len(tasks))
                 logger.info(file_dir)
             else:
                 logger.info("没有%s需要下载", describe)
         except Exception as e:
             logger.exception(e)
-
-    def get_location(self, selector):
-        """获取微博发布位置"""
-        location_icon = "timeline_card_small_location_default.png"
-        span_list = selector.xpath("//span")
-        location = ""
-        for i, span in enumerate(span_list):
-            if span.xpath("img/@src"):
-                if location_icon in span.xpath("img/@src")[0]:
-                    location = span_list[i + 1].xpath("string(.)")
-                    break
-        return location
-
-    def get_article_url(self, selector):
-        """获取微博中头条文章的url"""
-        article_url = ""
-        text = selector.xpath("string(.)")
-        if text.startswith("发布了头条文章"):
-            url = selector.xpath("//a/@data-url")
-            if url and url[0].startswith("http://t.cn"):
-                article_url = url[0]
-        return article_url
-
-    def get_topics(self, selector):
-        """获取参与的微博话题"""
-        span_list = selector.xpath("//span[@class='surl-text']")
-        topics = ""
-        topic_list = []
-        for span in span_list:
-            text = span.xpath("string(.)")
-            if len(text) > 2 and text[0] == "#" and text[-1] == "#":
-                topic_list.append(text[1:-1])
-        if topic_list:
-            topics = ",".join(topic_list)
-        return topics
-
-    def get_at_users(self, selector):
-        """获取@用户"""
-        a_list = selector.xpath("//a")
-        at_users = ""
-        at_list = []
-        for a in a_list:
-            if "@" + a.xpath("@href")[0][3:] == a.xpath("string(.)"):
-                at_list.append(a.xpath("string(.)")[1:])
-        if at_list:
-            at_users = ",".join(at_list)
-        return at_users
+        return tasks
+
+    @tracing.span("download_files")
+    def download_files(self, weibos):
+        """并发下载本批微博中需要下载的全部图片、视频"""
+        tasks = []
+        if self.original_pic_download:
+            tasks += self.get_download_tasks("img", "original", weibos)
+        if self.original_video_download:
+            tasks += self.get_download_tasks("video", "original", weibos)
+        if self.original_live_photo_download:
+            tasks += self.get_download_tasks("live_photo", "original", weibos)
+        # 下载转发微博文件（如果不禁爬转发）
+        if not self.only_crawl_original:
+            if self.retweet_pic_download:
+                tasks += self.get_download_tasks("img", "retweet", weibos)
+            if self.retweet_video_download:
+                tasks += self.get_download_tasks("video", "retweet", weibos)
+            if self.retweet_live_photo_download:
+                tasks += self.get_download_tasks("live_photo", "retweet", weibos)
+        if not tasks:
+            return
+        success_count, failed_count = self.downloader.run(tasks, self.download_one_file)
+        logger.info("文件下载完毕，成功%d个，失败%d个", success_count, failed_count)
 
     def string_to_int(self, string):
-        """字符串转换为整数"""
+        """字符串转换为整数，“1.5万”、“100万+”、“2亿”按整数计算，没有浮点误差"""
         if isinstance(string, int):
             return string
-        elif string.endswith("万+"):
-            string = string[:-2] + "0000"
-        elif string.endswith("万"):
-            string = float(string[:-1]) * 10000
-        elif string.endswith("亿"):
-            string = float(string[:-1]) * 100000000
-        return int(string)
+        unit = string[-2:] if string.endswith("万+") else string[-1:]
+        multiple = COUNT_UNITS.get(unit)
+        if multiple is None:
+            return int(string)
+        number = string[: -len(unit)]
+        if "." not in number:
+            return int(number) * multiple
+        whole, fraction = number.split(".")
+        digits = len(str(multiple)) - 1  # 小数部分超出的位数舍去，与int()截断相同
+        return int(whole or "0") * multiple + int(fraction[:digits].ljust(digits, "0"))
 
     def standardize_date(self, created_at):
         """标准化微博发布时间"""
@@ -946,23 +913,15 @@ class Weibo(object):
         return created_at, full_created_at
 
     def standardize_info(self, weibo):
-        """标准化信息，去除乱码"""
+        """标准化信息，去除字符串中的零宽空格和无法编码的字符，结果与终端编码无关"""
         for k, v in weibo.items():
-            if (
-                "bool" not in str(type(v))
-                and "int" not in str(type(v))
-                and "list" not in str(type(v))
-                and "long" not in str(type(v))
-            ):
-                weibo[k] = (
-                    v.replace("\u200b", "")
-                    .encode(sys.stdout.encoding, "ignore")
-                    .decode(sys.stdout.encoding)
-                )
+            standardize = STANDARDIZERS.get(type(v))
+            if standardize is not None:
+                weibo[k] = standardize(v)
         return weibo
 
     def parse_weibo(self, weibo_info):
-        weibo = OrderedDict()
+        weibo = {}
         if weibo_info["user"]:
             weibo["user_id"] = weibo_info["user"]["id"]
             weibo["screen_name"] = weibo_info["user"]["screen_name"]
@@ -971,25 +930,16 @@ class Weibo(object):
             weibo["screen_name"] = ""
         weibo["id"] = int(weibo_info["id"])
         weibo["bid"] = weibo_info["bid"]
-        text_body = weibo_info["text"]
-        selector = etree.HTML(f"{text_body}<hr>" if text_body.isspace() else text_body)
-        if self.remove_html_tag:
-            text_list = selector.xpath("//text()")
-            # 若text_list中的某个字符串元素以 @ 或 # 开始，则将该元素与前后元素合并为新元素，否则会带来没有必要的换行
-            text_list_modified = []
-            for ele in range(len(text_list)):
-                if ele > 0 and (text_list[ele-1].startswith(('@','#')) or text_list[ele].startswith(('@','#'))):
-                    text_list_modified[-1] += text_list[ele]
-                else:
-                    text_list_modified.append(text_list[ele])
-            weibo["text"] = "\n".join(text_list_modified)
-        else:
-            weibo["text"] = text_body
-        weibo["article_url"] = self.get_article_url(selector)
+        # 正文只解析一次，同时得到位置、话题、@用户和头条文章url
+        text, article_url, location, topics, at_users = html_extractor.extract(
+            weibo_info["text"], self.remove_html_tag
+        )
+        weibo["text"] = text
+        weibo["article_url"] = article_url
         weibo["pics"] = self.get_pics(weibo_info)
         weibo["video_url"] = self.get_video_url(weibo_info)  # 普通视频URL
         weibo["live_photo_url"] = self.get_live_photo_url(weibo_info)  # Live Photo视频URL
-        weibo["location"] = self.get_location(selector)
+        weibo["location"] = location
         weibo["created_at"] = weibo_info["created_at"]
         weibo["source"] = weibo_info["source"]
         weibo["attitudes_count"] = self.string_to_int(
@@ -999,14 +949,9 @@ class Weibo(object):
             weibo_info.get("comments_count", 0)
         )
         weibo["reposts_count"] = self.string_to_int(weibo_info.get("reposts_count", 0))
-        weibo["topics"] = self.get_topics(selector)
-        weibo["at_users"] = self.get_at_users(selector)
-        
-        # 使用 LLM 分析微博内容
-        if self.llm_analyzer:
-            weibo = self.llm_analyzer.analyze_weibo(weibo)
-            logger.info("完整分析结果：\n%s", json.dumps(weibo, ensure_ascii=False, indent=2))
-        return self.standardize_info(weibo)
+        weibo["topics"] = topics
+        weibo["at_users"] = at_users
+        return WeiboRecord(**self.standardize_info(weibo))
 
     def print_user_info(self):
         """打印用户信息"""
@@ -1060,6 +1005,7 @@ class Weibo(object):
         self.print_one_weibo(weibo)
         logger.info("-" * 120)
 
+    @tracing.span("get_one_weibo")
     def get_one_weibo(self, info):
         """获取一条微博的全部信息"""
         try:
@@ -1073,33 +1019,35 @@ class Weibo(object):
                 retweet_id = retweeted_status.get("id")
                 is_long_retweet = retweeted_status.get("isLongText")
                 if is_long:
-                    weibo = self.get_long_weibo(weibo_id)
+                    weibo = self.get_long_weibo_cached(weibo_info)
                     if not weibo:
                         weibo = self.parse_weibo(weibo_info)
                 else:
                     weibo = self.parse_weibo(weibo_info)
                 if is_long_retweet:
-                    retweet = self.get_long_weibo(retweet_id)
+                    retweet = self.get_long_weibo_cached(retweeted_status)
                     if not retweet:
                         retweet = self.parse_weibo(retweeted_status)
                 else:
                     retweet = self.parse_weibo(retweeted_status)
-                (
-                    retweet["created_at"],
-                    retweet["full_created_at"],
-                ) = self.standardize_date(retweeted_status["created_at"])
-                weibo["retweet"] = retweet
+                created_at, full_created_at = self.standardize_date(
+                    retweeted_status["created_at"]
+                )
+                retweet = retweet.replace(
+                    created_at=created_at, full_created_at=full_created_at
+                )
             else:  # 原创
+                retweet = None
                 if is_long:
-                    weibo = self.get_long_weibo(weibo_id)
+                    weibo = self.get_long_weibo_cached(weibo_info)
                     if not weibo:
                         weibo = self.parse_weibo(weibo_info)
                 else:
                     weibo = self.parse_weibo(weibo_info)
-            weibo["created_at"], weibo["full_created_at"] = self.standardize_date(
-                weibo_info["created_at"]
+            created_at, full_created_at = self.standardize_date(weibo_info["created_at"])
+            return weibo.replace(
+                created_at=created_at, full_created_at=full_created_at, retweet=retweet
             )
-            return weibo
         except Exception as e:
             logger.exception(e)
 
@@ -1148,7 +1096,7 @@ class Weibo(object):
         params = {"mid": id}
         if max_id:
             params["max_id"] = max_id
-        url = "https://m.weibo.cn/comments/hotflow?max_id_type=0"
+        url = self.api_base + "/comments/hotflow?max_id_type=0"
         req = self.session.get(
             url,
             params=params,
@@ -1180,13 +1128,10 @@ class Weibo(object):
             # 没有了可以直接跳出递归
             return
 
+        metrics.COMMENTS.inc(count)
         if on_downloaded:
             on_downloaded(weibo, comments)
 
-        # 随机睡眠一下
-        if max_count % 40 == 0:
-            sleep(random.randint(1, 5))
-
         cur_count += count
         max_id = data.get("max_id")
 
@@ -1210,7 +1155,7 @@ class Weibo(object):
         if cur_count >= max_count:
             return
         id = weibo["id"]
-        url = "https://m.weibo.cn/api/comments/show?id={id}&page={page}".format(
+        url = self.api_base + "/api/comments/show?id={id}&page={page}".format(
             id=id, page=page
         )
         req = self.session.get(url)
@@ -1230,16 +1175,13 @@ class Weibo(object):
             # 没有了可以直接跳出递归
             return
 
+        metrics.COMMENTS.inc(count)
         if on_downloaded:
             on_downloaded(weibo, comments)
 
         cur_count += count
         page += 1
 
-        # 随机睡眠一下
-        if page % 2 == 0:
-            sleep(random.randint(1, 5))
-
         req_page = data.get("max")
 
         if req_page == 0:
@@ -1264,7 +1206,7 @@ class Weibo(object):
         if cur_count >= max_count:
             return
         id = weibo["id"]
-        url = "https://m.weibo.cn/api/statuses/repostTimeline"
+        url = self.api_base + "/api/statuses/repostTimeline"
         params = {"id": id, "page": page}
         req = self.session.get(
             url,
@@ -1290,16 +1232,13 @@ class Weibo(object):
             # 没有了可以直接跳出递归
             return
 
+        metrics.REPOSTS.inc(count)
         if on_downloaded:
             on_downloaded(weibo, reposts)
 
         cur_count += count
         page += 1
 
-        # 随机睡眠一下
-        if page % 2 == 0:
-            sleep(random.randint(2, 5))
-
         req_page = data.get("max")
 
         if req_page == 0:
@@ -1318,14 +1257,32 @@ class Weibo(object):
         return isTop
     
 
+    def is_seen_unchanged(self, info, value):
+        """判断能否不解析就跳过以前已写入且内容未变化的微博
+
+        append模式和检查cookie时需要解析每条微博，早于since_date的微博也照常解析以便结束翻页，这些情况都不提前跳过。
+        """
+        if (
+            value is None
+            or not self.seen_ids_config.get("skip_seen")
+            or const.MODE == "append"
+            or (const.CHECK_COOKIE["CHECK"] and not const.CHECK_COOKIE["CHECKED"])
+        ):
+            return False
+        weibo_info = info["mblog"]
+        if self.seen_weibos.get(int(weibo_info["id"])) != value:
+            return False
+        created_at = datetime.strptime(
+            self.standardize_date(weibo_info["created_at"])[0], DTFORMAT
+        )
+        return created_at >= datetime.strptime(self.user_config["since_date"], DTFORMAT)
+
+    @tracing.span("get_one_page")
     def get_one_page(self, page):
         """获取一页的全部微博"""
+        metrics.PAGES.inc()
         try:
             js = self.get_weibo_json(page)
-            import json
-            with open('js.json','w') as f:
-                #写入方式1，等价于下面这行
-                json.dump(js,f) #把列表numbers内容写入到"list.json"文件中
             if js["ok"]:
                 weibos = js["data"]["cards"]
                 
@@ -1340,6 +1297,11 @@ class Weibo(object):
                         else:
                             w = w
                     if w["card_type"] == 9:
+                        value = fingerprint(w["mblog"]) if self.seen_ids else None
+                        if self.is_seen_unchanged(w, value):
+                            # 以前已写入且内容未变化的微博不再解析和重复写入
+                            self.weibo_id_set.add(int(w["mblog"]["id"]))
+                            continue
                         wb = self.get_one_weibo(w)
                         if wb:
                             if (
@@ -1353,7 +1315,7 @@ class Weibo(object):
                                 logger.info("cookie检查通过")
                                 if const.CHECK_COOKIE["EXIT_AFTER_CHECK"]:
                                     return True
-                            if wb["id"] in self.weibo_id_list:
+                            if wb["id"] in self.weibo_id_set:
                                 continue
                             created_at = datetime.strptime(wb["created_at"], DTFORMAT)
                             since_date = datetime.strptime(
@@ -1365,18 +1327,20 @@ class Weibo(object):
                                 # 由于微博本身的调整，下面判断是否为置顶的代码已失效，默认所有用户第一条均为置顶
                                 if self.is_pinned_weibo(w):
                                     continue
-                                if const.CHECK_COOKIE["GUESS_PIN"]:
-                                    const.CHECK_COOKIE["GUESS_PIN"] = False
+                                if self.guess_pin:
+                                    self.guess_pin = False
                                     continue
 
                                 if self.first_crawler:
                                     # 置顶微博的具体时间不好判定，将非置顶微博当成最新微博，写入上次抓取id的csv
                                     self.latest_weibo_id = str(wb["id"])
-                                    csvutil.update_last_weibo_id(
-                                        wb["user_id"],
-                                        str(wb["id"]) + " " + wb["created_at"],
-                                        self.user_csv_file_path,
-                                    )
+                                    # users.csv由所有用户共用，与user_to_csv一样需要加锁
+                                    with self.write_lock:
+                                        csvutil.update_last_weibo_id(
+                                            wb["user_id"],
+                                            str(wb["id"]) + " " + wb["created_at"],
+                                            self.user_csv_file_path,
+                                        )
                                     self.first_crawler = False
                                 if str(wb["id"]) == self.last_weibo_id:
                                     if const.CHECK_COOKIE["CHECK"] and (
@@ -1426,10 +1390,21 @@ class Weibo(object):
                                         )
                                     )
                                     return True
+                            if (
+                                self.seen_ids_config.get("skip_seen")
+                                and value is not None
+                                and self.seen_weibos.get(wb["id"]) == value
+                            ):
+                                # 以前已写入且内容未变化的微博不再重复写入
+                                self.weibo_id_set.add(wb["id"])
+                                continue
                             if (not self.only_crawl_original) or ("retweet" not in wb.keys()):
                                 self.weibo.append(wb)
-                                self.weibo_id_list.append(wb["id"])
+                                self.weibo_id_set.add(wb["id"])
+                                if self.seen_ids:
+                                    self.weibo.fingerprints[wb["id"]] = value
                                 self.got_count += 1
+                                metrics.WEIBOS.inc()
                                 # 这里是系统日志输出，尽量别太杂
                                 logger.info(
                                     "已获取用户 {} 的微博，内容为 {}".format(
@@ -1478,10 +1453,10 @@ class Weibo(object):
                 "中的“设置cookie”部分设置cookie信息"
             )
 
-    def get_write_info(self, wrote_count):
+    def get_write_info(self, weibos):
         """获取要写入的微博信息"""
         write_info = []
-        for w in self.weibo[wrote_count:]:
+        for w in weibos:
             wb = OrderedDict()
             for k, v in w.items():
                 if k not in ["user_id", "screen_name", "retweet"]:
@@ -1553,9 +1528,9 @@ class Weibo(object):
             result_headers = result_headers + result_headers2 + result_headers3
         return result_headers
 
-    def write_csv(self, wrote_count):
+    def write_csv(self, weibos):
         """将爬到的信息写入csv文件"""
-        write_info = self.get_write_info(wrote_count)
+        write_info = self.get_write_info(weibos)
         result_headers = self.get_result_headers()
         result_data = [w.values() for w in write_info]
         file_path = self.get_filepath("csv")
@@ -1582,7 +1557,7 @@ class Weibo(object):
                     writer.writerows([headers])
                 writer.writerows(result_data)
         if headers[0] == "id":
-            logger.info("%d条微博写入csv文件完毕,保存路径:", self.got_count)
+            logger.info("%d条微博写入csv文件完毕,保存路径:", len(result_data))
         else:
             logger.info("%s 信息写入csv文件完毕，保存路径:", self.user["screen_name"])
         logger.info(file_path)
@@ -1612,18 +1587,17 @@ class Weibo(object):
             data["weibo"] = weibo_info
         return data
 
-    def write_json(self, wrote_count):
+    def write_json(self, weibos):
         """将爬到的信息写入json文件"""
         data = {}
         path = self.get_filepath("json")
         if os.path.isfile(path):
             with codecs.open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
-        weibo_info = self.weibo[wrote_count:]
-        data = self.update_json_data(data, weibo_info)
+        data = self.update_json_data(data, list(weibos))
         with codecs.open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
-        logger.info("%d条微博写入json文件完毕,保存路径:", self.got_count)
+            json.dump(data, f, ensure_ascii=False, default=json_default)
+        logger.info("%d条微博写入json文件完毕,保存路径:", len(weibos))
         logger.info(path)
 
     def send_post_request_with_token(self, url, data, token, max_retries, backoff_factor):
@@ -1631,29 +1605,31 @@ class Weibo(object):
             'Content-Type': 'application/json',
             'api-token': f'{token}',
         }
+        # 微博是WeiboRecord，requests的json参数无法序列化，这里自行编码
+        body = json.dumps(data, allow_nan=False, default=json_default).encode("utf-8")
         for attempt in range(max_retries + 1):
             try:
-                response = self.session.get(url, json=data, headers=headers)
+                response = self.session.get(url, data=body, headers=headers)
                 if response.status_code == requests.codes.ok:
                     return response.json()
                 else:
                     raise RequestException(f"Unexpected response status: {response.status_code}")
             except RequestException as e:
                 if attempt < max_retries:
-                    sleep(backoff_factor * (attempt + 1))  # 逐步增加等待时间，避免频繁重试
+                    time.sleep(backoff_factor * (attempt + 1))  # 逐步增加等待时间，避免频繁重试
                     continue
                 else:
                     logger.error(f"在尝试{max_retries}次发出POST连接后，请求失败：{e}")
 
-    def write_post(self, wrote_count):
+    def write_post(self, weibos):
         """将爬到的信息通过POST发出"""
         data = {}
         data['user'] = self.user
-        weibo_info = self.weibo[wrote_count:]
+        weibos = list(weibos)
         if data.get('weibo'):
-            data['weibo'] += weibo_info
+            data['weibo'] += weibos
         else:
-            data['weibo'] = weibo_info
+            data['weibo'] = weibos
 
         if data:
             self.send_post_request_with_token(self.post_config["api_url"], data, self.post_config["api_token"], 3, 2)
@@ -1675,23 +1651,17 @@ class Weibo(object):
             client = MongoClient(self.mongodb_URI)
             db = client["weibo"]
             collection = db[collection]
-            if len(self.write_mode) > 1:
-                new_info_list = copy.deepcopy(info_list)
-            else:
-                new_info_list = info_list
-            for info in new_info_list:
-                if not collection.find_one({"id": info["id"]}):
-                    collection.insert_one(info)
-                else:
-                    collection.update_one({"id": info["id"]}, {"$set": info})
+            # upsert不会像insert_one那样给info添加_id，因此不需要复制
+            for info in info_list:
+                collection.update_one({"id": info["id"]}, {"$set": info}, upsert=True)
         except pymongo.errors.ServerSelectionTimeoutError:
             logger.warning("系统中可能没有安装或启动MongoDB数据库，请先根据系统环境安装或启动MongoDB，再运行程序")
             sys.exit()
 
-    def weibo_to_mongodb(self, wrote_count):
+    def weibo_to_mongodb(self, weibos):
         """将爬取的微博信息写入MongoDB数据库"""
-        self.info_to_mongodb("weibo", self.weibo[wrote_count:])
-        logger.info("%d条微博写入MongoDB数据库完毕", self.got_count)
+        self.info_to_mongodb("weibo", weibos)
+        logger.info("%d条微博写入MongoDB数据库完毕", len(weibos))
 
     def mysql_create(self, connection, sql):
         """创建MySQL数据库或表"""
@@ -1771,7 +1741,7 @@ class Weibo(object):
             finally:
                 connection.close()
 
-    def weibo_to_mysql(self, wrote_count):
+    def weibo_to_mysql(self, weibos):
         """将爬取的微博信息写入MySQL数据库"""
         mysql_config = {
             "host": "localhost",
@@ -1805,98 +1775,54 @@ class Weibo(object):
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
         self.mysql_create_table(mysql_config, create_table)
 
-        # 要插入的微博列表
-        weibo_list = []
-        # 要插入的转发微博列表
-        retweet_list = []
-        if len(self.write_mode) > 1:
-            info_list = copy.deepcopy(self.weibo[wrote_count:])
-        else:
-            info_list = self.weibo[wrote_count:]
-        for w in info_list:
-            w["created_at"] = w["full_created_at"]
-            del w["full_created_at"]
-
-            if "retweet" in w:
-                r = w["retweet"]
-                r["retweet_id"] = ""
-                r["created_at"] = r["full_created_at"]
-                del r["full_created_at"]
-                retweet_list.append(r)
-                w["retweet_id"] = r["id"]
-                del w["retweet"]
-            else:
-                w["retweet_id"] = ""
-            weibo_list.append(w)
+        # 要插入的微博列表和被转发的原微博列表
+        weibo_list, retweet_list = split_rows(weibos)
         # 在'weibo'表中插入或更新微博数据
         self.mysql_insert(mysql_config, "weibo", retweet_list)
         self.mysql_insert(mysql_config, "weibo", weibo_list)
-        logger.info("%d条微博写入MySQL数据库完毕", self.got_count)
-
-    def weibo_to_sqlite(self, wrote_count):
-        con = self.get_sqlite_connection()
-        weibo_list = []
-        retweet_list = []
-        info_list = copy.deepcopy(self.weibo[wrote_count:])
-        for w in info_list:
-            if "retweet" in w:
-                w["retweet"]["retweet_id"] = ""
-                retweet_list.append(w["retweet"])
-                w["retweet_id"] = w["retweet"]["id"]
-                del w["retweet"]
-            else:
-                w["retweet_id"] = ""
-            weibo_list.append(w)
+        logger.info("%d条微博写入MySQL数据库完毕", len(weibos))
+
+    def weibo_to_sqlite(self, weibos):
+        weibo_list, retweet_list = split_rows(weibos)
 
         comment_max_count = self.comment_max_download_count
         repost_max_count = self.comment_max_download_count
         download_comment = self.download_comment and comment_max_count > 0
         download_repost = self.download_repost and repost_max_count > 0
 
-        count = 0
-        for weibo in weibo_list:
-            self.sqlite_insert_weibo(con, weibo)
-            if (download_comment) and (weibo["comments_count"] > 0):
-                self.get_weibo_comments(
-                    weibo, comment_max_count, self.sqlite_insert_comments
-                )
-                count += 1
-                if count % 20:
-                    sleep(random.randint(3, 6))
-            if (download_repost) and (weibo["reposts_count"] > 0):
-                self.get_weibo_reposts(
-                    weibo, repost_max_count, self.sqlite_insert_reposts
-                )
-                count += 1
-                if count % 20:
-                    sleep(random.randint(3, 6))
+        # 本批微博及其评论、转发在一个事务中提交，中途出错时整批丢弃
+        with self.get_sqlite_writer().batch():
+            for weibo in weibo_list:
+                self.sqlite_insert_weibo(weibo)
+                if (download_comment) and (weibo["comments_count"] > 0):
+                    self.get_weibo_comments(
+                        weibo, comment_max_count, self.sqlite_insert_comments
+                    )
+                if (download_repost) and (weibo["reposts_count"] > 0):
+                    self.get_weibo_reposts(
+                        weibo, repost_max_count, self.sqlite_insert_reposts
+                    )
 
-        for weibo in retweet_list:
-            self.sqlite_insert_weibo(con, weibo)
-        con.close()
+            for weibo in retweet_list:
+                self.sqlite_insert_weibo(weibo)
 
     def sqlite_insert_comments(self, weibo, comments):
         if not comments or len(comments) == 0:
             return
-        con = self.get_sqlite_connection()
         for comment in comments:
             data = self.parse_sqlite_comment(comment, weibo)
-            self.sqlite_insert(con, data, "comments")
+            self.sqlite_insert(data, "comments")
             if "comments" in comment and isinstance(comment["comments"], list):
                 for c in comment["comments"]:
                     data = self.parse_sqlite_comment(c, weibo)
-                    self.sqlite_insert(con, data, "comments")
-        con.close()
+                    self.sqlite_insert(data, "comments")
 
     def sqlite_insert_reposts(self, weibo, reposts):
         if not reposts or len(reposts) == 0:
             return
-        con = self.get_sqlite_connection()
         for repost in reposts:
             data = self.parse_sqlite_repost(repost, weibo)
-            self.sqlite_insert(con, data, "reposts")
-
-        con.close()
+            self.sqlite_insert(data, "reposts")
 
     def parse_sqlite_comment(self, comment, weibo):
         if not comment:
@@ -1972,42 +1898,17 @@ class Weibo(object):
         if value:
             dict[source_name] = value
 
-    def sqlite_insert_weibo(self, con: sqlite3.Connection, weibo: dict):
-        sqlite_weibo = self.parse_sqlite_weibo(weibo)
-        self.sqlite_insert(con, sqlite_weibo, "weibo")
-
-    def parse_sqlite_weibo(self, weibo):
-        if not weibo:
-            return
-        sqlite_weibo = OrderedDict()
-        sqlite_weibo["user_id"] = weibo["user_id"]
-        sqlite_weibo["id"] = weibo["id"]
-        sqlite_weibo["bid"] = weibo["bid"]
-        sqlite_weibo["screen_name"] = weibo["screen_name"]
-        sqlite_weibo["text"] = weibo["text"]
-        sqlite_weibo["article_url"] = weibo["article_url"]
-        sqlite_weibo["topics"] = weibo["topics"]
-        sqlite_weibo["pics"] = weibo["pics"]
-        sqlite_weibo["video_url"] = weibo["video_url"]
-        sqlite_weibo["live_photo_url"] = weibo["live_photo_url"]
-        sqlite_weibo["location"] = weibo["location"]
-        sqlite_weibo["created_at"] = weibo["full_created_at"]
-        sqlite_weibo["source"] = weibo["source"]
-        sqlite_weibo["attitudes_count"] = weibo["attitudes_count"]
-        sqlite_weibo["comments_count"] = weibo["comments_count"]
-        sqlite_weibo["reposts_count"] = weibo["reposts_count"]
-        sqlite_weibo["retweet_id"] = weibo["retweet_id"]
-        sqlite_weibo["at_users"] = weibo["at_users"]
-        return sqlite_weibo
+    def sqlite_insert_weibo(self, weibo):
+        """weibo为split_rows得到的行，字段与weibo表相同，直接插入"""
+        self.sqlite_insert(weibo, "weibo")
 
     def user_to_sqlite(self):
-        con = self.get_sqlite_connection()
-        self.sqlite_insert_user(con, self.user)
-        con.close()
+        with self.get_sqlite_writer().batch():
+            self.sqlite_insert_user(self.user)
 
-    def sqlite_insert_user(self, con: sqlite3.Connection, user: dict):
+    def sqlite_insert_user(self, user: dict):
         sqlite_user = self.parse_sqlite_user(user)
-        self.sqlite_insert(con, sqlite_user, "user")
+        self.sqlite_insert(sqlite_user, "user")
 
     def parse_sqlite_user(self, user):
         if not user:
@@ -2028,41 +1929,42 @@ class Weibo(object):
         sqlite_user["bio"] = user["description"]
         return sqlite_user
 
-    def sqlite_insert(self, con: sqlite3.Connection, data: dict, table: str):
-        if not data:
-            return
-        cur = con.cursor()
-        keys = ",".join(data.keys())
-        values = ",".join(["?"] * len(data))
-        sql = """INSERT OR REPLACE INTO {table}({keys}) VALUES({values})
-                """.format(
-            table=table, keys=keys, values=values
-        )
-        cur.execute(sql, list(data.values()))
-        con.commit()
-
-    def get_sqlite_connection(self):
-        path = self.get_sqlte_path()
-        create = False
-        if not os.path.exists(path):
-            create = True
-
-        con = sqlite3.connect(path)
+    def sqlite_insert(self, data: dict, table: str):
+        writer = self.get_sqlite_writer()
+        writer.insert(table, data)
+        # 同步更新全文索引，与数据在同一个事务中写入
+        fts_table = SQLITE_FTS_TABLES.get(table)
+        if fts_table and str(data.get("id", "")).isdigit():
+            writer.insert(
+                fts_table,
+                OrderedDict([("rowid", int(data["id"])), ("text", data.get("text") or "")]),
+            )
 
-        if create == True:
-            self.create_sqlite_table(connection=con)
+    def get_sqlite_writer(self):
+        """获取本次爬取共用的SQLite写入器
 
-        return con
+        start会在爬取前创建写入器，并发爬取时各用户的Weibo副本因此共用同一个。
+        """
+        if self.sqlite_writer is None:
+            self.sqlite_writer = SqliteWriter(
+                self.get_sqlte_path(),
+                self.get_sqlite_create_sql(),
+                self.get_sqlite_migrations(),
+            )
+        return self.sqlite_writer
 
-    def create_sqlite_table(self, connection: sqlite3.Connection):
-        sql = self.get_sqlite_create_sql()
-        cur = connection.cursor()
-        cur.executescript(sql)
-        connection.commit()
+    def close_sqlite_writer(self):
+        if self.sqlite_writer is not None:
+            self.sqlite_writer.close()
+            self.sqlite_writer = None
 
     def get_sqlte_path(self):
         return "./weibo/weibodata.db"
 
+    def get_blob_store(self):
+        """图片、视频的内容存储，位于数据库文件旁的blobs文件夹"""
+        return BlobStore(os.path.join(os.path.dirname(self.get_sqlte_path()), "blobs"))
+
     def get_sqlite_create_sql(self):
         create_sql = """
                 CREATE TABLE IF NOT EXISTS user (
@@ -2107,7 +2009,8 @@ class Weibo(object):
                 CREATE TABLE IF NOT EXISTS bins (
                     id integer PRIMARY KEY AUTOINCREMENT
                     ,ext varchar(10) NOT NULL /*file extension*/
-                    ,data blob NOT NULL
+                    ,sha256 char(64) NOT NULL /*文件内容在blobs文件夹中的sha256*/
+                    ,size integer
                     ,weibo_id varchar(20)
                     ,comment_id varchar(20)
                     ,path text
@@ -2144,6 +2047,119 @@ class Weibo(object):
                 """
         return create_sql
 
+    def get_sqlite_migrations(self):
+        """数据库升级脚本，第i个脚本将数据库从版本i升级到i+1，已有的脚本不能修改，只能在末尾追加"""
+        return [
+            # 版本1：常用查询的索引。service.py按(created_at, id)分页查询微博，
+            # created_at为NULL的微博按空字符串排序，索引的表达式须与查询一致
+            """
+            CREATE INDEX IF NOT EXISTS idx_bins_path ON bins(path);
+            CREATE INDEX IF NOT EXISTS idx_bins_url ON bins(url);
+            CREATE INDEX IF NOT EXISTS idx_weibo_user_id_created_at_id ON weibo(user_id, COALESCE(created_at, ''), id);
+            CREATE INDEX IF NOT EXISTS idx_weibo_created_at_id ON weibo(COALESCE(created_at, ''), id);
+            CREATE INDEX IF NOT EXISTS idx_comments_weibo_id ON comments(weibo_id);
+            CREATE INDEX IF NOT EXISTS idx_reposts_weibo_id ON reposts(weibo_id);
+            """,
+            # 版本2：bins表不再存储二进制数据
+            self.migrate_bins_to_blob_store,
+            # 版本3：全文检索
+            self.migrate_fts,
+            # 版本4：后台LLM分析的结果
+            """
+            CREATE TABLE IF NOT EXISTS llm_analysis (
+                weibo_id varchar(20) NOT NULL
+                ,sentiment varchar(10)
+                ,summary text
+                ,anomaly text
+                ,model varchar(64)
+                ,analyzed_at DATETIME
+                ,PRIMARY KEY (weibo_id)
+            );
+            """,
+            # 版本5：记录分析结果来自本地分析、缓存还是LLM
+            """
+            ALTER TABLE llm_analysis ADD COLUMN source varchar(10);
+            """,
+        ]
+
+    def get_fts_tokenizer(self, connection):
+        """返回全文索引使用的FTS5分词器：支持时为trigram（SQLite 3.34及以上），否则为unicode61"""
+        try:
+            connection.execute(
+                "CREATE VIRTUAL TABLE temp.fts_tokenizer_check USING fts5(text, tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            return "unicode61"
+        connection.execute("DROP TABLE temp.fts_tokenizer_check")
+        return "trigram"
+
+    def migrate_fts(self, connection):
+        """创建微博、评论和转发的FTS5全文索引并写入已有数据
+
+        trigram分词不依赖词典，适合中文，可匹配任意3个及以上字符的片段，但需要SQLite 3.34及以上；
+        更早的版本改用unicode61分词，service.py的/search会据此改用LIKE查询。
+        """
+        tokenizer = self.get_fts_tokenizer(connection)
+        if tokenizer != "trigram":
+            logger.warning(
+                "SQLite %s不支持trigram分词，全文索引改用%s分词，中文检索将使用LIKE查询",
+                sqlite3.sqlite_version, tokenizer,
+            )
+        for table, fts_table in SQLITE_FTS_TABLES.items():
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(text, tokenize='{tokenizer}')".format(
+                    fts=fts_table, tokenizer=tokenizer
+                )
+            )
+            connection.execute(
+                """INSERT OR REPLACE INTO {fts}(rowid, text)
+                SELECT CAST(id AS INTEGER), IFNULL(text, '') FROM {table}
+                WHERE id != '' AND id NOT GLOB '*[^0-9]*'""".format(fts=fts_table, table=table)
+            )
+
+    def migrate_bins_to_blob_store(self, connection):
+        """将bins表中的二进制数据移入按内容寻址的文件存储，表中只保留sha256等元数据
+
+        新建的数据库中bins表本就没有data列，只需创建sha256索引。
+        """
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(bins)")]
+        if "data" not in columns:
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_bins_sha256 ON bins(sha256)")
+            return
+        blob_store = self.get_blob_store()
+        connection.execute(
+            """
+            CREATE TABLE bins_new (
+                id integer PRIMARY KEY AUTOINCREMENT
+                ,ext varchar(10) NOT NULL /*file extension*/
+                ,sha256 char(64) NOT NULL
+                ,size integer
+                ,weibo_id varchar(20)
+                ,comment_id varchar(20)
+                ,path text
+                ,url text
+            )"""
+        )
+        rows = connection.execute(
+            "SELECT id, ext, data, weibo_id, comment_id, path, url FROM bins"
+        )
+        moved = 0
+        for id, ext, data, weibo_id, comment_id, path, url in rows:
+            moved += 1
+            sha256, size = blob_store.put_bytes(data)
+            connection.execute(
+                """INSERT INTO bins_new(id, ext, sha256, size, weibo_id, comment_id, path, url)
+                VALUES(?, ?, ?, ?, ?, ?, ?, ?)""",
+                (id, ext, sha256, size, weibo_id, comment_id, path, url),
+            )
+        connection.execute("DROP TABLE bins")
+        connection.execute("ALTER TABLE bins_new RENAME TO bins")
+        connection.execute("CREATE INDEX idx_bins_path ON bins(path)")
+        connection.execute("CREATE INDEX idx_bins_url ON bins(url)")
+        connection.execute("CREATE INDEX idx_bins_sha256 ON bins(sha256)")
+        if moved:
+            logger.info("bins表中的%d个文件已移至%s，可执行VACUUM回收数据库空间", moved, blob_store.root)
+
     def update_user_config_file(self, user_config_file_path):
         """更新用户配置文件"""
         with open(user_config_file_path, "rb") as f:
@@ -2169,79 +2185,136 @@ class Weibo(object):
         with codecs.open(user_config_file_path, "w", encoding="utf-8") as f:
             f.write("\n".join(lines))
 
-    def write_data(self, wrote_count):
-        """将爬到的信息写入文件或数据库"""
-        if self.got_count > wrote_count:
-            if "csv" in self.write_mode:
-                self.write_csv(wrote_count)
-            if "json" in self.write_mode:
-                self.write_json(wrote_count)
-            if "post" in self.write_mode:
-                self.write_post(wrote_count)
-            if "mysql" in self.write_mode:
-                self.weibo_to_mysql(wrote_count)
-            if "mongo" in self.write_mode:
-                self.weibo_to_mongodb(wrote_count)
-            if "sqlite" in self.write_mode:
-                self.weibo_to_sqlite(wrote_count)
-            if self.original_pic_download:
-                self.download_files("img", "original", wrote_count)
-            if self.original_video_download:
-                self.download_files("video", "original", wrote_count)
-            if self.original_live_photo_download:
-                self.download_files("live_photo", "original", wrote_count)
-            # 下载转发微博文件（如果不禁爬转发）
-            if not self.only_crawl_original:
-                if self.retweet_pic_download:
-                    self.download_files("img", "retweet", wrote_count)
-                if self.retweet_video_download:
-                    self.download_files("video", "retweet", wrote_count)
-                if self.retweet_live_photo_download:
-                    self.download_files("live_photo", "retweet", wrote_count)
+    def write_data(self, weibos):
+        """将一批微博写入文件或数据库，并下载其中的图片、视频"""
+        if weibos:
+            if self.analysis_queue:
+                self.submit_llm_analysis(weibos)
+            # (写入方式, 写入函数, 是否需要写入锁)。sqlite由SqliteWriter自行加锁，
+            # weibo_to_sqlite请求评论、转发时不占用写入锁；post只发出请求，也不需要加锁
+            sinks = [
+                ("csv", self.write_csv, True),
+                ("json", self.write_json, True),
+                ("post", self.write_post, False),
+                ("mysql", self.weibo_to_mysql, True),
+                ("mongo", self.weibo_to_mongodb, True),
+                ("sqlite", self.weibo_to_sqlite, False),
+            ]
+            for sink, write, locked in sinks:
+                if sink in self.write_mode:
+                    with metrics.SINK_WRITE_SECONDS.time(sink=sink), tracing.span("write_" + sink):
+                        if locked:
+                            with self.write_lock:
+                                write(weibos)
+                        else:
+                            write(weibos)
+            if self.seen_ids:
+                self.mark_seen(weibos)
+            self.download_files(weibos)
+
+    def mark_seen(self, weibos):
+        """记录本批已写入的微博，下次运行时可据此跳过内容未变化的微博"""
+        user_id = self.user_config["user_id"]
+        fingerprints = getattr(weibos, "fingerprints", {})
+        for w in weibos:
+            value = fingerprints.get(w["id"])
+            if value is not None:
+                self.seen_ids.add(user_id, w["id"], value)
+        self.seen_ids.flush()
+
+    def submit_llm_analysis(self, weibos):
+        """把本批新爬取的微博及其转发的原微博交给后台分析，不等待分析结果"""
+        items = OrderedDict()
+        for w in weibos:
+            for weibo in (w, w.get("retweet")):
+                if weibo and weibo.get("text"):
+                    items.setdefault(str(weibo["id"]), weibo["text"])
+        self.analysis_queue.submit(list(items.items()))
+
+    def save_llm_analysis(self, results):
+        """保存后台分析的结果
+
+        写入SQLite的llm_analysis表；未启用SQLite时追加到数据库目录下的llm_analysis.jsonl。
+        """
+        analyzed_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if "sqlite" in self.write_mode:
+            with self.get_sqlite_writer().batch():
+                for weibo_id, analysis in results.items():
+                    row = OrderedDict()
+                    row["weibo_id"] = weibo_id
+                    row["sentiment"] = analysis.get("sentiment")
+                    row["summary"] = analysis.get("summary")
+                    row["anomaly"] = analysis.get("anomaly")
+                    row["source"] = analysis.get("source")
+                    row["model"] = self.llm_analyzer.model_of(analysis)
+                    row["analyzed_at"] = analyzed_at
+                    self.sqlite_insert(row, "llm_analysis")
+            return
+        file_path = os.path.join(os.path.dirname(self.get_sqlte_path()), "llm_analysis.jsonl")
+        with self.write_lock:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "a", encoding="utf-8") as f:
+                for weibo_id, analysis in results.items():
+                    record = {"weibo_id": weibo_id, "model": self.llm_analyzer.model_of(analysis),
+                              "analyzed_at": analyzed_at, "llm_analysis": analysis}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def prepare_pages(self):
+        """获取用户信息并计算要爬取的页码范围，用户不可用或无需爬取时返回None"""
+        # 用户id不可用
+        if self.get_user_info() != 0:
+            return None
+        logger.info("准备搜集 {} 的微博".format(self.user["screen_name"]))
+        if const.MODE == "append" and (
+            "first_crawler" not in self.__dict__ or self.first_crawler is False
+        ):
+            # 本次运行的某用户首次抓取，用于标记最新的微博id
+            self.first_crawler = True
+            self.guess_pin = True
+        since_date = datetime.strptime(self.user_config["since_date"], DTFORMAT)
+        today = datetime.today()
+        if since_date > today:    # since_date 若为未来则无需执行
+            return None
+        page_count = self.get_page_count()
+        self.start_date = datetime.now().strftime(DTFORMAT)
+        return range(self.start_page, page_count + 1)
+
+    def take_batch(self):
+        """取出尚未写入的微博，之后self.weibo不再引用它们"""
+        batch, self.weibo = self.weibo, WeiboBatch()
+        return batch
+
+    def iter_batches(self, pages):
+        """依次爬取pages中的每一页，每爬20页交出一批待写入的微博
+
+        爬取、解析和去重都在get_one_page中完成；交出的批次由调用方写入，
+        写完即可释放，内存占用与用户的微博总数无关。
+        """
+        for page in pages:
+            is_end = self.get_one_page(page)
+            if is_end:
+                break
+            if page % 20 == 0 and self.weibo:  # 每爬20页写入一次文件
+                yield self.take_batch()
+        if self.weibo:  # 剩余不足20页的微博
+            yield self.take_batch()
 
     def get_pages(self):
-        """获取全部微博"""
-        try:
-            # 用户id不可用
-            if self.get_user_info() != 0:
-                return
-            logger.info("准备搜集 {} 的微博".format(self.user["screen_name"]))
-            if const.MODE == "append" and (
-                "first_crawler" not in self.__dict__ or self.first_crawler is False
-            ):
-                # 本次运行的某用户首次抓取，用于标记最新的微博id
-                self.first_crawler = True
-                const.CHECK_COOKIE["GUESS_PIN"] = True
-            since_date = datetime.strptime(self.user_config["since_date"], DTFORMAT)
-            today = datetime.today()
-            if since_date <= today:    # since_date 若为未来则无需执行
-                page_count = self.get_page_count()
-                wrote_count = 0
-                page1 = 0
-                random_pages = random.randint(1, 5)
-                self.start_date = datetime.now().strftime(DTFORMAT)
-                pages = range(self.start_page, page_count + 1)
-                for page in tqdm(pages, desc="Progress"):
-                    is_end = self.get_one_page(page)
-                    if is_end:
-                        break
-
-                    if page % 20 == 0:  # 每爬20页写入一次文件
-                        self.write_data(wrote_count)
-                        wrote_count = self.got_count
-
-                    # 通过加入随机等待避免被限制。爬虫速度过快容易被系统限制(一段时间后限
-                    # 制会自动解除)，加入随机等待模拟人的操作，可降低被系统限制的风险。默
-                    # 认是每爬取1到5页随机等待6到10秒，如果仍然被限，可适当增加sleep时间
-                    if (page - page1) % random_pages == 0 and page < page_count:
-                        sleep(random.randint(6, 10))
-                        page1 = page
-                        random_pages = random.randint(1, 5)
-
-                self.write_data(wrote_count)  # 将剩余不足20页的微博写入文件
-            logger.info("微博爬取完成，共爬取%d条微博", self.got_count)
-        except Exception as e:
-            logger.exception(e)
+        """获取全部微博，爬取与写入在两个线程中同时进行"""
+        with tracing.user_scope(self.user_config["user_id"]):
+            try:
+                pages = self.prepare_pages()
+                if pages is not None:
+                    writer = BatchWriter(self.write_data)
+                    try:
+                        # 爬取速度由self.throttle控制，请求正常时逐渐加快，被限制时自动放慢
+                        for batch in self.iter_batches(tqdm(pages, desc="Progress")):
+                            writer.submit(batch)
+                    finally:
+                        writer.close()
+                logger.info("微博爬取完成，共爬取%d条微博", self.got_count)
+            except Exception as e:
+                logger.exception(e)
 
     def get_user_config_list(self, file_path):
         """获取文件中的微博id信息"""
@@ -2284,14 +2357,73 @@ class Weibo(object):
 
     def initialize_info(self, user_config):
         """初始化爬虫信息"""
-        self.weibo = []
+        self.weibo = WeiboBatch()
         self.user = {}
         self.user_config = user_config
         self.got_count = 0
-        self.weibo_id_list = []
+        self.weibo_id_set = set()
+        self.seen_weibos = self.seen_ids.load(user_config["user_id"]) if self.seen_ids else {}
 
     def start(self):
-        """运行爬虫"""
+        """运行爬虫，trace_config中设置了profiler时用cProfile或采样分析器包裹整个运行"""
+        with tracing.profile(
+            self.trace_config.get("profiler"),
+            self.trace_config.get("profile_dir", os.path.join("weibo", "profile")),
+            float(self.trace_config.get("sample_interval", 0.01)),
+        ):
+            self.crawl()
+        if tracing.TRACER.enabled:
+            report = tracing.TRACER.report(int(self.trace_config.get("top_users", 20)))
+            if report:
+                logger.info("本次运行各阶段耗时：\n%s", report)
+
+    def crawl(self):
+        """爬取全部用户并等待后台任务完成"""
+        tracing.TRACER.clear()
+        start_time = time.monotonic()
+        counters = (metrics.PAGES, metrics.WEIBOS, metrics.COMMENTS, metrics.SLEEP_SECONDS)
+        start_counts = [counter.total() for counter in counters]
+        if "sqlite" in self.write_mode:
+            self.get_sqlite_writer()
+        if self.seen_ids_config.get("enabled"):
+            self.seen_ids = SeenIdStore(self.seen_ids_config.get(
+                "path", os.path.join(os.path.dirname(self.get_sqlte_path()), "seen_ids.db")
+            ))
+        if self.llm_analyzer:
+            self.analysis_queue = AnalysisQueue(
+                self.llm_analyzer, self.save_llm_analysis, self.llm_analyzer.max_workers
+            )
+        try:
+            if self.async_config and not const.CHECK_COOKIE["CHECK"]:
+                self.start_async()
+            else:
+                if self.async_config:
+                    logger.warning("检查cookie时不支持并发爬取，将逐个爬取用户")
+                self.start_serial()
+        finally:
+            if self.analysis_queue:
+                # 爬取结束后等待后台分析完成，再关闭数据库
+                logger.info("等待LLM分析完成")
+                self.analysis_queue.close()
+                self.analysis_queue = None
+                self.llm_analyzer.close()
+            self.close_sqlite_writer()
+            if self.seen_ids:
+                self.seen_ids.close()
+                self.seen_ids = None
+            metrics.RUN_SECONDS.inc(time.monotonic() - start_time)
+        logger.info("本次运行因限速共等待%d秒", self.throttle.sleep_time)
+        elapsed = max(time.monotonic() - start_time, 1e-6)
+        pages, weibos, comments, sleep_seconds = [
+            counter.total() - count for counter, count in zip(counters, start_counts)
+        ]
+        logger.info(
+            "本次运行用时%d秒（主动等待%d秒），每秒爬取%.2f页、%.2f条微博、%.2f条评论",
+            elapsed, sleep_seconds, pages / elapsed, weibos / elapsed, comments / elapsed,
+        )
+
+    def start_serial(self):
+        """逐个用户爬取"""
         try:
             for user_config in self.user_config_list:
                 if len(user_config["query_list"]):
@@ -2309,6 +2441,14 @@ class Weibo(object):
         except Exception as e:
             logger.exception(e)
 
+    def start_async(self):
+        """使用asyncio并发爬取多个用户"""
+        try:
+            crawler = AsyncCrawler(self, self.async_config.get("max_concurrent_users", 8))
+            crawler.run()
+        except Exception as e:
+            logger.exception(e)
+
 
 def handle_config_renaming(config, oldName, newName):
     if oldName in config and newName not in config: